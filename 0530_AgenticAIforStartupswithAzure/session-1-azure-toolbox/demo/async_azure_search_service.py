@@ -0,0 +1,345 @@
+"""
+Asynchronous Azure AI Search integration for the Knowledge Worker Agent
+Non-blocking counterpart of AzureSearchService built on the aio SDK clients
+"""
+import os
+import asyncio
+import logging
+from typing import List, Dict, Any, Iterable, Optional
+import aiohttp
+from azure.core.pipeline.transport import AioHttpTransport
+from azure.search.documents.aio import SearchClient
+from azure.search.documents.indexes.aio import SearchIndexClient
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError
+from openai import AsyncAzureOpenAI, BadRequestError
+from azure_search_service import DOCUMENT_FIELDS, SearchServiceBase
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class PooledAioHttpTransport(AioHttpTransport):
+    """aio transport over one size-limited aiohttp session, shared by several clients
+
+    aiohttp sessions bind to the running event loop, so the session is created
+    on the first request rather than when the transport is built. Closing any
+    client that uses the transport closes the shared session.
+    """
+
+    def __init__(self, connection_limit: int, **kwargs):
+        super().__init__(**kwargs)
+        self.connection_limit = connection_limit
+
+    async def open(self):
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.connection_limit),
+                cookie_jar=aiohttp.DummyCookieJar(),
+                auto_decompress=False,
+                trust_env=self._use_env_settings
+            )
+        await super().open()
+
+
+class AsyncAzureSearchService(SearchServiceBase):
+    """Async service for Azure AI Search operations, safe to await from FastAPI routes"""
+
+    def __init__(self, openai_client: Optional[AsyncAzureOpenAI] = None, transport=None):
+        """Initialize the async Azure Search service with configuration
+
+        Clients passed in (a shared AsyncAzureOpenAI and aio transport) are
+        owned by the caller and are not closed by close().
+        """
+        super().__init__()
+        self._load_azure_credentials()
+
+        # Initialize aio clients
+        transport_options = {"transport": transport} if transport is not None else {}
+        self.search_client = SearchClient(
+            endpoint=self.search_endpoint,
+            index_name=self.index_name,
+            credential=self.credential,
+            **transport_options
+        )
+        self.index_client = SearchIndexClient(
+            endpoint=self.search_endpoint,
+            credential=self.credential,
+            **transport_options
+        )
+
+        # Initialize async OpenAI client for embeddings
+        self._owns_openai_client = openai_client is None
+        self.openai_client = openai_client or AsyncAzureOpenAI(
+            api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+            api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-06-01"),
+            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
+        )
+
+    async def create_search_index(self) -> bool:
+        """Create the search index with vector search capabilities"""
+        try:
+            try:
+                existing_index = await self.index_client.get_index(self.index_name)
+                existing_fields = {field.name for field in existing_index.fields}
+                if {"parent_id", "chunk_index"} <= existing_fields:
+                    logger.info(f"Search index '{self.index_name}' already exists")
+                    return True
+                logger.info(f"Search index '{self.index_name}' is missing chunk fields, updating...")
+            except Exception:
+                logger.info(f"Search index '{self.index_name}' does not exist, creating...")
+
+            await self.index_client.create_or_update_index(self._build_index_definition())
+            logger.info(f"Search index '{self.index_name}' created successfully")
+            return True
+        except Exception as e:
+            logger.error(f"Error creating search index: {str(e)}")
+            return False
+
+    async def _embed_sub_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embed one sub-batch, retrying transient failures and bisecting rejected inputs"""
+        for attempt in range(self.embedding_max_retries + 1):
+            try:
+                response = await self.openai_client.embeddings.create(
+                    input=texts,
+                    model=self.embedding_deployment,
+                    **self.embedding_request_options
+                )
+            except BadRequestError as e:
+                if len(texts) == 1:
+                    logger.error(f"Embedding request rejected: {str(e)}")
+                    return [[]]
+                middle = len(texts) // 2
+                logger.warning(f"Embedding batch of {len(texts)} rejected, splitting to isolate bad input")
+                first, second = await asyncio.gather(
+                    self._embed_sub_batch(texts[:middle]),
+                    self._embed_sub_batch(texts[middle:])
+                )
+                return first + second
+            except Exception as e:
+                if attempt >= self.embedding_max_retries:
+                    logger.error(f"Embedding batch of {len(texts)} failed after {attempt + 1} attempts: {str(e)}")
+                    return [[] for _ in texts]
+                delay = 2 ** attempt
+                logger.warning(f"Embedding batch of {len(texts)} failed ({str(e)}), retrying in {delay}s")
+                await asyncio.sleep(delay)
+                continue
+            return self._aligned_embeddings(texts, response)
+        return [[] for _ in texts]
+
+    async def generate_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+        """Generate embeddings for many texts, sending sub-batches concurrently
+
+        Results are returned in input order; failed or empty inputs get an empty list.
+        """
+        results, prepared, positions = self._prepare_embedding_inputs(texts)
+        if not prepared:
+            return results
+
+        missing, cache_keys = self._apply_cached_embeddings(prepared, positions, results)
+
+        if missing:
+            to_embed = [prepared[i] for i in missing]
+            batches = self._plan_embedding_batches(to_embed)
+            logger.info(f"Generating embeddings for {len(to_embed)} texts in {len(batches)} requests "
+                        f"({len(prepared) - len(to_embed)} served from cache)")
+
+            semaphore = asyncio.Semaphore(self.upload_max_concurrency)
+
+            async def embed(batch):
+                async with semaphore:
+                    return await self._embed_sub_batch([to_embed[i] for i in batch])
+
+            new_vectors = {}
+            for batch, embeddings in zip(batches, await asyncio.gather(*(embed(batch) for batch in batches))):
+                for i, embedding in zip(batch, embeddings):
+                    results[positions[missing[i]]] = embedding
+                    if embedding and cache_keys:
+                        new_vectors[cache_keys[missing[i]]] = embedding
+
+            if new_vectors:
+                self.embedding_cache.put_many(new_vectors)
+
+        self._log_embedding_failures(results, positions)
+        return results
+
+    async def generate_embeddings(self, text: str) -> List[float]:
+        """Generate embeddings using Azure OpenAI"""
+        try:
+            return (await self.generate_embeddings_batch([text]))[0]
+        except Exception as e:
+            logger.error(f"Error generating embeddings: {str(e)}")
+            return []
+
+    async def _upload_batch(self, search_documents: List[Dict[str, Any]], attempt: int = 0) -> List[Dict[str, Any]]:
+        """Upload one batch with merge_or_upload semantics and return per-document results"""
+        try:
+            indexing_results = await self.search_client.merge_or_upload_documents(search_documents)
+        except HttpResponseError as e:
+            if e.status_code == 413 and len(search_documents) > 1:
+                middle = len(search_documents) // 2
+                logger.warning(f"Upload batch of {len(search_documents)} too large, splitting")
+                return (await self._upload_batch(search_documents[:middle], attempt) +
+                        await self._upload_batch(search_documents[middle:], attempt))
+            if e.status_code in (429, 503) and attempt < self.upload_max_retries:
+                delay = 2 ** attempt
+                logger.warning(f"Search service throttled upload ({e.status_code}), retrying in {delay}s")
+                await asyncio.sleep(delay)
+                return await self._upload_batch(search_documents, attempt + 1)
+            logger.error(f"Upload batch of {len(search_documents)} failed: {str(e)}")
+            return self._failed_results(search_documents, str(e), e.status_code)
+        except Exception as e:
+            logger.error(f"Upload batch of {len(search_documents)} failed: {str(e)}")
+            return self._failed_results(search_documents, str(e))
+
+        results = self._map_indexing_results(indexing_results)
+        retryable = self._retryable_documents(search_documents, results)
+        if retryable and attempt < self.upload_max_retries:
+            delay = 2 ** attempt
+            logger.warning(f"{len(retryable)}/{len(search_documents)} documents failed transiently, retrying in {delay}s")
+            await asyncio.sleep(delay)
+            for result in await self._upload_batch(retryable, attempt + 1):
+                results[result["id"]] = result
+
+        return self._ordered_results(search_documents, results)
+
+    async def index_documents(self, documents: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Bulk index documents, returning one result per input document in input order"""
+        results: List[Dict[str, Any]] = []
+        positions: Dict[str, List[int]] = {}
+        semaphore = asyncio.Semaphore(self.upload_max_concurrency)
+
+        async def upload(batch):
+            async with semaphore:
+                return await self._upload_batch(batch)
+
+        for window in self._windows(documents, self.upload_batch_size):
+            valid = self._validate_window(window, results)
+            pending = [(position, doc) for position, doc in valid if not doc.get("content_vector")]
+            embeddings = await self.generate_embeddings_batch([doc["content"] for _, doc in pending])
+            search_documents = self._build_window_documents(valid, pending, embeddings, results, positions)
+
+            batches = self._plan_upload_batches(search_documents)
+            for batch_results in await asyncio.gather(*(upload(batch) for batch in batches)):
+                for result in batch_results:
+                    for position in positions.get(result["id"], []):
+                        results[position] = result
+
+        self._invalidate_query_cache()
+        succeeded = sum(1 for result in results if result["success"])
+        logger.info(f"Indexed {succeeded}/{len(results)} documents")
+        return results
+
+    async def index_document(self, document: Dict[str, Any]) -> bool:
+        """Index a single document, returning True or an error message for the API response"""
+        try:
+            result = (await self.index_documents([document]))[0]
+            if result["success"]:
+                logger.info(f"Document '{document.get('id')}' indexed successfully")
+                return True
+            logger.error(f"Failed to index document '{document.get('id')}': {result['error']}")
+            return result["error"] or False
+        except Exception as e:
+            logger.error(f"Error indexing document '{document.get('id', 'unknown')}': {str(e)}")
+            return str(e)
+
+    async def search_documents(self, query: str, top: int = 5, use_semantic_search: bool = True,
+                               filters: Optional[str] = None, use_cache: bool = True) -> List[Dict[str, Any]]:
+        """Perform hybrid search (vector + keyword) with optional semantic ranking"""
+        try:
+            cached, cache_key, generation = self._lookup_cached_search(query, top, use_semantic_search, filters, use_cache)
+            if cached is not None:
+                logger.info(f"Serving {len(cached)} cached results for query: {query}")
+                return cached
+
+            query_embedding = await self.generate_embeddings(query)
+
+            results = await self.search_client.search(**self._build_search_kwargs(query, query_embedding, top, use_semantic_search, filters))
+            formatted_results = [self._format_search_result(result) async for result in results]
+
+            collapsed_results = self._collapse_chunk_results(formatted_results, top)
+            logger.info(f"Found {len(collapsed_results)} documents ({len(formatted_results)} chunks) for query: {query}")
+            self._store_cached_search(cache_key, generation, collapsed_results)
+            return collapsed_results
+        except Exception as e:
+            logger.error(f"Error searching documents: {str(e)}")
+            return []
+
+    async def get_document(self, document_id: str) -> Optional[Dict[str, Any]]:
+        """Fetch a document by key (reassembling its chunks), without embedding or ranking"""
+        try:
+            results = await self.search_client.search(
+                search_text="*",
+                filter=self._chunk_filter(document_id),
+                select=DOCUMENT_FIELDS,
+                order_by=["chunk_index asc"]
+            )
+            entries = [result async for result in results]
+            if not entries:
+                try:
+                    entries = [await self.search_client.get_document(key=document_id, selected_fields=DOCUMENT_FIELDS)]
+                except ResourceNotFoundError:
+                    return None
+            return self._assemble_document(document_id, entries)
+        except Exception as e:
+            logger.error(f"Error getting document '{document_id}': {str(e)}")
+            return None
+
+    async def document_exists(self, document_id: str) -> bool:
+        """Check whether a document (or any of its chunks) is in the index (assumed so if unreachable)"""
+        try:
+            results = await self.search_client.search(
+                search_text="*",
+                filter=self._chunk_filter(document_id),
+                select=["id"],
+                top=1
+            )
+            async for _ in results:
+                return True
+            await self.search_client.get_document(key=document_id, selected_fields=["id"])
+            return True
+        except ResourceNotFoundError:
+            return False
+        except Exception as e:
+            logger.error(f"Error checking document '{document_id}': {str(e)}")
+            return True
+
+    async def _find_chunk_ids(self, document_id: str) -> List[str]:
+        """Find the keys of all chunks belonging to a parent document"""
+        results = await self.search_client.search(
+            search_text="*",
+            filter=self._chunk_filter(document_id),
+            select=["id"]
+        )
+        return [result["id"] async for result in results]
+
+    async def delete_document(self, document_id: str) -> bool:
+        """Delete a document (and all of its chunks) from the search index"""
+        try:
+            keys = set(await self._find_chunk_ids(document_id))
+            keys.add(document_id)
+            await self.search_client.delete_documents([{"id": key} for key in keys])
+            self._invalidate_query_cache()
+            logger.info(f"Document '{document_id}' deleted successfully ({len(keys)} index entries)")
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting document: {str(e)}")
+            return False
+
+    async def get_index_statistics(self) -> Dict[str, Any]:
+        """Get statistics about the search index"""
+        try:
+            stats = await self.index_client.get_index_statistics(self.index_name)
+            return {
+                "document_count": stats.document_count,
+                "storage_size": stats.storage_size
+            }
+        except Exception as e:
+            logger.error(f"Error getting index statistics: {str(e)}")
+            return {}
+
+    async def close(self) -> None:
+        """Close the underlying aio transports"""
+        await self.search_client.close()
+        await self.index_client.close()
+        if self._owns_openai_client:
+            await self.openai_client.close()
@@ -3,8 +3,10 @@ Azure AI Search integration for the Knowledge Worker Agent
 Handles document indexing and vector search capabilities
 """
 import os
+import time
 import logging
-from typing import List, Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict, Any, Optional, Iterable
 from azure.search.documents import SearchClient
 from azure.search.documents.indexes import SearchIndexClient
 from azure.search.documents.models import VectorizedQuery
@@ -23,43 +25,612 @@ from azure.search.documents.indexes.models import (
     SemanticField
 )
 from azure.core.credentials import AzureKeyCredential
-from openai import AzureOpenAI
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError
+from openai import AzureOpenAI, BadRequestError
+from embedding_cache import EmbeddingCache, get_embedding_cache
+from query_cache import get_query_cache
+from tokenization import count_tokens, encoding_name_for, truncate_to_tokens
 import json
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class AzureSearchService:
-    """Service for managing Azure AI Search operations"""
+# Fields returned for search hits and document lookups
+DOCUMENT_FIELDS = ["id", "parent_id", "chunk_index", "title", "content", "source", "category", "metadata"]
+
+# Chunk-specific metadata dropped when chunks are reassembled into their document
+_CHUNK_METADATA_KEYS = {"chunk_count", "start_char", "token_count", "page_start", "page_end"}
+
+class SearchServiceBase:
+    """Configuration, embedding and backend-independent helpers shared by the search services
+
+    Subclasses provide ``self.openai_client`` (or an object with the same
+    ``embeddings.create`` interface) for the embedding methods.
+    """
     
     def __init__(self):
-        """Initialize the Azure Search service with configuration"""
+        """Load search, embedding and batching configuration"""
+        self.index_name = os.getenv("AZURE_SEARCH_INDEX_NAME", "knowledge-base")
+        self.embedding_deployment = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT", "text-embedding-3-large")
+        self.embedding_dimensions = int(os.getenv("AZURE_OPENAI_EMBEDDING_DIMENSIONS", "3072"))
+        
+        # Batching limits for multi-input embedding requests
+        self.embedding_batch_size = int(os.getenv("AZURE_OPENAI_EMBEDDING_BATCH_SIZE", "128"))
+        self.embedding_batch_max_tokens = int(os.getenv("AZURE_OPENAI_EMBEDDING_BATCH_MAX_TOKENS", "64000"))
+        self.embedding_max_retries = int(os.getenv("AZURE_OPENAI_EMBEDDING_MAX_RETRIES", "3"))
+        
+        # Per-input token limit of the embedding model (8191 for text-embedding-3-* and ada-002)
+        self.embedding_max_tokens = int(os.getenv("AZURE_OPENAI_EMBEDDING_MAX_TOKENS", "8191"))
+        self.embedding_encoding = encoding_name_for(self.embedding_deployment)
+        
+        # text-embedding-3-* return vectors of the requested size; ada-002 only has its native 1536
+        send_dimensions = os.getenv("AZURE_OPENAI_EMBEDDING_SEND_DIMENSIONS", "auto").lower()
+        if send_dimensions == "auto":
+            send_dimensions = "false" if "ada" in self.embedding_deployment.lower() else "true"
+        self.embedding_request_options = {"dimensions": self.embedding_dimensions} if send_dimensions == "true" else {}
+        
+        # Bulk upload limits (the service accepts at most 1000 documents / 16 MB per request)
+        self.upload_batch_size = int(os.getenv("AZURE_SEARCH_UPLOAD_BATCH_SIZE", "500"))
+        self.upload_batch_max_bytes = int(os.getenv("AZURE_SEARCH_UPLOAD_BATCH_MAX_BYTES", str(8 * 1024 * 1024)))
+        self.upload_max_concurrency = int(os.getenv("AZURE_SEARCH_UPLOAD_MAX_CONCURRENCY", "4"))
+        self.upload_max_retries = int(os.getenv("AZURE_SEARCH_UPLOAD_MAX_RETRIES", "3"))
+        
+        # How many chunk hits to fetch per requested document before collapsing
+        self.chunk_search_oversample = int(os.getenv("CHUNK_SEARCH_OVERSAMPLE", "3"))
+        
+        # Persistent embedding cache so unchanged text is not embedded twice
+        self.embedding_cache = None
+        if os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true":
+            try:
+                self.embedding_cache = get_embedding_cache(
+                    cache_dir=os.getenv("EMBEDDING_CACHE_DIR", ".cache/embeddings"),
+                    dimensions=self.embedding_dimensions,
+                    max_entries=int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "50000")),
+                    dtype=os.getenv("EMBEDDING_CACHE_DTYPE", "float16")
+                )
+            except Exception as e:
+                logger.warning(f"Embedding cache disabled: {str(e)}")
+        
+        # In-memory search result cache, cleared whenever this process writes to the index
+        self.query_cache = None
+        if os.getenv("QUERY_CACHE_ENABLED", "true").lower() == "true":
+            self.query_cache = get_query_cache(
+                index_name=self.index_name,
+                max_entries=int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "1000")),
+                ttl_seconds=float(os.getenv("QUERY_CACHE_TTL_SECONDS", "300"))
+            )
+    
+    def _load_azure_credentials(self) -> None:
+        """Read the Azure AI Search endpoint and key, failing fast if they are missing"""
         self.search_endpoint = os.getenv("AZURE_SEARCH_ENDPOINT")
         self.search_key = os.getenv("AZURE_SEARCH_API_KEY")
-        self.index_name = os.getenv("AZURE_SEARCH_INDEX_NAME", "knowledge-base")
         
         if not all([self.search_endpoint, self.search_key]):
             raise ValueError("Azure Search configuration is missing")
         
-        # Initialize clients
         self.credential = AzureKeyCredential(self.search_key)
+    
+    def _build_index_definition(self) -> SearchIndex:
+        """Build the search index schema with vector and semantic search configuration"""
+        # Define the search index schema
+        fields = [
+            SimpleField(name="id", type=SearchFieldDataType.String, key=True),
+            SimpleField(name="parent_id", type=SearchFieldDataType.String, filterable=True),
+            SimpleField(name="chunk_index", type=SearchFieldDataType.Int32, filterable=True, sortable=True),
+            SearchableField(name="title", type=SearchFieldDataType.String),
+            SearchableField(name="content", type=SearchFieldDataType.String),
+            SearchField(name="content_vector", type=SearchFieldDataType.Collection(SearchFieldDataType.Single),
+                       searchable=True, vector_search_dimensions=self.embedding_dimensions, vector_search_profile_name="default"),
+            SimpleField(name="source", type=SearchFieldDataType.String, filterable=True, facetable=True),
+            SimpleField(name="category", type=SearchFieldDataType.String, filterable=True, facetable=True),
+            SimpleField(name="created_date", type=SearchFieldDataType.DateTimeOffset, filterable=True, sortable=True),
+            SearchableField(name="metadata", type=SearchFieldDataType.String)
+        ]
+        
+        # Configure vector search
+        vector_search = VectorSearch(
+            algorithms=[
+                HnswAlgorithmConfiguration(name="default")
+            ],
+            profiles=[
+                VectorSearchProfile(
+                    name="default",
+                    algorithm_configuration_name="default"
+                )
+            ]
+        )
+        
+        # Configure semantic search
+        semantic_config = SemanticConfiguration(
+            name="default",
+            prioritized_fields=SemanticPrioritizedFields(
+                title_field=SemanticField(field_name="title"),
+                content_fields=[SemanticField(field_name="content")]
+            )
+        )
+        
+        semantic_search = SemanticSearch(configurations=[semantic_config])
+        
+        index = SearchIndex(
+            name=self.index_name,
+            fields=fields,
+            vector_search=vector_search,
+            semantic_search=semantic_search
+        )
+        return index
+    
+    def _prepare_embedding_text(self, text: str) -> Optional[str]:
+        """Validate and truncate text before sending it to the embedding model"""
+        if not text or len(text.strip()) == 0:
+            logger.error("Cannot generate embeddings for empty text")
+            return None
+        
+        # Truncate to the model's input limit, counted with the model's own tokenizer
+        truncated = truncate_to_tokens(text, self.embedding_max_tokens, self.embedding_encoding)
+        if len(truncated) < len(text):
+            logger.warning(f"Text too long ({len(text)} chars), truncating to {self.embedding_max_tokens} tokens")
+        return truncated
+    
+    def _aligned_embeddings(self, texts: List[str], response) -> List[List[float]]:
+        """Order an embeddings response by input, failing if its vectors do not fit the index"""
+        # The service may return items out of order; align them by index
+        embeddings = [[] for _ in texts]
+        for item in response.data:
+            embeddings[item.index] = item.embedding
+        for embedding in embeddings:
+            if embedding and len(embedding) != self.embedding_dimensions:
+                raise ValueError(
+                    f"Embedding deployment '{self.embedding_deployment}' returned {len(embedding)} dimensions but "
+                    f"the index expects {self.embedding_dimensions}; set AZURE_OPENAI_EMBEDDING_DIMENSIONS to match"
+                )
+        return embeddings
+    
+    def _estimate_tokens(self, text: str) -> int:
+        """Token count used for request packing"""
+        return count_tokens(text, self.embedding_encoding)
+    
+    def _plan_embedding_batches(self, texts: List[str]) -> List[List[int]]:
+        """Group input positions into sub-batches bounded by input count and token budget"""
+        batches = []
+        current = []
+        current_tokens = 0
+        for position, text in enumerate(texts):
+            tokens = self._estimate_tokens(text)
+            if current and (len(current) >= self.embedding_batch_size or
+                            current_tokens + tokens > self.embedding_batch_max_tokens):
+                batches.append(current)
+                current = []
+                current_tokens = 0
+            current.append(position)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+    
+    def _prepare_embedding_inputs(self, texts: List[str]):
+        """Validate inputs, returning (empty results, prepared texts, their input positions)"""
+        results: List[List[float]] = [[] for _ in texts]
+        prepared = []
+        positions = []
+        for position, text in enumerate(texts):
+            prepared_text = self._prepare_embedding_text(text)
+            if prepared_text is not None:
+                prepared.append(prepared_text)
+                positions.append(position)
+        return results, prepared, positions
+    
+    def _apply_cached_embeddings(self, prepared: List[str], positions: List[int], results: List[List[float]]):
+        """Fill results from the embedding cache, returning (missing indexes, cache keys)"""
+        if self.embedding_cache is None:
+            return list(range(len(prepared))), []
+        
+        cache_keys = [
+            EmbeddingCache.make_key(text, self.embedding_deployment, self.embedding_dimensions)
+            for text in prepared
+        ]
+        missing = []
+        for i, vector in enumerate(self.embedding_cache.get_many(cache_keys)):
+            if vector is not None:
+                results[positions[i]] = vector
+            else:
+                missing.append(i)
+        return missing, cache_keys
+    
+    def _log_embedding_failures(self, results: List[List[float]], positions: List[int]) -> None:
+        """Log how many prepared inputs ended up without an embedding"""
+        failed = sum(1 for position in positions if not results[position])
+        if failed:
+            logger.error(f"Failed to generate embeddings for {failed}/{len(positions)} texts "
+                         f"(model: {self.embedding_deployment})")
+    
+    @staticmethod
+    def _validate_document(document: Dict[str, Any]) -> Optional[str]:
+        """Return an error message if the document cannot be indexed"""
+        for field in ["id", "content"]:
+            if not document.get(field):
+                return f"Missing required field '{field}' in document"
+        if len(document["content"].strip()) == 0:
+            return "Document content is empty"
+        return None
+    
+    @staticmethod
+    def _build_search_document(document: Dict[str, Any], content_embedding: List[float]) -> Dict[str, Any]:
+        """Map a processed document onto the search index schema"""
+        return {
+            "id": document.get("id"),
+            "parent_id": document.get("parent_id") or document.get("id"),
+            "chunk_index": document.get("chunk_index", 0),
+            "title": document.get("title", ""),
+            "content": document.get("content", ""),
+            "content_vector": content_embedding,
+            "source": document.get("source", ""),
+            "category": document.get("category", "general"),
+            "created_date": document.get("created_date"),
+            "metadata": json.dumps(document.get("metadata", {}))
+        }
+    
+    @staticmethod
+    def _map_indexing_results(indexing_results) -> Dict[str, Dict[str, Any]]:
+        """Convert SDK IndexingResult objects into per-key result dicts"""
+        return {
+            result.key: {
+                "id": result.key,
+                "success": result.succeeded,
+                "status_code": result.status_code,
+                "error": result.error_message
+            }
+            for result in indexing_results
+        }
+    
+    @staticmethod
+    def _retryable_documents(search_documents: List[Dict[str, Any]], results: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Documents that failed with a transient status (409/422/503) and can be re-sent"""
+        return [
+            doc for doc in search_documents
+            if not results.get(doc["id"], {}).get("success") and results.get(doc["id"], {}).get("status_code") in (409, 422, 503)
+        ]
+    
+    @staticmethod
+    def _failed_results(search_documents: List[Dict[str, Any]], error: str, status_code: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Build failure results for every document in a batch"""
+        return [
+            {"id": doc["id"], "success": False, "status_code": status_code, "error": error}
+            for doc in search_documents
+        ]
+    
+    @staticmethod
+    def _ordered_results(search_documents: List[Dict[str, Any]], results: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Return results aligned with the batch order"""
+        return [
+            results.get(doc["id"], {"id": doc["id"], "success": False, "status_code": None, "error": "No result returned"})
+            for doc in search_documents
+        ]
+    
+    def _validate_window(self, window: List[Dict[str, Any]], results: List[Dict[str, Any]]) -> List[tuple]:
+        """Append a pending result per document and return (position, document) pairs that are valid"""
+        valid = []
+        for document in window:
+            position = len(results)
+            error = self._validate_document(document)
+            results.append({"id": document.get("id"), "success": False, "status_code": None, "error": error})
+            if error is None:
+                valid.append((position, document))
+            else:
+                logger.error(f"Cannot index document '{document.get('id', 'unknown')}': {error}")
+        return valid
+    
+    def _build_window_documents(self, valid: List[tuple], pending: List[tuple], embeddings: List[List[float]],
+                                results: List[Dict[str, Any]], positions: Dict[str, List[int]]) -> List[Dict[str, Any]]:
+        """Attach embeddings and map a window of valid documents onto the index schema"""
+        vectors = {position: embedding for (position, _), embedding in zip(pending, embeddings)}
+        search_documents = []
+        for position, document in valid:
+            content_embedding = document.get("content_vector") or vectors.get(position)
+            if not content_embedding:
+                results[position]["error"] = "Failed to generate embeddings for document content"
+                continue
+            positions.setdefault(document["id"], []).append(position)
+            search_documents.append(self._build_search_document(document, content_embedding))
+        return search_documents
+    
+    @staticmethod
+    def _windows(documents: Iterable[Dict[str, Any]], size: int):
+        """Consume an iterable in lists of at most size items"""
+        window = []
+        for document in documents:
+            window.append(document)
+            if len(window) >= size:
+                yield window
+                window = []
+        if window:
+            yield window
+    
+    def _plan_upload_batches(self, search_documents: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """Group search documents into batches bounded by count and payload bytes"""
+        batches = []
+        current = []
+        current_bytes = 0
+        for doc in search_documents:
+            size = len(json.dumps(doc))
+            if current and (len(current) >= self.upload_batch_size or current_bytes + size > self.upload_batch_max_bytes):
+                batches.append(current)
+                current = []
+                current_bytes = 0
+            current.append(doc)
+            current_bytes += size
+        if current:
+            batches.append(current)
+        return batches
+    
+    @staticmethod
+    def _collapse_chunk_results(results: List[Dict[str, Any]], top: int) -> List[Dict[str, Any]]:
+        """Group chunk hits by parent document, keeping the parent's best rank
+        
+        The returned content holds only the matching chunks (in document order),
+        so callers get full-document recall without the full document text.
+        """
+        parents: Dict[str, Dict[str, Any]] = {}
+        for result in results:
+            parent_id = result.get("parent_id") or result.get("id")
+            if parent_id not in parents:
+                if len(parents) >= top:
+                    continue
+                parents[parent_id] = {**result, "id": parent_id, "chunks": []}
+            parents[parent_id]["chunks"].append(result)
+        
+        collapsed = []
+        for parent in parents.values():
+            chunks = sorted(parent.pop("chunks"), key=lambda chunk: chunk.get("chunk_index") or 0)
+            parent["content"] = "\n...\n".join(chunk.get("content") or "" for chunk in chunks)
+            parent["matched_chunks"] = [chunk.get("chunk_index") or 0 for chunk in chunks]
+            parent["captions"] = [caption for chunk in chunks for caption in chunk.get("captions", [])]
+            if not parent["captions"]:
+                parent.pop("captions")
+            parent.pop("parent_id", None)
+            parent.pop("chunk_index", None)
+            collapsed.append(parent)
+        return collapsed
+    
+    def _build_search_kwargs(self, query: str, query_embedding: List[float], top: int, use_semantic_search: bool,
+                             filters: Optional[str] = None) -> Dict[str, Any]:
+        """Build the hybrid (keyword + vector) query, oversampling chunks before collapsing"""
+        # Oversample chunks so several chunks of one document do not crowd out others
+        chunk_top = top * self.chunk_search_oversample
+        
+        # Create vector query
+        vector_query = VectorizedQuery(
+            vector=query_embedding,
+            k_nearest_neighbors=chunk_top,
+            fields="content_vector"
+        )
+        
+        search_kwargs = {
+            "search_text": query,
+            "vector_queries": [vector_query],
+            "top": chunk_top,
+            "select": DOCUMENT_FIELDS
+        }
+        
+        if filters:
+            search_kwargs["filter"] = filters
+        
+        if use_semantic_search:
+            search_kwargs.update({
+                "query_type": "semantic",
+                "semantic_configuration_name": "default",
+                "query_caption": "extractive",
+                "query_answer": "extractive"
+            })
+        return search_kwargs
+    
+    @staticmethod
+    def _format_search_result(result: Dict[str, Any]) -> Dict[str, Any]:
+        """Convert a raw search hit into the result dict returned to callers"""
+        formatted_result = {
+            "id": result.get("id"),
+            "parent_id": result.get("parent_id"),
+            "chunk_index": result.get("chunk_index"),
+            "title": result.get("title"),
+            "content": result.get("content"),
+            "source": result.get("source"),
+            "category": result.get("category"),
+            "metadata": json.loads(result.get("metadata", "{}")),
+            "score": result.get("@search.score", 0),
+            "reranker_score": result.get("@search.reranker_score")
+        }
+        
+        # Add semantic captions and answers if available
+        if result.get("@search.captions"):
+            formatted_result["captions"] = [caption.text for caption in result['@search.captions']]
+        return formatted_result
+    
+    @staticmethod
+    def _stitch_chunks(chunks: List[Dict[str, Any]]) -> str:
+        """Rebuild document text from ordered chunks, removing the overlap between neighbours
+        
+        start_char offsets give the approximate overlap; it is confirmed against the
+        text (chunk content is whitespace-stripped, so the estimate can be a few
+        characters off) and chunks that do not line up are joined with a newline.
+        """
+        text = ""
+        previous_end = None
+        for chunk in chunks:
+            content = chunk.get("content") or ""
+            start = chunk["metadata"].get("start_char")
+            overlap = 0
+            if text and previous_end is not None and start is not None and previous_end - start > 8:
+                estimate = previous_end - start
+                for length in range(min(estimate + 8, len(content)), estimate - 8, -1):
+                    if text.endswith(content[:length]):
+                        overlap = length
+                        break
+            if text and not overlap:
+                text += "\n"
+            text += content[overlap:]
+            previous_end = start + len(content) if start is not None else None
+        return text
+    
+    def _assemble_document(self, document_id: str, entries: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Combine a document's index entries (its chunks, or one unchunked entry) into one document"""
+        chunks = sorted(
+            ({**entry, "metadata": json.loads(entry.get("metadata") or "{}")} for entry in entries),
+            key=lambda chunk: chunk.get("chunk_index") or 0
+        )
+        first = chunks[0]
+        return {
+            "id": document_id,
+            "title": first.get("title"),
+            "content": self._stitch_chunks(chunks),
+            "source": first.get("source"),
+            "category": first.get("category"),
+            "metadata": {key: value for key, value in first["metadata"].items() if key not in _CHUNK_METADATA_KEYS},
+            "chunk_count": len(chunks)
+        }
+    
+    @staticmethod
+    def _chunk_filter(document_id: str) -> str:
+        """OData filter matching every chunk of a parent document"""
+        escaped_id = document_id.replace("'", "''")
+        return f"parent_id eq '{escaped_id}'"
+    
+    def _embed_sub_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embed one sub-batch, retrying transient failures and bisecting rejected inputs"""
+        for attempt in range(self.embedding_max_retries + 1):
+            try:
+                response = self.openai_client.embeddings.create(
+                    input=texts,
+                    model=self.embedding_deployment,
+                    **self.embedding_request_options
+                )
+            except BadRequestError as e:
+                # A single bad input rejects the whole request; split to isolate it
+                if len(texts) == 1:
+                    logger.error(f"Embedding request rejected: {str(e)}")
+                    return [[]]
+                middle = len(texts) // 2
+                logger.warning(f"Embedding batch of {len(texts)} rejected, splitting to isolate bad input")
+                return self._embed_sub_batch(texts[:middle]) + self._embed_sub_batch(texts[middle:])
+            except Exception as e:
+                if attempt >= self.embedding_max_retries:
+                    logger.error(f"Embedding batch of {len(texts)} failed after {attempt + 1} attempts: {str(e)}")
+                    return [[] for _ in texts]
+                delay = 2 ** attempt
+                logger.warning(f"Embedding batch of {len(texts)} failed ({str(e)}), retrying in {delay}s")
+                time.sleep(delay)
+                continue
+            # A dimension mismatch is a configuration error, so it is raised rather than retried
+            return self._aligned_embeddings(texts, response)
+        return [[] for _ in texts]
+    
+    def generate_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+        """Generate embeddings for many texts using multi-input requests
+        
+        Results are returned in input order. Inputs that are empty or whose
+        sub-batch ultimately fails get an empty list, mirroring generate_embeddings.
+        """
+        results, prepared, positions = self._prepare_embedding_inputs(texts)
+        if not prepared:
+            return results
+        
+        # Serve what we can from the embedding cache and only embed the misses
+        missing, cache_keys = self._apply_cached_embeddings(prepared, positions, results)
+        
+        if missing:
+            to_embed = [prepared[i] for i in missing]
+            batches = self._plan_embedding_batches(to_embed)
+            logger.info(f"Generating embeddings for {len(to_embed)} texts in {len(batches)} requests "
+                        f"({len(prepared) - len(to_embed)} served from cache)")
+            new_vectors = {}
+            for batch in batches:
+                embeddings = self._embed_sub_batch([to_embed[i] for i in batch])
+                for i, embedding in zip(batch, embeddings):
+                    results[positions[missing[i]]] = embedding
+                    if embedding and cache_keys:
+                        new_vectors[cache_keys[missing[i]]] = embedding
+            
+            if new_vectors:
+                self.embedding_cache.put_many(new_vectors)
+        
+        self._log_embedding_failures(results, positions)
+        return results
+    
+    def generate_embeddings(self, text: str) -> List[float]:
+        """Generate embeddings using Azure OpenAI"""
+        try:
+            return self.generate_embeddings_batch([text])[0]
+        except Exception as e:
+            logger.error(f"Error generating embeddings: {str(e)}")
+            logger.error(f"Text length: {len(text) if text else 0}")
+            logger.error(f"Model: {self.embedding_deployment}")
+            import traceback
+            logger.error(f"Traceback: {traceback.format_exc()}")
+            return []
+    
+    def _lookup_cached_search(self, query: str, top: int, use_semantic_search: bool, filters: Optional[str],
+                              use_cache: bool):
+        """Return (cached results or None, cache key, index generation) for a search"""
+        if self.query_cache is None:
+            return None, None, None
+        key = self.query_cache.make_key(query, top, use_semantic_search, filters)
+        generation = self.query_cache.generation
+        # A bypassing caller still refreshes the entry with its fresh result
+        cached = self.query_cache.get(key) if use_cache else None
+        return cached, key, generation
+    
+    def _store_cached_search(self, key, generation: Optional[int], results: List[Dict[str, Any]]) -> None:
+        if self.query_cache is not None and key is not None:
+            self.query_cache.put(key, results, generation)
+    
+    def _invalidate_query_cache(self) -> None:
+        """Drop cached search results after the index changed"""
+        if self.query_cache is not None:
+            self.query_cache.invalidate()
+    
+    def get_query_cache_statistics(self) -> Dict[str, Any]:
+        """Get hit/miss counters for the search result cache"""
+        if self.query_cache is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.query_cache.get_statistics()}
+    
+    def get_embedding_cache_statistics(self) -> Dict[str, Any]:
+        """Get hit/miss counters for the embedding cache"""
+        if self.embedding_cache is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.embedding_cache.get_statistics()}
+    
+class AzureSearchService(SearchServiceBase):
+    """Service for managing Azure AI Search operations"""
+    
+    def __init__(self, openai_client: Optional[AzureOpenAI] = None, transport=None):
+        """Initialize the Azure Search service with configuration
+        
+        openai_client and transport (an azure.core HTTP transport) let callers
+        share one embedding client and one connection pool between services.
+        """
+        super().__init__()
+        self._load_azure_credentials()
+        
+        # Initialize clients
+        transport_options = {"transport": transport} if transport is not None else {}
         self.search_client = SearchClient(
             endpoint=self.search_endpoint,
             index_name=self.index_name,
-            credential=self.credential
+            credential=self.credential,
+            **transport_options
         )
         self.index_client = SearchIndexClient(
             endpoint=self.search_endpoint,
-            credential=self.credential
+            credential=self.credential,
+            **transport_options
         )
         
         # Initialize OpenAI client for embeddings
-        self.openai_client = AzureOpenAI(
+        self.openai_client = openai_client or AzureOpenAI(
             api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-            api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-06-01"),            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
+            api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-06-01"),
+            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
         )
-        self.embedding_deployment = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT", "text-embedding-3-large")
     
     def create_search_index(self) -> bool:
         """Create the search index with vector search capabilities"""
@@ -67,56 +638,16 @@ class AzureSearchService:
             # Check if index already exists
             try:
                 existing_index = self.index_client.get_index(self.index_name)
-                logger.info(f"Search index '{self.index_name}' already exists")
-                return True
+                existing_fields = {field.name for field in existing_index.fields}
+                if {"parent_id", "chunk_index"} <= existing_fields:
+                    logger.info(f"Search index '{self.index_name}' already exists")
+                    return True
+                # Adding fields is an allowed in-place index update
+                logger.info(f"Search index '{self.index_name}' is missing chunk fields, updating...")
             except Exception:
                 logger.info(f"Search index '{self.index_name}' does not exist, creating...")
             
-            # Define the search index schema
-            fields = [
-                SimpleField(name="id", type=SearchFieldDataType.String, key=True),
-                SearchableField(name="title", type=SearchFieldDataType.String),
-                SearchableField(name="content", type=SearchFieldDataType.String),
-                SearchField(name="content_vector", type=SearchFieldDataType.Collection(SearchFieldDataType.Single),
-                           searchable=True, vector_search_dimensions=3072, vector_search_profile_name="default"),
-                SimpleField(name="source", type=SearchFieldDataType.String, filterable=True, facetable=True),
-                SimpleField(name="category", type=SearchFieldDataType.String, filterable=True, facetable=True),
-                SimpleField(name="created_date", type=SearchFieldDataType.DateTimeOffset, filterable=True, sortable=True),
-                SearchableField(name="metadata", type=SearchFieldDataType.String)
-            ]
-            
-            # Configure vector search
-            vector_search = VectorSearch(
-                algorithms=[
-                    HnswAlgorithmConfiguration(name="default")
-                ],
-                profiles=[
-                    VectorSearchProfile(
-                        name="default",
-                        algorithm_configuration_name="default"
-                    )
-                ]
-            )
-            
-            # Configure semantic search
-            semantic_config = SemanticConfiguration(
-                name="default",
-                prioritized_fields=SemanticPrioritizedFields(
-                    title_field=SemanticField(field_name="title"),
-                    content_fields=[SemanticField(field_name="content")]
-                )
-            )
-            
-            semantic_search = SemanticSearch(configurations=[semantic_config])
-            
-            # Create the index
-            index = SearchIndex(
-                name=self.index_name,
-                fields=fields,
-                vector_search=vector_search,
-                semantic_search=semantic_search
-            )
-            
+            index = self._build_index_definition()
             result = self.index_client.create_or_update_index(index)
             logger.info(f"Search index '{self.index_name}' created successfully")
             return True
@@ -127,91 +658,113 @@ class AzureSearchService:
             logger.error(f"Traceback: {traceback.format_exc()}")
             return False
     
-    def generate_embeddings(self, text: str) -> List[float]:
-        """Generate embeddings using Azure OpenAI"""
+    def _upload_batch(self, search_documents: List[Dict[str, Any]], attempt: int = 0) -> List[Dict[str, Any]]:
+        """Upload one batch with merge_or_upload semantics and return per-document results
+        
+        Oversized requests (413) are split in half, throttled requests (429/503) are
+        retried with backoff, and only the documents that failed with a retryable
+        status are re-sent after a partial failure.
+        """
         try:
-            if not text or len(text.strip()) == 0:
-                logger.error("Cannot generate embeddings for empty text")
-                return []
-            
-            # Truncate text if too long (Azure OpenAI has token limits)
-            max_length = 8000  # Conservative limit for embeddings
-            if len(text) > max_length:
-                logger.warning(f"Text too long ({len(text)} chars), truncating to {max_length} chars")
-                text = text[:max_length]
-            
-            logger.debug(f"Generating embeddings for text of length: {len(text)}")
-            
-            response = self.openai_client.embeddings.create(
-                input=text,
-                model=self.embedding_deployment
-            )
-            
-            embeddings = response.data[0].embedding
-            logger.debug(f"Generated embeddings with {len(embeddings)} dimensions")
-            return embeddings
-            
+            indexing_results = list(self.search_client.merge_or_upload_documents(search_documents))
+        except HttpResponseError as e:
+            if e.status_code == 413 and len(search_documents) > 1:
+                middle = len(search_documents) // 2
+                logger.warning(f"Upload batch of {len(search_documents)} too large, splitting")
+                return (self._upload_batch(search_documents[:middle], attempt) +
+                        self._upload_batch(search_documents[middle:], attempt))
+            if e.status_code in (429, 503) and attempt < self.upload_max_retries:
+                delay = 2 ** attempt
+                logger.warning(f"Search service throttled upload ({e.status_code}), retrying in {delay}s")
+                time.sleep(delay)
+                return self._upload_batch(search_documents, attempt + 1)
+            logger.error(f"Upload batch of {len(search_documents)} failed: {str(e)}")
+            return self._failed_results(search_documents, str(e), e.status_code)
         except Exception as e:
-            logger.error(f"Error generating embeddings: {str(e)}")
-            logger.error(f"Text length: {len(text) if text else 0}")
-            logger.error(f"Model: {self.embedding_deployment}")
-            import traceback
-            logger.error(f"Traceback: {traceback.format_exc()}")
-            return []
+            logger.error(f"Upload batch of {len(search_documents)} failed: {str(e)}")
+            return self._failed_results(search_documents, str(e))
+        
+        results = self._map_indexing_results(indexing_results)
+        retryable = self._retryable_documents(search_documents, results)
+        if retryable and attempt < self.upload_max_retries:
+            delay = 2 ** attempt
+            logger.warning(f"{len(retryable)}/{len(search_documents)} documents failed transiently, retrying in {delay}s")
+            time.sleep(delay)
+            for result in self._upload_batch(retryable, attempt + 1):
+                results[result["id"]] = result
+        
+        return self._ordered_results(search_documents, results)
+    
+    def index_documents(self, documents: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Bulk index documents, returning one result per input document in input order
+        
+        Documents are consumed in windows of AZURE_SEARCH_UPLOAD_BATCH_SIZE, embedded
+        with batched requests where no content_vector is supplied, and uploaded
+        concurrently with at most AZURE_SEARCH_UPLOAD_MAX_CONCURRENCY batches in flight.
+        Each result is {"id", "success", "status_code", "error"}.
+        """
+        results: List[Dict[str, Any]] = []
+        positions: Dict[str, List[int]] = {}
+        in_flight = set()
+        
+        def collect(future):
+            for result in future.result():
+                for position in positions.get(result["id"], []):
+                    results[position] = result
+        
+        with ThreadPoolExecutor(max_workers=self.upload_max_concurrency) as executor:
+            for window in self._windows(documents, self.upload_batch_size):
+                # Validate, then embed every document in the window that lacks a vector
+                valid = self._validate_window(window, results)
+                pending = [(position, doc) for position, doc in valid if not doc.get("content_vector")]
+                embeddings = self.generate_embeddings_batch([doc["content"] for _, doc in pending])
+                search_documents = self._build_window_documents(valid, pending, embeddings, results, positions)
+                
+                for batch in self._plan_upload_batches(search_documents):
+                    # Bound the number of batches in flight
+                    while len(in_flight) >= self.upload_max_concurrency:
+                        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            collect(future)
+                    in_flight.add(executor.submit(self._upload_batch, batch))
+            
+            for future in in_flight:
+                collect(future)
+        
+        self._invalidate_query_cache()
+        succeeded = sum(1 for result in results if result["success"])
+        logger.info(f"Indexed {succeeded}/{len(results)} documents")
+        return results
     
     def index_document(self, document: Dict[str, Any]) -> bool:
-        # Always define search_document at the top
-        search_document = None
+        """Index a single document, returning True or an error message for the API response"""
         try:
-            # Validate required fields
-            required_fields = ["id", "content"]
-            for field in required_fields:
-                if not document.get(field):
-                    logger.error(f"Missing required field '{field}' in document")
-                    return False
-            content = document.get("content", "")
-            if len(content.strip()) == 0:
-                logger.error("Document content is empty")
+            error = self._validate_document(document)
+            if error:
+                logger.error(error)
                 return False
-            logger.info(f"Generating embeddings for document '{document.get('id')}'...")
-            # Generate embeddings for the content
-            content_embedding = self.generate_embeddings(content)
+            
+            # Reuse a precomputed vector (e.g. from generate_embeddings_batch) when provided
+            content_embedding = document.get("content_vector")
+            if not content_embedding:
+                logger.info(f"Generating embeddings for document '{document.get('id')}'...")
+                content_embedding = self.generate_embeddings(document["content"])
             if not content_embedding:
                 logger.error("Failed to generate embeddings for document content")
                 return False
-            logger.info(f"Generated embeddings with {len(content_embedding)} dimensions")
-            # Prepare the document for indexing
-            search_document = {
-                "id": document.get("id"),
-                "title": document.get("title", ""),
-                "content": content,
-                "content_vector": content_embedding,
-                "source": document.get("source", ""),
-                "category": document.get("category", "general"),
-                "created_date": document.get("created_date"),
-                "metadata": json.dumps(document.get("metadata", {}))
-            }
-            logger.debug(f"Document to be indexed: {json.dumps(search_document)[:1000]}")
+            
+            search_document = self._build_search_document(document, content_embedding)
             logger.info(f"Uploading document '{document.get('id')}' to search index...")
-            # Upload to search index
-            result = self.search_client.upload_documents([search_document])
-            # Check the result
-            upload_results = list(result)
-            if upload_results and upload_results[0].succeeded:
+            result = self._upload_batch([search_document])[0]
+            self._invalidate_query_cache()
+            if result["success"]:
                 logger.info(f"Document '{document.get('id')}' indexed successfully")
                 return True
             else:
-                error_msg = upload_results[0].error_message if upload_results else "Unknown error"
-                logger.error(f"Failed to index document '{document.get('id')}': {error_msg}")
+                logger.error(f"Failed to index document '{document.get('id')}': {result['error']}")
                 # Return the error message for API response
-                return error_msg or False
+                return result["error"] or False
         except Exception as e:
-            # Only reference search_document if it is not None
-            if search_document is not None:
-                try:
-                    logger.debug(f"Exception occurred. Last search_document: {json.dumps(search_document)[:1000]}")
-                except Exception:
-                    pass
             logger.error(f"Error indexing document '{document.get('id', 'unknown')}': {str(e)}")
             logger.error(f"Exception type: {type(e).__name__}")
             import traceback
@@ -219,69 +772,99 @@ class AzureSearchService:
             # Return the exception message for API response
             return str(e)
     
-    def search_documents(self, query: str, top: int = 5, use_semantic_search: bool = True) -> List[Dict[str, Any]]:
-        """Perform hybrid search (vector + keyword) with optional semantic ranking"""
+    def search_documents(self, query: str, top: int = 5, use_semantic_search: bool = True,
+                         filters: Optional[str] = None, use_cache: bool = True) -> List[Dict[str, Any]]:
+        """Perform hybrid search (vector + keyword) with optional semantic ranking
+        
+        Chunk hits are collapsed back to their parent documents, so up to `top`
+        documents are returned. Repeated queries are served from the result cache
+        unless use_cache is False.
+        """
         try:
+            cached, cache_key, generation = self._lookup_cached_search(query, top, use_semantic_search, filters, use_cache)
+            if cached is not None:
+                logger.info(f"Serving {len(cached)} cached results for query: {query}")
+                return cached
+            
             # Generate query embedding
             query_embedding = self.generate_embeddings(query)
             
-            # Create vector query
-            vector_query = VectorizedQuery(
-                vector=query_embedding,
-                k_nearest_neighbors=top,
-                fields="content_vector"
-            )
-            
-            # Perform search
-            search_kwargs = {
-                "search_text": query,
-                "vector_queries": [vector_query],
-                "top": top,
-                "select": ["id", "title", "content", "source", "category", "metadata"]
-            }
-            
-            if use_semantic_search:
-                search_kwargs.update({
-                    "query_type": "semantic",
-                    "semantic_configuration_name": "default",
-                    "query_caption": "extractive",
-                    "query_answer": "extractive"
-                })
-            
-            results = self.search_client.search(**search_kwargs)
-            
-            # Format results
-            formatted_results = []
-            for result in results:
-                formatted_result = {
-                    "id": result.get("id"),
-                    "title": result.get("title"),
-                    "content": result.get("content"),
-                    "source": result.get("source"),
-                    "category": result.get("category"),
-                    "metadata": json.loads(result.get("metadata", "{}")),
-                    "score": result.get("@search.score", 0),
-                    "reranker_score": result.get("@search.reranker_score")
-                }
-                
-                # Add semantic captions and answers if available
-                if hasattr(result, '@search.captions'):
-                    formatted_result["captions"] = [caption.text for caption in result['@search.captions']]
-                
-                formatted_results.append(formatted_result)
+            results = self.search_client.search(**self._build_search_kwargs(query, query_embedding, top, use_semantic_search, filters))
+            formatted_results = [self._format_search_result(result) for result in results]
             
-            logger.info(f"Found {len(formatted_results)} results for query: {query}")
-            return formatted_results
+            collapsed_results = self._collapse_chunk_results(formatted_results, top)
+            logger.info(f"Found {len(collapsed_results)} documents ({len(formatted_results)} chunks) for query: {query}")
+            self._store_cached_search(cache_key, generation, collapsed_results)
+            return collapsed_results
             
         except Exception as e:
             logger.error(f"Error searching documents: {str(e)}")
             return []
     
+    def get_document(self, document_id: str) -> Optional[Dict[str, Any]]:
+        """Fetch a document by key, without embedding or ranking
+        
+        Chunked documents are read back with a parent_id filter and reassembled;
+        keys that are not chunk parents (unchunked documents, chunk keys) are
+        fetched directly. Returns None if the key does not exist.
+        """
+        try:
+            entries = list(self.search_client.search(
+                search_text="*",
+                filter=self._chunk_filter(document_id),
+                select=DOCUMENT_FIELDS,
+                order_by=["chunk_index asc"]
+            ))
+            if not entries:
+                try:
+                    entries = [self.search_client.get_document(key=document_id, selected_fields=DOCUMENT_FIELDS)]
+                except ResourceNotFoundError:
+                    return None
+            return self._assemble_document(document_id, entries)
+        except Exception as e:
+            logger.error(f"Error getting document '{document_id}': {str(e)}")
+            return None
+    
+    def document_exists(self, document_id: str) -> bool:
+        """Check whether a document (or any of its chunks) is in the index
+        
+        When the index cannot be reached the document is assumed to exist, so
+        an outage does not turn every skip into a re-index.
+        """
+        try:
+            results = self.search_client.search(
+                search_text="*",
+                filter=self._chunk_filter(document_id),
+                select=["id"],
+                top=1
+            )
+            if any(True for _ in results):
+                return True
+            self.search_client.get_document(key=document_id, selected_fields=["id"])
+            return True
+        except ResourceNotFoundError:
+            return False
+        except Exception as e:
+            logger.error(f"Error checking document '{document_id}': {str(e)}")
+            return True
+    
+    def _find_chunk_ids(self, document_id: str) -> List[str]:
+        """Find the keys of all chunks belonging to a parent document"""
+        results = self.search_client.search(
+            search_text="*",
+            filter=self._chunk_filter(document_id),
+            select=["id"]
+        )
+        return [result["id"] for result in results]
+    
     def delete_document(self, document_id: str) -> bool:
         """Delete a document from the search index"""
         try:
-            result = self.search_client.delete_documents([{"id": document_id}])
-            logger.info(f"Document '{document_id}' deleted successfully")
+            keys = set(self._find_chunk_ids(document_id))
+            keys.add(document_id)
+            result = self.search_client.delete_documents([{"id": key} for key in keys])
+            self._invalidate_query_cache()
+            logger.info(f"Document '{document_id}' deleted successfully ({len(keys)} index entries)")
             return True
         except Exception as e:
             logger.error(f"Error deleting document: {str(e)}")
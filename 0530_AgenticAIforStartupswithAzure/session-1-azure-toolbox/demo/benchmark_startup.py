@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Startup Benchmark for the Knowledge Worker Agent
+Measures module import time with lazy and eager imports, and the first-use cost of each lazily loaded text extractor.
+"""
+
+import re
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+from typing import Any, Dict, List, Tuple
+
+# Modules the document processor used to import at module load: the parsing
+# libraries, and the client SDKs and search backends the service container
+# pulled in. Each is also measured standalone, so dependencies they share with
+# other modules are included in every row.
+EAGER_IMPORTS = ["PyPDF2", "docx", "bs4", "azure.storage.blob", "openai", "httpx", "aiohttp",
+                 "azure.core.pipeline.transport", "azure.search.documents", "azure_search_service",
+                 "async_azure_search_service", "local_search_service"]
+
+# Small sample files, one per built-in extractor that needs no binary fixture
+SAMPLES = {
+    "sample.txt": b"Quarterly budget review notes.\n",
+    "sample.md": b"# Budget\n\nQuarterly budget review notes.\n",
+    "sample.html": b"<html><head><title>Budget</title></head><body><p>Quarterly budget review.</p></body></html>",
+}
+
+_IMPORT_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def import_time_ms(statement: str) -> Dict[str, float]:
+    """Run a statement in a fresh interpreter with -X importtime and return cumulative ms per top-level module"""
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", statement],
+                               capture_output=True, text=True, check=True)
+    totals = {}
+    for line in completed.stderr.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if match and len(match.group(3)) == 1:
+            totals[match.group(4)] = int(match.group(2)) / 1000
+    return totals
+
+
+def median_import_ms(statement: str, module: str, runs: int) -> float:
+    return statistics.median(import_time_ms(statement).get(module, 0.0) for _ in range(runs))
+
+
+def total_import_ms(modules: List[str], runs: int) -> float:
+    """Median wall time to import modules, in order, in a fresh interpreter"""
+    statement = ("import time; started = time.perf_counter(); "
+                 + "; ".join(f"import {module}" for module in modules)
+                 + "; print((time.perf_counter() - started) * 1000)")
+    timings = []
+    for _ in range(runs):
+        completed = subprocess.run([sys.executable, "-c", statement], capture_output=True, text=True, check=True)
+        timings.append(float(completed.stdout.strip().splitlines()[-1]))
+    return statistics.median(timings)
+
+
+def eager_import_ms(runs: int) -> Dict[str, float]:
+    """Cost of each parsing library when imported up front"""
+    return {name: median_import_ms(f"import {name}", name, runs) for name in EAGER_IMPORTS}
+
+
+def first_use_ms() -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """Time the first and second extraction per file type in this process"""
+    from extractors import extract_file_content, get_extractor_registry
+
+    results = []
+    for filename, content in SAMPLES.items():
+        started = time.perf_counter()
+        first = extract_file_content(content, filename)
+        first_ms = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        extract_file_content(content, filename)
+        second_ms = (time.perf_counter() - started) * 1000
+        results.append({"file": filename, "success": first["success"],
+                        "first_ms": first_ms, "second_ms": second_ms})
+    return results, get_extractor_registry().get_statistics()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark module import time and extractor first use")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per measurement (median is reported)")
+    args = parser.parse_args()
+
+    print(f"📦 Import time (median of {args.runs} runs, cumulative)")
+    print("=" * 50)
+    for module in ("extractors", "document_processor"):
+        print(f"  import {module:<22} {median_import_ms(f'import {module}', module, args.runs):8.1f} ms")
+
+    lazy_total = total_import_ms(["document_processor"], args.runs)
+    eager_total = total_import_ms(EAGER_IMPORTS + ["document_processor"], args.runs)
+    print(f"\n⏱️  import document_processor, total wall time (median of {args.runs} runs)")
+    print("=" * 50)
+    print(f"  {'eager (previous imports)':<29} {eager_total:8.1f} ms")
+    print(f"  {'lazy (current)':<29} {lazy_total:8.1f} ms")
+    print(f"  {'saved':<29} {eager_total - lazy_total:8.1f} ms")
+
+    eager = eager_import_ms(args.runs)
+    print("\n⏳ Modules now deferred to first use (each standalone; shared dependencies count in every row)")
+    print("=" * 50)
+    for name, ms in eager.items():
+        print(f"  import {name:<30} {ms:8.1f} ms")
+
+    results, plugins = first_use_ms()
+    print("\n🔌 Extractor first use in this process")
+    print("=" * 50)
+    for result in results:
+        status = "ok" if result["success"] else "failed"
+        print(f"  {result['file']:<16} first {result['first_ms']:7.1f} ms   "
+              f"then {result['second_ms']:6.2f} ms   ({status})")
+    for name, plugin in sorted(plugins.items()):
+        load = f"{plugin['load_ms']} ms" if plugin["loaded"] else "not loaded"
+        print(f"  plugin {name:<20} {', '.join(plugin['extensions']):<18} {plugin['source']:<12} {load}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,440 @@
+"""
+BM25 keyword index for the Knowledge Worker Agent
+Segmented on-disk inverted index with background merging and reciprocal rank fusion
+"""
+import os
+import re
+import json
+import shutil
+import logging
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Terms are stored as fixed-width UTF-8 byte strings; longer tokens are not indexed
+MAX_TERM_BYTES = 32
+_TOKEN = re.compile(r"\w+")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or that the this to was were will with".split()
+)
+
+
+def tokenize(text: str) -> List[bytes]:
+    """Lowercase word tokens as UTF-8 bytes, without stopwords or overlong tokens"""
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if token in _STOPWORDS:
+            continue
+        encoded = token.encode("utf-8")
+        if len(encoded) <= MAX_TERM_BYTES:
+            tokens.append(encoded)
+    return tokens
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Fuse several ranked key lists into one, scoring each key by sum(1 / (k + rank))"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class _Segment:
+    """An immutable on-disk block of postings plus a mutable live-document mask
+
+    Postings are stored term-major in contiguous arrays: ``terms`` (sorted),
+    ``offsets`` into ``docs``/``tfs``, with doc numbers ascending within a term.
+    """
+
+    _ARRAYS = ("terms", "offsets", "docs", "tfs", "keys", "sorted_keys", "key_order", "lengths")
+
+    def __init__(self, path: str):
+        self.path = path
+        self.name = os.path.basename(path)
+        for array in self._ARRAYS:
+            setattr(self, array, np.load(os.path.join(path, f"{array}.npy"), mmap_mode="r"))
+        self.live = np.load(os.path.join(path, "live.npy"))
+        self.live_dirty = False
+
+    @classmethod
+    def write(cls, path: str, terms: np.ndarray, offsets: np.ndarray, docs: np.ndarray, tfs: np.ndarray,
+              keys: np.ndarray, lengths: np.ndarray) -> "_Segment":
+        os.makedirs(path, exist_ok=True)
+        key_order = np.argsort(keys, kind="stable").astype(np.int32)
+        arrays = {
+            "terms": terms, "offsets": offsets, "docs": docs, "tfs": tfs, "keys": keys,
+            "sorted_keys": keys[key_order], "key_order": key_order, "lengths": lengths,
+            "live": np.ones(len(keys), dtype=bool)
+        }
+        for name, array in arrays.items():
+            np.save(os.path.join(path, f"{name}.npy"), array)
+        return cls(path)
+
+    @property
+    def doc_count(self) -> int:
+        return len(self.keys)
+
+    def live_count(self) -> int:
+        return int(self.live.sum())
+
+    def live_length(self) -> int:
+        return int(self.lengths[self.live].sum())
+
+    def postings(self, term: bytes) -> Optional[slice]:
+        index = np.searchsorted(self.terms, term)
+        if index < len(self.terms) and self.terms[index] == term:
+            return slice(int(self.offsets[index]), int(self.offsets[index + 1]))
+        return None
+
+    def find(self, keys: np.ndarray) -> np.ndarray:
+        """Return local doc numbers of the given keys that exist in this segment"""
+        if not len(self.keys) or not len(keys):
+            return np.empty(0, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.sorted_keys, keys), len(self.sorted_keys) - 1)
+        matches = self.sorted_keys[positions] == keys
+        return self.key_order[positions[matches]].astype(np.int64)
+
+    def delete(self, keys: np.ndarray) -> int:
+        docs = self.find(keys)
+        docs = docs[self.live[docs]]
+        if len(docs):
+            self.live[docs] = False
+            self.live_dirty = True
+        return len(docs)
+
+    def save_live(self) -> None:
+        if self.live_dirty:
+            temporary = os.path.join(self.path, "live.tmp.npy")
+            np.save(temporary, self.live)
+            os.replace(temporary, os.path.join(self.path, "live.npy"))
+            self.live_dirty = False
+
+
+class BM25Index:
+    """Incremental BM25 index over string keys
+
+    New documents collect in an in-memory buffer that commit() writes out as a
+    segment. When there are more than BM25_MAX_SEGMENTS segments the smallest
+    ones are merged on a background thread, dropping deleted documents.
+    """
+
+    def __init__(self, index_dir: str, k1: float = 1.2, b: float = 0.75):
+        """Open (or create) the index in index_dir"""
+        self.index_dir = index_dir
+        self.k1 = k1
+        self.b = b
+        self.max_segments = int(os.getenv("BM25_MAX_SEGMENTS", "8"))
+        self.merge_factor = max(2, int(os.getenv("BM25_MERGE_FACTOR", "4")))
+
+        self._lock = threading.RLock()
+        self._merge_thread: Optional[threading.Thread] = None
+        self._merge_deletes: Optional[List[np.ndarray]] = None
+        self._reset_buffer()
+        self._open()
+
+    # ----------------------------------------------------------------- storage
+
+    def _reset_buffer(self) -> None:
+        self._buffer_keys: List[str] = []
+        self._buffer_lengths: List[int] = []
+        self._buffer_live: List[bool] = []
+        self._buffer_ids: Dict[str, int] = {}
+        self._buffer_postings: Dict[bytes, List[Tuple[int, int]]] = {}
+
+    def _open(self) -> None:
+        os.makedirs(self.index_dir, exist_ok=True)
+        manifest_path = os.path.join(self.index_dir, "segments.json")
+        manifest = {"segments": [], "next_id": 0}
+        if os.path.exists(manifest_path):
+            with open(manifest_path, encoding="utf-8") as manifest_file:
+                manifest = json.load(manifest_file)
+        self._next_id = manifest["next_id"]
+        self._segments = [_Segment(os.path.join(self.index_dir, name)) for name in manifest["segments"]]
+
+        # Remove segments left behind by an interrupted flush or merge
+        for name in os.listdir(self.index_dir):
+            if name.startswith("seg_") and name not in manifest["segments"]:
+                shutil.rmtree(os.path.join(self.index_dir, name), ignore_errors=True)
+
+    def _write_manifest(self) -> None:
+        manifest = {"segments": [segment.name for segment in self._segments], "next_id": self._next_id}
+        temporary = os.path.join(self.index_dir, "segments.json.tmp")
+        with open(temporary, "w", encoding="utf-8") as manifest_file:
+            json.dump(manifest, manifest_file)
+        os.replace(temporary, os.path.join(self.index_dir, "segments.json"))
+
+    def _new_segment_path(self) -> str:
+        self._next_id += 1
+        return os.path.join(self.index_dir, f"seg_{self._next_id:06d}")
+
+    @staticmethod
+    def _key_array(keys: Iterable[str]) -> np.ndarray:
+        return np.array([key.encode("utf-8") for key in keys], dtype=bytes)
+
+    # ---------------------------------------------------------------- updates
+
+    def add(self, key: str, text: str) -> None:
+        """Index text under key, replacing any previous version"""
+        with self._lock:
+            self.delete([key])
+            tokens = tokenize(text)
+            doc = len(self._buffer_keys)
+            self._buffer_keys.append(key)
+            self._buffer_lengths.append(len(tokens))
+            self._buffer_live.append(True)
+            self._buffer_ids[key] = doc
+            for term, tf in Counter(tokens).items():
+                self._buffer_postings.setdefault(term, []).append((doc, tf))
+
+    def delete(self, keys: Iterable[str]) -> int:
+        """Remove keys from the index, returning how many live documents were removed"""
+        keys = list(keys)
+        with self._lock:
+            removed = 0
+            for key in keys:
+                doc = self._buffer_ids.pop(key, None)
+                if doc is not None and self._buffer_live[doc]:
+                    self._buffer_live[doc] = False
+                    removed += 1
+            key_array = self._key_array(keys)
+            for segment in self._segments:
+                removed += segment.delete(key_array)
+            if self._merge_deletes is not None:
+                self._merge_deletes.append(key_array)
+            return removed
+
+    def commit(self) -> None:
+        """Write buffered documents as a segment and persist deletions"""
+        with self._lock:
+            if self._buffer_keys:
+                self._segments.append(self._flush_buffer())
+            for segment in self._segments:
+                segment.save_live()
+            self._write_manifest()
+        self._maybe_merge()
+
+    def _flush_buffer(self) -> _Segment:
+        terms = sorted(self._buffer_postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        docs, tfs = [], []
+        for i, term in enumerate(terms):
+            postings = self._buffer_postings[term]
+            offsets[i + 1] = offsets[i] + len(postings)
+            docs.extend(doc for doc, _ in postings)
+            tfs.extend(tf for _, tf in postings)
+
+        segment = _Segment.write(
+            self._new_segment_path(),
+            terms=np.array(terms, dtype=f"S{MAX_TERM_BYTES}"),
+            offsets=offsets,
+            docs=np.array(docs, dtype=np.uint32),
+            tfs=np.array(tfs, dtype=np.uint16),
+            keys=self._key_array(self._buffer_keys),
+            lengths=np.array(self._buffer_lengths, dtype=np.uint32)
+        )
+        deleted = [doc for doc, live in enumerate(self._buffer_live) if not live]
+        if deleted:
+            segment.live[deleted] = False
+            segment.live_dirty = True
+            segment.save_live()
+        self._reset_buffer()
+        return segment
+
+    # ---------------------------------------------------------------- merging
+
+    def _maybe_merge(self) -> None:
+        with self._lock:
+            if len(self._segments) <= self.max_segments:
+                return
+            if self._merge_thread is not None and self._merge_thread.is_alive():
+                return
+            self._merge_thread = threading.Thread(target=self._merge_loop, name="bm25-merge", daemon=True)
+            self._merge_thread.start()
+
+    def _merge_loop(self) -> None:
+        while True:
+            with self._lock:
+                if len(self._segments) <= self.max_segments:
+                    return
+                sources = sorted(self._segments, key=lambda segment: segment.live_count())[:self.merge_factor]
+                lives = [segment.live.copy() for segment in sources]
+                self._merge_deletes = []
+                path = self._new_segment_path()
+            try:
+                merged = self._merge_segments(path, sources, lives)
+            except Exception as e:
+                logger.error(f"BM25 segment merge failed: {str(e)}")
+                with self._lock:
+                    self._merge_deletes = None
+                return
+
+            with self._lock:
+                # Apply deletions that arrived while the merge was running
+                for key_array in self._merge_deletes:
+                    merged.delete(key_array)
+                self._merge_deletes = None
+                merged.save_live()
+                position = self._segments.index(sources[0])
+                self._segments = [segment for segment in self._segments if segment not in sources]
+                self._segments.insert(min(position, len(self._segments)), merged)
+                self._write_manifest()
+            for segment in sources:
+                # Open memory maps can keep files locked on Windows; leftovers are cleaned on open
+                shutil.rmtree(segment.path, ignore_errors=True)
+            logger.info(f"Merged {len(sources)} BM25 segments into {merged.name} ({merged.doc_count} documents)")
+
+    @staticmethod
+    def _merge_segments(path: str, sources: List[_Segment], lives: List[np.ndarray]) -> _Segment:
+        """Combine segments into one, renumbering documents and dropping deleted ones"""
+        terms = np.unique(np.concatenate([np.asarray(segment.terms) for segment in sources]))
+        all_terms, all_docs, all_tfs, keys, lengths = [], [], [], [], []
+        base = 0
+        for segment, live in zip(sources, lives):
+            renumber = np.cumsum(live) - 1 + base
+            term_ids = np.searchsorted(terms, np.asarray(segment.terms))
+            posting_terms = np.repeat(term_ids, np.diff(np.asarray(segment.offsets)))
+            docs = np.asarray(segment.docs)
+            keep = live[docs]
+            all_terms.append(posting_terms[keep])
+            all_docs.append(renumber[docs[keep]])
+            all_tfs.append(np.asarray(segment.tfs)[keep])
+            keys.append(np.asarray(segment.keys)[live])
+            lengths.append(np.asarray(segment.lengths)[live])
+            base += int(live.sum())
+
+        posting_terms = np.concatenate(all_terms)
+        docs = np.concatenate(all_docs)
+        order = np.lexsort((docs, posting_terms))
+        posting_terms = posting_terms[order]
+        counts = np.bincount(posting_terms, minlength=len(terms))
+        used = counts > 0
+        offsets = np.zeros(int(used.sum()) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(counts[used])
+        return _Segment.write(
+            path,
+            terms=terms[used],
+            offsets=offsets,
+            docs=docs[order].astype(np.uint32),
+            tfs=np.concatenate(all_tfs)[order],
+            keys=np.concatenate(keys) if keys else np.array([], dtype=bytes),
+            lengths=np.concatenate(lengths).astype(np.uint32)
+        )
+
+    def wait_for_merges(self) -> None:
+        """Block until any background merge has finished"""
+        thread = self._merge_thread
+        if thread is not None:
+            thread.join()
+
+    # ----------------------------------------------------------------- search
+
+    def _collection_stats(self, terms: List[bytes]) -> Tuple[int, float, Dict[bytes, int]]:
+        """Live document count, average length and per-term document frequency"""
+        live_docs = sum(self._buffer_live)
+        total_length = sum(length for length, live in zip(self._buffer_lengths, self._buffer_live) if live)
+        frequencies = {term: len(self._buffer_postings.get(term, ())) for term in terms}
+        for segment in self._segments:
+            live_docs += segment.live_count()
+            total_length += segment.live_length()
+            for term in terms:
+                postings = segment.postings(term)
+                if postings is not None:
+                    frequencies[term] += postings.stop - postings.start
+        return live_docs, (total_length / live_docs if live_docs else 0.0), frequencies
+
+    def _score(self, docs: np.ndarray, tfs: np.ndarray, lengths: np.ndarray, idf: float,
+               average_length: float) -> np.ndarray:
+        tfs = tfs.astype(np.float32)
+        norm = self.k1 * (1 - self.b + self.b * lengths[docs] / average_length)
+        return idf * tfs * (self.k1 + 1) / (tfs + norm)
+
+    @staticmethod
+    def _top(doc_ids: np.ndarray, scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if len(scores) > k:
+            best = np.argpartition(-scores, k - 1)[:k]
+            return doc_ids[best], scores[best]
+        return doc_ids, scores
+
+    def search(self, query: str, k: int = 10, keys: Optional[Iterable[str]] = None) -> List[Tuple[str, float]]:
+        """Return up to k (key, BM25 score) pairs, optionally restricted to the given keys"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        key_array = self._key_array(keys) if keys is not None else None
+
+        with self._lock:
+            live_docs, average_length, frequencies = self._collection_stats(terms)
+            if not live_docs:
+                return []
+            idf = {term: float(np.log(1 + (live_docs - df + 0.5) / (df + 0.5))) for term, df in frequencies.items()}
+            candidates: List[Tuple[str, float]] = []
+
+            for segment in self._segments:
+                doc_parts, score_parts = [], []
+                lengths = np.asarray(segment.lengths, dtype=np.float32)
+                for term in terms:
+                    postings = segment.postings(term)
+                    if postings is None:
+                        continue
+                    docs = np.asarray(segment.docs[postings], dtype=np.int64)
+                    doc_parts.append(docs)
+                    score_parts.append(self._score(docs, np.asarray(segment.tfs[postings]), lengths,
+                                                   idf[term], average_length))
+                if not doc_parts:
+                    continue
+                docs = np.concatenate(doc_parts)
+                # Sum per-term scores for each document (sparse when postings are short)
+                if len(docs) * 8 < segment.doc_count:
+                    doc_ids, inverse = np.unique(docs, return_inverse=True)
+                    scores = np.bincount(inverse, weights=np.concatenate(score_parts))
+                else:
+                    scores = np.bincount(docs, weights=np.concatenate(score_parts), minlength=segment.doc_count)
+                    doc_ids = np.flatnonzero(scores)
+                    scores = scores[doc_ids]
+                allowed = segment.live[doc_ids]
+                if key_array is not None:
+                    allowed &= np.isin(doc_ids, segment.find(key_array))
+                doc_ids, scores = self._top(doc_ids[allowed], scores[allowed], k)
+                candidates.extend((segment.keys[doc].decode("utf-8"), float(score))
+                                  for doc, score in zip(doc_ids, scores))
+
+            # The in-memory buffer is small; score it directly
+            allowed_keys = set(keys) if keys is not None else None
+            buffer_lengths = np.asarray(self._buffer_lengths, dtype=np.float32)
+            buffer_scores: Dict[int, float] = {}
+            for term in terms:
+                postings = self._buffer_postings.get(term)
+                if not postings:
+                    continue
+                docs = np.array([doc for doc, _ in postings], dtype=np.int64)
+                tfs = np.array([tf for _, tf in postings])
+                for doc, score in zip(docs, self._score(docs, tfs, buffer_lengths, idf[term], average_length)):
+                    buffer_scores[int(doc)] = buffer_scores.get(int(doc), 0.0) + float(score)
+            for doc, score in buffer_scores.items():
+                key = self._buffer_keys[doc]
+                if self._buffer_live[doc] and (allowed_keys is None or key in allowed_keys):
+                    candidates.append((key, score))
+
+        candidates.sort(key=lambda item: item[1], reverse=True)
+        return candidates[:k]
+
+    def get_statistics(self) -> Dict[str, int]:
+        """Return document and segment counts"""
+        with self._lock:
+            return {
+                "documents": sum(segment.live_count() for segment in self._segments) + sum(self._buffer_live),
+                "segments": len(self._segments),
+                "buffered": len(self._buffer_keys)
+            }
+
+    def close(self) -> None:
+        """Commit pending changes and wait for background merges"""
+        self.commit()
+        self.wait_for_merges()
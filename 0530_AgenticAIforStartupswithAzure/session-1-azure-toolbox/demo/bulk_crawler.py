@@ -0,0 +1,496 @@
+#!/usr/bin/env python3
+"""
+Bulk crawler for the Knowledge Worker Agent
+Walks a local directory tree or an Azure Blob container lazily and ingests it in bounded, checkpointed windows
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import sqlite3
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from extractors import get_extractor_registry
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_MB = 1024 * 1024
+
+
+class CrawlItem:
+    """One file found by a crawl source; its bytes are only read when it is ingested"""
+
+    __slots__ = ("source_key", "filename", "size", "fingerprint", "path", "blob_name", "blob_url")
+
+    def __init__(self, source_key: str, filename: str, size: int, fingerprint: str,
+                 path: Optional[str] = None, blob_name: Optional[str] = None, blob_url: Optional[str] = None):
+        self.source_key = source_key
+        self.filename = filename
+        self.size = size
+        self.fingerprint = fingerprint
+        self.path = path
+        self.blob_name = blob_name
+        self.blob_url = blob_url
+
+
+class LocalDirectorySource:
+    """Files under a local directory, walked in sorted order one directory at a time"""
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        if not os.path.isdir(self.root):
+            raise ValueError(f"Not a directory: {root}")
+        self.crawl_key = f"dir:{self.root}"
+
+    def iter_items(self, supported: Callable[[str], bool]) -> Iterator[CrawlItem]:
+        pending = [self.root]
+        while pending:
+            directory = pending.pop()
+            try:
+                with os.scandir(directory) as scan:
+                    entries = sorted(scan, key=lambda entry: entry.name)
+            except OSError as e:
+                logger.warning(f"Skipping unreadable directory {directory}: {str(e)}")
+                continue
+            # Depth first; reversed so subdirectories are visited in name order
+            pending.extend(entry.path for entry in reversed(entries) if entry.is_dir(follow_symlinks=False))
+            for entry in entries:
+                if not entry.is_file() or not supported(entry.name):
+                    continue
+                stat = entry.stat()
+                relative = os.path.relpath(entry.path, self.root).replace(os.sep, "/")
+                yield CrawlItem(
+                    source_key=f"{self.crawl_key}/{relative}",
+                    filename=entry.name,
+                    size=stat.st_size,
+                    # Size and modification time, so unchanged files are skipped without reading them
+                    fingerprint=f"{stat.st_size}:{stat.st_mtime_ns}",
+                    path=entry.path
+                )
+
+    def fetch(self, item: CrawlItem, spool_dir: str) -> str:
+        """Local files are ingested straight from disk"""
+        return item.path
+
+    def describe(self) -> str:
+        return self.root
+
+
+class BlobContainerSource:
+    """Blobs in an Azure Storage container (optionally under a prefix), listed page by page"""
+
+    def __init__(self, blob_service_client, container: str, prefix: str = "",
+                 download_concurrency: int = 2):
+        if blob_service_client is None:
+            raise ValueError("Azure Storage is not configured")
+        self.container_client = blob_service_client.get_container_client(container)
+        self.container = container
+        self.prefix = prefix
+        self.download_concurrency = download_concurrency
+        self.crawl_key = f"blob:{container}/{prefix}"
+
+    def iter_items(self, supported: Callable[[str], bool]) -> Iterator[CrawlItem]:
+        # list_blobs pages lazily, so only one page of names is held at a time
+        for blob in self.container_client.list_blobs(name_starts_with=self.prefix or None):
+            filename = blob.name.rsplit("/", 1)[-1]
+            if not filename or not supported(filename):
+                continue
+            yield CrawlItem(
+                source_key=f"blob:{self.container}/{blob.name}",
+                filename=filename,
+                size=blob.size or 0,
+                # The ETag changes whenever the blob is rewritten
+                fingerprint=str(blob.etag),
+                blob_name=blob.name,
+                blob_url=f"{self.container_client.url}/{blob.name}"
+            )
+
+    def fetch(self, item: CrawlItem, spool_dir: str) -> str:
+        """Stream the blob into a spool file and return its path"""
+        digest = hashlib.sha1(item.blob_name.encode("utf-8")).hexdigest()[:16]
+        path = os.path.join(spool_dir, f"{digest}_{item.filename}")
+        with open(path, "wb") as spool:
+            self.container_client.download_blob(item.blob_name, max_concurrency=self.download_concurrency) \
+                .readinto(spool)
+        return path
+
+    def describe(self) -> str:
+        return f"{self.container_client.url}/{self.prefix}"
+
+
+class CrawlState:
+    """SQLite checkpoint of crawls, the outcome of each file in the current crawl, and file fingerprints
+
+    A crawl's id is derived from its source, so running the same crawl again
+    resumes an unfinished one. Fingerprints outlive crawls: a file whose size
+    and mtime (or blob ETag) match the last successful ingestion is skipped
+    without being read or downloaded.
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(cache_dir, "crawls.db"), check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS crawls ("
+            "crawl_id TEXT PRIMARY KEY, source TEXT NOT NULL, category TEXT NOT NULL, status TEXT NOT NULL, "
+            "counters TEXT NOT NULL, started REAL NOT NULL, updated REAL NOT NULL, finished REAL);"
+            "CREATE TABLE IF NOT EXISTS crawl_items ("
+            "crawl_id TEXT NOT NULL, source_key TEXT NOT NULL, outcome TEXT NOT NULL, "
+            "PRIMARY KEY (crawl_id, source_key));"
+            "CREATE TABLE IF NOT EXISTS fingerprints ("
+            "source_key TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, document_id TEXT, updated REAL NOT NULL);"
+        )
+        self._db.commit()
+
+    @staticmethod
+    def crawl_id(crawl_key: str, category: str) -> str:
+        return hashlib.sha1(f"{crawl_key}|{category}".encode("utf-8")).hexdigest()[:16]
+
+    def begin(self, crawl_id: str, source: str, category: str) -> Dict[str, Any]:
+        """Resume the crawl if it is unfinished, otherwise start it afresh; return its saved counters"""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT * FROM crawls WHERE crawl_id = ?", (crawl_id,)).fetchone()
+            if row is not None and row["status"] != "completed":
+                self._db.execute("UPDATE crawls SET status = 'running', updated = ? WHERE crawl_id = ?",
+                                 (now, crawl_id))
+                self._db.commit()
+                return {"resumed": True, "counters": json.loads(row["counters"])}
+            self._db.execute("DELETE FROM crawl_items WHERE crawl_id = ?", (crawl_id,))
+            self._db.execute(
+                "INSERT OR REPLACE INTO crawls (crawl_id, source, category, status, counters, started, updated, "
+                "finished) VALUES (?, ?, ?, 'running', '{}', ?, ?, NULL)",
+                (crawl_id, source, category, now, now)
+            )
+            self._db.commit()
+        return {"resumed": False, "counters": {}}
+
+    def done_keys(self, crawl_id: str) -> set:
+        """Source keys this crawl already finished with (failed files are retried on resume)"""
+        with self._lock:
+            rows = self._db.execute("SELECT source_key FROM crawl_items WHERE crawl_id = ? AND outcome != 'failed'",
+                                    (crawl_id,)).fetchall()
+        return {row["source_key"] for row in rows}
+
+    def fingerprint(self, source_key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT fingerprint FROM fingerprints WHERE source_key = ?",
+                                   (source_key,)).fetchone()
+        return row["fingerprint"] if row else None
+
+    def checkpoint(self, crawl_id: str, outcomes: List[Dict[str, Any]], counters: Dict[str, Any]) -> None:
+        """Record one window's outcomes, fingerprints and running counters in a single transaction"""
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO crawl_items (crawl_id, source_key, outcome) VALUES (?, ?, ?)",
+                [(crawl_id, outcome["source_key"], outcome["outcome"]) for outcome in outcomes]
+            )
+            self._db.executemany(
+                "INSERT OR REPLACE INTO fingerprints (source_key, fingerprint, document_id, updated) "
+                "VALUES (?, ?, ?, ?)",
+                [(outcome["source_key"], outcome["fingerprint"], outcome.get("document_id"), now)
+                 for outcome in outcomes if outcome["outcome"] != "failed"]
+            )
+            self._db.execute("UPDATE crawls SET counters = ?, updated = ? WHERE crawl_id = ?",
+                             (json.dumps(counters), now, crawl_id))
+            self._db.commit()
+
+    def finish(self, crawl_id: str, counters: Dict[str, Any]) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.execute("UPDATE crawls SET status = 'completed', counters = ?, updated = ?, finished = ? "
+                             "WHERE crawl_id = ?", (json.dumps(counters), now, now, crawl_id))
+            self._db.commit()
+
+    def interrupt(self, crawl_id: str) -> None:
+        """Mark a crawl as stopped early; its last checkpoint stands and the next run resumes it"""
+        with self._lock:
+            self._db.execute("UPDATE crawls SET status = 'interrupted', updated = ? WHERE crawl_id = ?",
+                             (time.time(), crawl_id))
+            self._db.commit()
+
+    def recent(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Most recently updated crawls with their counters"""
+        with self._lock:
+            rows = self._db.execute("SELECT * FROM crawls ORDER BY updated DESC LIMIT ?", (limit,)).fetchall()
+        crawls = []
+        for row in rows:
+            crawl = dict(row)
+            crawl["counters"] = json.loads(crawl["counters"])
+            crawls.append(crawl)
+        return crawls
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class CrawlProgress:
+    """Running counters and rates of one crawl"""
+
+    COUNTERS = ("files_skipped", "files_unchanged", "files_indexed", "files_failed",
+                "bytes_ingested", "chunks_indexed", "embeddings_computed")
+
+    def __init__(self, saved: Optional[Dict[str, Any]] = None):
+        saved = saved or {}
+        self.counts = {name: int(saved.get(name, 0)) for name in self.COUNTERS}
+        # Rates cover this run only; counters carry over from the interrupted run
+        self._baseline = dict(self.counts)
+        self._started = time.perf_counter()
+
+    def add(self, **values: int) -> None:
+        for name, value in values.items():
+            self.counts[name] += value
+
+    def snapshot(self) -> Dict[str, Any]:
+        elapsed = max(time.perf_counter() - self._started, 1e-9)
+        run = {name: self.counts[name] - self._baseline[name] for name in self.COUNTERS}
+        processed = run["files_skipped"] + run["files_unchanged"] + run["files_indexed"] + run["files_failed"]
+        return {
+            "files_processed": sum(self.counts[name] for name in self.COUNTERS[:4]),
+            **self.counts,
+            "elapsed_seconds": round(elapsed, 1),
+            "files_per_second": round(processed / elapsed, 2),
+            "mb_per_second": round(run["bytes_ingested"] / _MB / elapsed, 2),
+            "embeddings_per_second": round(run["embeddings_computed"] / elapsed, 2)
+        }
+
+
+class BulkCrawler:
+    """Ingests every supported file of a source through DocumentProcessor.batch_process_files
+
+    Files are pulled from the source lazily and grouped into windows of at most
+    CRAWL_BATCH_FILES files and CRAWL_BATCH_MB megabytes. Each window is handed
+    to the ingestion pipeline as file paths (blobs are first streamed into a
+    spool directory, several at a time), so memory and spool disk use stay
+    bounded by the window however large the source is. After every window the
+    outcomes are checkpointed; an interrupted crawl resumes after the last
+    checkpointed window.
+    """
+
+    def __init__(self, processor, state: Optional[CrawlState] = None,
+                 batch_files: Optional[int] = None, batch_mb: Optional[float] = None,
+                 fetch_concurrency: Optional[int] = None, report_seconds: Optional[float] = None):
+        self.processor = processor
+        self.state = state or CrawlState(os.getenv("CRAWL_STATE_DIR", ".cache/crawls"))
+        self.batch_files = max(1, batch_files or int(os.getenv("CRAWL_BATCH_FILES", "32")))
+        self.batch_bytes = int((batch_mb or float(os.getenv("CRAWL_BATCH_MB", "256"))) * _MB)
+        self.fetch_concurrency = max(1, fetch_concurrency or int(os.getenv("CRAWL_FETCH_CONCURRENCY", "4")))
+        self.report_seconds = report_seconds or float(os.getenv("CRAWL_REPORT_SECONDS", "10"))
+        self.spool_root = os.getenv("CRAWL_SPOOL_DIR") or None
+
+    def _windows(self, items: Iterator[CrawlItem]) -> Iterator[List[CrawlItem]]:
+        window: List[CrawlItem] = []
+        window_bytes = 0
+        for item in items:
+            if window and (len(window) >= self.batch_files or window_bytes + item.size > self.batch_bytes):
+                yield window
+                window, window_bytes = [], 0
+            window.append(item)
+            window_bytes += item.size
+        if window:
+            yield window
+
+    def _still_indexed(self, item: CrawlItem) -> bool:
+        """Whether the manifest still records the item (its entry is dropped when the document is deleted)"""
+        manifest = self.processor.manifest
+        return manifest is None or manifest.get(item.source_key) is not None
+
+    def _embedding_misses(self) -> Optional[int]:
+        """Embedding cache misses so far (each one is an embedding computed), or None without a cache"""
+        try:
+            stats = self.processor.search_service.get_embedding_cache_statistics()
+        except Exception:
+            return None
+        return stats.get("misses") if stats.get("enabled") else None
+
+    def _ingest_window(self, source, window: List[CrawlItem], category: str) -> List[Dict[str, Any]]:
+        """Fetch and ingest one window; return each file's outcome"""
+        outcomes = {}
+        files = []
+        spool_dir = tempfile.mkdtemp(prefix="crawl-", dir=self.spool_root)
+        try:
+            with ThreadPoolExecutor(max_workers=self.fetch_concurrency, thread_name_prefix="crawl-fetch") as pool:
+                fetched = list(pool.map(lambda item: self._fetch(source, item, spool_dir), window))
+            for item, (path, error) in zip(window, fetched):
+                if error:
+                    outcomes[item.source_key] = {"source_key": item.source_key, "fingerprint": item.fingerprint,
+                                                 "outcome": "failed", "error": error}
+                    continue
+                file_info = {"filename": item.filename, "content": path,
+                             "source_key": item.source_key, "category": category}
+                if item.blob_url:
+                    file_info["blob_url"] = item.blob_url
+                files.append(file_info)
+
+            if files:
+                results = self.processor.batch_process_files(files)
+                for entry in results["successful"]:
+                    outcomes[entry["source_key"]] = {
+                        "outcome": "unchanged" if entry.get("unchanged") else "indexed",
+                        "document_id": entry["document_id"],
+                        "chunk_count": entry.get("chunk_count", 0)
+                    }
+                for entry in results["failed"]:
+                    outcomes[entry["source_key"]] = {"outcome": "failed", "error": entry["error"]}
+        finally:
+            shutil.rmtree(spool_dir, ignore_errors=True)
+
+        results = []
+        for item in window:
+            outcome = outcomes.get(item.source_key, {"outcome": "failed", "error": "No result from pipeline"})
+            outcome.update(source_key=item.source_key, fingerprint=item.fingerprint, size=item.size,
+                           filename=item.filename)
+            if outcome["outcome"] == "failed":
+                logger.warning(f"Failed to ingest {item.source_key}: {outcome['error']}")
+            results.append(outcome)
+        return results
+
+    @staticmethod
+    def _fetch(source, item: CrawlItem, spool_dir: str):
+        try:
+            return source.fetch(item, spool_dir), None
+        except Exception as e:
+            return None, f"Fetch failed: {str(e)}"
+
+    def crawl(self, source, category: str = "general",
+              on_progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """Crawl a source to completion (or resume an interrupted crawl of it) and return the final counters"""
+        crawl_id = CrawlState.crawl_id(source.crawl_key, category)
+        begun = self.state.begin(crawl_id, source.describe(), category)
+        done = self.state.done_keys(crawl_id) if begun["resumed"] else set()
+        progress = CrawlProgress(begun["counters"])
+        if begun["resumed"]:
+            logger.info(f"Resuming crawl {crawl_id} of {source.describe()} ({len(done)} files already done)")
+        else:
+            logger.info(f"Starting crawl {crawl_id} of {source.describe()}")
+
+        extensions = set(get_extractor_registry().supported_types())
+        supported = lambda filename: os.path.splitext(filename)[1].lower() in extensions
+
+        # Files are counted only once their outcome is checkpointed, so a resumed
+        # crawl's counters match the files it skips as already done
+        skipped: List[Dict[str, Any]] = []
+
+        def checkpoint(outcomes: List[Dict[str, Any]]) -> None:
+            progress.add(files_skipped=len(skipped))
+            self.state.checkpoint(crawl_id, skipped + outcomes, progress.counts)
+            skipped.clear()
+
+        def pending() -> Iterator[CrawlItem]:
+            for item in source.iter_items(supported):
+                if item.source_key in done:
+                    continue
+                if self.state.fingerprint(item.source_key) == item.fingerprint and self._still_indexed(item):
+                    skipped.append({"source_key": item.source_key, "fingerprint": item.fingerprint,
+                                    "outcome": "skipped"})
+                    if len(skipped) >= self.batch_files:
+                        checkpoint([])
+                    continue
+                yield item
+
+        last_report = time.perf_counter()
+        misses = self._embedding_misses()
+        completed = False
+        try:
+            for window in self._windows(pending()):
+                outcomes = self._ingest_window(source, window, category)
+                indexed = [outcome for outcome in outcomes if outcome["outcome"] == "indexed"]
+                chunks = sum(outcome["chunk_count"] for outcome in indexed)
+                current_misses = self._embedding_misses()
+                progress.add(
+                    files_indexed=len(indexed),
+                    files_unchanged=sum(outcome["outcome"] == "unchanged" for outcome in outcomes),
+                    files_failed=sum(outcome["outcome"] == "failed" for outcome in outcomes),
+                    bytes_ingested=sum(outcome["size"] for outcome in outcomes if outcome["outcome"] != "failed"),
+                    chunks_indexed=chunks,
+                    # Chunks served from the embedding cache cost no embedding call
+                    embeddings_computed=current_misses - misses if current_misses is not None and misses is not None
+                    else chunks
+                )
+                misses = current_misses
+                checkpoint(outcomes)
+
+                if on_progress:
+                    on_progress(progress.snapshot())
+                if time.perf_counter() - last_report >= self.report_seconds:
+                    last_report = time.perf_counter()
+                    self._log(crawl_id, progress.snapshot())
+            if skipped:
+                checkpoint([])
+            completed = True
+        finally:
+            if not completed:
+                self.state.interrupt(crawl_id)
+        self.state.finish(crawl_id, progress.counts)
+
+        summary = progress.snapshot()
+        self._log(crawl_id, summary)
+        return {"crawl_id": crawl_id, "source": source.describe(), "category": category,
+                "resumed": begun["resumed"], **summary}
+
+    @staticmethod
+    def _log(crawl_id: str, snapshot: Dict[str, Any]) -> None:
+        logger.info(
+            f"Crawl {crawl_id}: {snapshot['files_indexed']} indexed, {snapshot['files_unchanged']} unchanged, "
+            f"{snapshot['files_skipped']} skipped, {snapshot['files_failed']} failed | "
+            f"{snapshot['files_per_second']} files/s, {snapshot['mb_per_second']} MB/s, "
+            f"{snapshot['embeddings_per_second']} embeddings/s"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawl a local directory or a Blob container into the search index")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--directory", help="local directory tree to ingest")
+    target.add_argument("--container", help="Azure Storage container to ingest")
+    parser.add_argument("--prefix", default="", help="only blobs whose names start with this prefix")
+    parser.add_argument("--category", default="general", help="category for the indexed documents")
+    parser.add_argument("--batch-files", type=int, help="files per checkpointed window (CRAWL_BATCH_FILES)")
+    parser.add_argument("--batch-mb", type=float, help="megabytes per window (CRAWL_BATCH_MB)")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from document_processor import DocumentProcessor
+
+    load_dotenv()
+    processor = DocumentProcessor()
+    if args.directory:
+        source = LocalDirectorySource(args.directory)
+    else:
+        source = BlobContainerSource(processor.blob_service_client, args.container, args.prefix,
+                                     processor.blob_upload_concurrency)
+
+    crawler = BulkCrawler(processor, batch_files=args.batch_files, batch_mb=args.batch_mb)
+    try:
+        summary = crawler.crawl(source, args.category)
+    except KeyboardInterrupt:
+        print("\n⏸️  Crawl interrupted - run the same command again to resume")
+        return
+    finally:
+        crawler.state.close()
+
+    print(f"\n📚 Crawl {'resumed and ' if summary['resumed'] else ''}completed: {summary['source']}")
+    print("=" * 50)
+    for name in ("files_processed",) + CrawlProgress.COUNTERS:
+        print(f"  {name:<22} {summary[name]}")
+    print(f"  {'files/s':<22} {summary['files_per_second']}")
+    print(f"  {'MB/s':<22} {summary['mb_per_second']}")
+    print(f"  {'embeddings/s':<22} {summary['embeddings_per_second']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,56 +5,68 @@ Handles uploading and processing various document types for the Knowledge Worker
 import os
 import hashlib
 import logging
-from typing import List, Dict, Any, Optional, BinaryIO
+from typing import List, Dict, Any, Optional, BinaryIO, Union
 from datetime import datetime, timezone
 import uuid
 import mimetypes
+from functools import cached_property
+from requests import HTTPError
 
-# Document processing libraries
-import PyPDF2
-from docx import Document
-from bs4 import BeautifulSoup
-import requests
+# Text extractor plugins (parsers are imported on first use)
+from extractors import FileSource, extract_file_content, extract_html, get_extractor_registry
 
-# Azure services
-from azure.storage.blob import BlobServiceClient
-from azure_search_service import AzureSearchService
+# Azure services (the Blob SDK is imported on first upload)
+from http_client import PooledHttpClient
+from service_container import ServiceContainer, get_service_container
+from text_chunker import TextChunker
+from ingestion_pipeline import IngestionPipeline
+from ingestion_manifest import IngestionManifest, get_ingestion_manifest
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+
 class DocumentProcessor:
     """Handles document processing and indexing for the knowledge worker agent"""
     
-    def __init__(self):
-        """Initialize the document processor"""
-        # Initialize Azure Storage client
-        storage_account_name = os.getenv("AZURE_STORAGE_ACCOUNT_NAME")
-        storage_account_key = os.getenv("AZURE_STORAGE_ACCOUNT_KEY")
-        self.container_name = os.getenv("AZURE_STORAGE_CONTAINER_NAME", "documents")
+    def __init__(self, services: Optional[ServiceContainer] = None):
+        """Initialize the document processor
         
-        if storage_account_name and storage_account_key:
-            self.blob_service_client = BlobServiceClient(
-                account_url=f"https://{storage_account_name}.blob.core.windows.net",
-                credential=storage_account_key
-            )
-        else:
-            self.blob_service_client = None
-            logger.warning("Azure Storage not configured - file upload disabled")
+        Storage, search and HTTP clients come from the shared service container
+        and are built on first use.
+        """
+        self.services = services or get_service_container()
+        self.container_name = os.getenv("AZURE_STORAGE_CONTAINER_NAME", "documents")
+        self.blob_upload_concurrency = int(os.getenv("AZURE_STORAGE_UPLOAD_MAX_CONCURRENCY", "2"))
         
-        # Initialize search service
-        self.search_service = AzureSearchService()
-          # Supported file types
-        self.supported_types = {
-            '.pdf': self._process_pdf,
-            '.docx': self._process_docx,
-            '.txt': self._process_text,
-            '.html': self._process_html,
-            '.htm': self._process_html,            '.md': self._process_markdown,
-            '.markdown': self._process_markdown
-        }
+        # Splits extracted text into token-bounded chunks, each indexed separately
+        self.chunker = TextChunker()
+        # Extractor plugins by file extension
+        self.extractors = get_extractor_registry()
+        # Chunks indexed (and checkpointed) per step of a background ingestion job
+        self.job_index_batch_chunks = int(os.getenv("JOB_INDEX_BATCH_CHUNKS", "64"))
         
+    @cached_property
+    def blob_service_client(self):
+        return self.services.blob_service_client()
+    
+    @cached_property
+    def search_service(self):
+        return self.services.search_service()
+    
+    @cached_property
+    def http_client(self) -> PooledHttpClient:
+        """Shared keep-alive HTTP pool for URL fetches"""
+        return self.services.http_client()
+    
+    @cached_property
+    def manifest(self) -> Optional[IngestionManifest]:
+        """Hashes of every ingested source, used to skip unchanged ones (None when disabled)"""
+        if os.getenv("INGESTION_MANIFEST_ENABLED", "true").lower() != "true":
+            return None
+        return get_ingestion_manifest(os.getenv("INGESTION_MANIFEST_DIR", ".cache/manifest"))
+    
     def _generate_document_id(self, filename: str, content: str) -> str:
         """Generate a unique document ID based on filename and content
         Azure Search document keys can only contain letters, digits, underscore (_), 
@@ -75,405 +87,518 @@ class DocumentProcessor:
         content_hash = hashlib.md5(content.encode()).hexdigest()[:8]
         return f"{sanitized_name}_{content_hash}"
     
-    def _process_pdf(self, file_content: bytes, filename: str) -> Dict[str, Any]:
-        """Extract text from PDF file"""
+    def upload_file(self, file_content: FileSource, filename: str) -> Optional[str]:
+        """Upload file to Azure Blob Storage (bytes, or a path streamed from disk)"""
         try:
-            import io
-            pdf_file = io.BytesIO(file_content)
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            
-            # Check if PDF is valid and has pages
-            if len(pdf_reader.pages) == 0:
-                logger.warning(f"PDF {filename} has no pages")
-                return {
-                    "success": False,
-                    "error": "PDF file has no pages"
-                }
-            
-            text_content = ""
-            pages_processed = 0
+            if not self.blob_service_client:
+                logger.warning("Azure Storage not configured - skipping file upload")
+                return None
             
-            for page_num, page in enumerate(pdf_reader.pages):
-                try:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text_content += page_text + "\n"
-                        pages_processed += 1
-                except Exception as page_error:
-                    logger.warning(f"Error extracting text from page {page_num + 1} of {filename}: {str(page_error)}")
-                    continue
+            blob_name = f"{datetime.now().strftime('%Y/%m/%d')}/{filename}"
+            blob_client = self.blob_service_client.get_blob_client(
+                container=self.container_name,
+                blob=blob_name
+            )
             
-            # Check if we extracted any text
-            if not text_content.strip():
-                logger.warning(f"No text could be extracted from PDF {filename}")
-                return {
-                    "success": False,
-                    "error": "No extractable text found in PDF file. This might be a scanned PDF or image-based PDF."
-                }
+            if isinstance(file_content, str):
+                # The SDK reads the stream in blocks, so the file is never fully in memory
+                with open(file_content, "rb") as data:
+                    blob_client.upload_blob(data, overwrite=True, max_concurrency=self.blob_upload_concurrency)
+            else:
+                blob_client.upload_blob(file_content, overwrite=True)
+            logger.info(f"File uploaded to blob storage: {blob_name}")
             
-            logger.info(f"Successfully extracted text from {pages_processed}/{len(pdf_reader.pages)} pages in {filename}")
+            return f"https://{os.getenv('AZURE_STORAGE_ACCOUNT_NAME')}.blob.core.windows.net/{self.container_name}/{blob_name}"
             
-            return {
-                "success": True,
-                "content": text_content.strip(),
-                "page_count": len(pdf_reader.pages),
-                "metadata": {
-                    "pages": len(pdf_reader.pages),
-                    "pages_processed": pages_processed,
-                    "file_type": "pdf"
-                }
-            }
         except Exception as e:
-            logger.error(f"Error processing PDF {filename}: {str(e)}")
+            logger.error(f"Error uploading file to blob storage: {str(e)}")
+            return None
+    
+    # ------------------------------------------------------------------ change detection
+    
+    def _source_hash(self, file_content: FileSource) -> Optional[str]:
+        return self.manifest.source_hash(file_content) if self.manifest is not None else None
+    
+    @staticmethod
+    def _manifest_key(source_key: Optional[str], filename: str, source_hash: Optional[str]) -> str:
+        """Manifest key of a file: the caller's source_key, else the file name plus its content hash
+        
+        Only a caller-supplied key (a crawled path, a blob name) identifies one
+        source across versions, so only then does a new version replace the
+        previously indexed document. Files without one are keyed by content,
+        so two different uploads that share a name are both kept.
+        """
+        return source_key or f"upload:{filename}#{source_hash}"
+    
+    def _unchanged_source(self, source_key: str, source_hash: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Manifest entry if these exact bytes were already indexed for the source"""
+        if self.manifest is None or source_hash is None:
+            return None
+        return self.manifest.unchanged_source(source_key, source_hash, self.search_service.document_exists)
+    
+    def _unchanged_text(self, source_key: str, text: str, source_hash: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Manifest entry if this extracted text was already indexed for the source"""
+        if self.manifest is None:
+            return None
+        return self.manifest.unchanged_text(source_key, text, source_hash, self.search_service.document_exists)
+    
+    @staticmethod
+    def _unchanged_result(entry: Dict[str, Any], category: str, reason: str, **source) -> Dict[str, Any]:
+        """API result for a source that is already indexed; reason is "source", "text" or "not_modified" """
+        return {
+            "success": True,
+            "document_id": entry["document_id"],
+            **source,
+            "chunk_count": len(entry["chunk_hashes"]),
+            "blob_url": entry["blob_url"],
+            "category": category,
+            "unchanged": reason
+        }
+    
+    def _record_ingestion(self, source_key: str, source_hash: Optional[str], document: Dict[str, Any],
+                          chunks: List[Dict[str, Any]], blob_url: Optional[str] = None) -> Dict[str, Any]:
+        """Record an indexed source in the manifest and delete the chunks of the version it replaces"""
+        if self.manifest is None:
+            return {}
+        changes = self.manifest.record(source_key, source_hash, document, chunks, blob_url)
+        stale_document_id = changes.pop("previous_document_id")
+        if stale_document_id:
+            # The text changed, so the previous version was indexed under another id
+            if self.search_service.delete_document(stale_document_id):
+                changes["replaced_document_id"] = stale_document_id
+                # Other sources indexed under the same id no longer have a document
+                self.manifest.remove_document(stale_document_id)
+            else:
+                logger.warning(f"Could not delete stale document '{stale_document_id}' for {source_key}")
+        return changes
+    
+    # ------------------------------------------------------------------ files
+    
+    def _build_file_document(self, file_content: FileSource, filename: str, category: str,
+                             processing_result: Dict[str, Any], blob_url: Optional[str] = None) -> Dict[str, Any]:
+        """Upload the file (unless it is already stored at blob_url) and build its search document and chunks"""
+        if not processing_result["content"].strip():
             return {
                 "success": False,
-                "error": f"PDF processing failed: {str(e)}"
+                "error": "No extractable text content found in file"
             }
+        
+        # Upload file to blob storage
+        blob_url = blob_url or self.upload_file(file_content, filename)
+        document = self._file_document(file_content, filename, category, processing_result, blob_url)
+        
+        return {
+            "success": True,
+            "document": document,
+            "chunks": self.chunker.chunk_document(document),
+            "blob_url": blob_url,
+            "processing_details": processing_result.get("metadata", {})
+        }
     
-    def _process_docx(self, file_content: bytes, filename: str) -> Dict[str, Any]:
-        """Extract text from Word document"""
-        try:
-            import io
-            docx_file = io.BytesIO(file_content)
-            doc = Document(docx_file)
-            
-            text_content = ""
-            for paragraph in doc.paragraphs:
-                text_content += paragraph.text + "\n"
-            
-            return {
-                "success": True,
-                "content": text_content.strip(),
-                "paragraph_count": len(doc.paragraphs),
-                "metadata": {
-                    "paragraphs": len(doc.paragraphs),
-                    "file_type": "docx"
-                }
-            }
-        except Exception as e:
-            logger.error(f"Error processing DOCX {filename}: {str(e)}")
-            return {
-                "success": False,
-                "error": str(e)
+    def _file_document(self, file_content: FileSource, filename: str, category: str,
+                       processing_result: Dict[str, Any], blob_url: Optional[str]) -> Dict[str, Any]:
+        """Build the search document for a file from its extracted text"""
+        content = processing_result["content"]
+        
+        # Generate document ID
+        document_id = self._generate_document_id(filename, content)
+        # Prepare document for indexing
+        document = {
+            "id": document_id,
+            "title": os.path.splitext(filename)[0],
+            "content": content,
+            "source": blob_url or filename,
+            "category": category,
+            "created_date": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "metadata": {
+                "original_filename": filename,
+                "file_size": os.path.getsize(file_content) if isinstance(file_content, str) else len(file_content),
+                "content_length": len(content),
+                **processing_result.get("metadata", {})
             }
+        }
+        return document
     
-    def _process_text(self, file_content: bytes, filename: str) -> Dict[str, Any]:
-        """Process plain text file"""
-        try:
-            text_content = file_content.decode('utf-8')
-            
+    def _index_chunks(self, chunks: List[Dict[str, Any]]) -> Union[bool, str]:
+        """Embed and bulk index the chunk documents of one parent document"""
+        if not chunks:
+            return "No chunks to index"
+        
+        for result in self.search_service.index_documents(chunks):
+            if not result["success"]:
+                return result["error"] or False
+        return True
+    
+    def _index_prepared_document(self, prepared: Dict[str, Any], filename: str, category: str) -> Dict[str, Any]:
+        """Index a document produced by _build_file_document and build the API result"""
+        document = prepared["document"]
+        document_id = document["id"]
+        
+        indexing_result = self._index_chunks(prepared["chunks"])
+        if indexing_result is True:
             return {
                 "success": True,
-                "content": text_content.strip(),
-                "character_count": len(text_content),
-                "metadata": {
-                    "characters": len(text_content),
-                    "lines": len(text_content.split('\n')),
-                    "file_type": "text"
-                }
+                "document_id": document_id,
+                "filename": filename,
+                "content_length": len(document["content"]),
+                "chunk_count": len(prepared["chunks"]),
+                "blob_url": prepared["blob_url"],
+                "category": category,
+                "processing_details": prepared["processing_details"]
             }
-        except Exception as e:
-            logger.error(f"Error processing text file {filename}: {str(e)}")
+        else:
             return {
                 "success": False,
-                "error": str(e)
+                "document_id": document_id,
+                "filename": filename,
+                "error": indexing_result if isinstance(indexing_result, str) else "Failed to index document in search service"
             }
     
-    def _process_html(self, file_content: bytes, filename: str) -> Dict[str, Any]:
-        """Extract text from HTML file"""
+    def process_file(self, file_content: FileSource, filename: str, category: str = "general",
+                     source_key: Optional[str] = None) -> Dict[str, Any]:
+        """Process a file (bytes or a path on disk) and index it in Azure Search
+        
+        source_key identifies the file across re-ingestion; when given, a new
+        version replaces the document indexed for the key before. A file whose
+        bytes or extracted text are unchanged since it was last indexed is not
+        uploaded or indexed again; the result then carries "unchanged".
+        """
         try:
-            html_content = file_content.decode('utf-8')
-            soup = BeautifulSoup(html_content, 'html.parser')
+            source_hash = self._source_hash(file_content)
+            source_key = self._manifest_key(source_key, filename, source_hash)
+            entry = self._unchanged_source(source_key, source_hash)
+            if entry:
+                return self._unchanged_result(entry, category, "source", filename=filename)
             
-            # Remove script and style elements
-            for script in soup(["script", "style"]):
-                script.decompose()
+            processing_result = extract_file_content(file_content, filename)
+            if not processing_result["success"]:
+                return processing_result
             
-            # Get text content
-            text_content = soup.get_text()
+            entry = self._unchanged_text(source_key, processing_result["content"], source_hash)
+            if entry:
+                return self._unchanged_result(entry, category, "text", filename=filename)
             
-            # Clean up whitespace
-            lines = (line.strip() for line in text_content.splitlines())
-            chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-            text_content = ' '.join(chunk for chunk in chunks if chunk)
+            prepared = self._build_file_document(file_content, filename, category, processing_result)
+            if not prepared["success"]:
+                return prepared
             
-            return {
-                "success": True,
-                "content": text_content,                "metadata": {
-                    "title": soup.title.string if soup.title else None,
-                    "file_type": "html"
-                }
-            }
+            result = self._index_prepared_document(prepared, filename, category)
+            if result["success"]:
+                result.update(self._record_ingestion(source_key, source_hash, prepared["document"],
+                                                     prepared["chunks"], prepared["blob_url"]))
+            return result
+                
         except Exception as e:
-            logger.error(f"Error processing HTML {filename}: {str(e)}")
+            logger.error(f"Error processing file {filename}: {str(e)}")
             return {
                 "success": False,
                 "error": str(e)
             }
     
-    def _process_markdown(self, file_content: bytes, filename: str) -> Dict[str, Any]:
-        """Process markdown file"""
-        try:
-            text_content = file_content.decode('utf-8')
-            
-            # Extract title from first heading if available
-            lines = text_content.split('\n')
-            title = None
-            for line in lines:
-                if line.startswith('# '):
-                    title = line[2:].strip()
-                    break
-            
-            return {
-                "success": True,
-                "content": text_content.strip(),
-                "character_count": len(text_content),
-                "metadata": {
-                    "characters": len(text_content),
-                    "lines": len(text_content.split('\n')),
-                    "title": title,
-                    "file_type": "markdown"
-                }
-            }
-        except Exception as e:
-            logger.error(f"Error processing markdown file {filename}: {str(e)}")
-            return {
-                "success": False,
-                "error": str(e)
-            }
+    def process_file_path(self, file_path: str, filename: str, category: str = "general",
+                          source_key: Optional[str] = None) -> Dict[str, Any]:
+        """Process a file spooled to disk without loading its raw bytes into memory"""
+        return self.process_file(file_path, filename, category, source_key)
     
-    def _process_markdown(self, file_content: bytes, filename: str) -> Dict[str, Any]:
-        """Process markdown file"""
-        try:
-            text_content = file_content.decode('utf-8')
-            
-            # Extract title from first heading if available
-            lines = text_content.split('\n')
-            title = None
-            for line in lines:
-                if line.startswith('# '):
-                    title = line[2:].strip()
-                    break
-            
+    # ------------------------------------------------------------------ URLs
+    
+    def _fetch_url_document(self, url: str, category: str,
+                            validators: Optional[Dict[str, Optional[str]]] = None) -> Dict[str, Any]:
+        """Fetch a web page and build its search document (without indexing it)
+        
+        With validators from an earlier fetch ({"etag", "last_modified"}) the
+        request is conditional; a 304 returns {"success": True, "not_modified": True}.
+        """
+        headers = {}
+        if validators:
+            if validators.get("etag"):
+                headers["If-None-Match"] = validators["etag"]
+            if validators.get("last_modified"):
+                headers["If-Modified-Since"] = validators["last_modified"]
+        
+        # Fetch the web page
+        response = self.http_client.get(url, timeout=30, headers=headers)
+        if response.status_code == 304 and headers:
             return {
                 "success": True,
-                "content": text_content.strip(),
-                "character_count": len(text_content),
-                "metadata": {
-                    "characters": len(text_content),
-                    "lines": len(text_content.split('\n')),
-                    "title": title,
-                    "file_type": "markdown"
+                "not_modified": True,
+                "validators": {
+                    "etag": response.headers.get("ETag") or validators.get("etag"),
+                    "last_modified": response.headers.get("Last-Modified") or validators.get("last_modified")
                 }
             }
-        except Exception as e:
-            logger.error(f"Error processing markdown file {filename}: {str(e)}")
+        response.raise_for_status()
+        
+        # Process as HTML
+        processing_result = extract_html(response.content, url)
+        
+        if not processing_result["success"]:
+            return processing_result
+        
+        content = processing_result["content"]
+        
+        if not content.strip():
             return {
                 "success": False,
-                "error": str(e)
+                "error": "No extractable text content found at URL"
             }
-    
-    def upload_file(self, file_content: bytes, filename: str) -> Optional[str]:
-        """Upload file to Azure Blob Storage"""
-        try:
-            if not self.blob_service_client:
-                logger.warning("Azure Storage not configured - skipping file upload")
-                return None
-            
-            blob_name = f"{datetime.now().strftime('%Y/%m/%d')}/{filename}"
-            blob_client = self.blob_service_client.get_blob_client(
-                container=self.container_name,
-                blob=blob_name
-            )
-            
-            blob_client.upload_blob(file_content, overwrite=True)
-            logger.info(f"File uploaded to blob storage: {blob_name}")
-            
-            return f"https://{os.getenv('AZURE_STORAGE_ACCOUNT_NAME')}.blob.core.windows.net/{self.container_name}/{blob_name}"
-            
-        except Exception as e:
-            logger.error(f"Error uploading file to blob storage: {str(e)}")
-            return None
-    
-    def process_file(self, file_content: bytes, filename: str, category: str = "general") -> Dict[str, Any]:
-        """Process a file and index it in Azure Search"""
-        try:
-            # Determine file type
-            file_extension = os.path.splitext(filename)[1].lower()
-            
-            if file_extension not in self.supported_types:
-                return {
-                    "success": False,
-                    "error": f"Unsupported file type: {file_extension}",
-                    "supported_types": list(self.supported_types.keys())
-                }
-            
-            # Process the file content
-            processor = self.supported_types[file_extension]
-            processing_result = processor(file_content, filename)
-            
-            if not processing_result["success"]:
-                return processing_result
-            
-            content = processing_result["content"]
-            
-            if not content.strip():
-                return {
-                    "success": False,
-                    "error": "No extractable text content found in file"
-                }
-            
-            # Upload file to blob storage
-            blob_url = self.upload_file(file_content, filename)
-            
-            # Generate document ID
-            document_id = self._generate_document_id(filename, content)
-              # Prepare document for indexing
-            document = {
+        
+        # Generate document ID
+        document_id = self._generate_document_id(url, content)
+        
+        # Prepare document for indexing
+        return {
+            "success": True,
+            "validators": {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified")
+            },
+            "document": {
                 "id": document_id,
-                "title": os.path.splitext(filename)[0],
+                "title": processing_result.get("metadata", {}).get("title") or url,
                 "content": content,
-                "source": blob_url or filename,
+                "source": url,
                 "category": category,
-                "created_date": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "created_date": datetime.now().isoformat(),
                 "metadata": {
-                    "original_filename": filename,
-                    "file_size": len(file_content),
+                    "url": url,
                     "content_length": len(content),
+                    "fetch_date": datetime.now().isoformat(),
                     **processing_result.get("metadata", {})
                 }
             }
-            
-            # Index the document
-            indexing_result = self.search_service.index_document(document)
-            if indexing_result is True:
-                return {
+        }
+    
+    @staticmethod
+    def _url_result(url: str, document: Dict[str, Any], chunk_count: int, category: str) -> Dict[str, Any]:
+        return {
+            "success": True,
+            "document_id": document["id"],
+            "url": url,
+            "title": document["title"],
+            "content_length": len(document["content"]),
+            "chunk_count": chunk_count,
+            "category": category
+        }
+    
+    def process_url(self, url: str, category: str = "web",
+                    validators: Optional[Dict[str, Optional[str]]] = None) -> Dict[str, Any]:
+        """Process content from a URL, skipping indexing if its text is unchanged
+        
+        Pass the "validators" of an earlier result to re-fetch conditionally:
+        when the server answers 304 Not Modified, nothing is extracted or embedded.
+        """
+        try:
+            fetched = self._fetch_url_document(url, category, validators)
+            if not fetched["success"]:
+                return fetched
+            if fetched.get("not_modified"):
+                entry = self.manifest.get(url) if self.manifest is not None else None
+                if self.manifest is not None and (entry is None or not self.search_service.document_exists(entry["document_id"])):
+                    # The page is unchanged but its document is gone from the index; fetch it in full
+                    if entry is not None:
+                        self.manifest.remove(url)
+                    return self.process_url(url, category)
+                result = self._unchanged_result(entry, category, "not_modified", url=url) if entry else {
                     "success": True,
-                    "document_id": document_id,
-                    "filename": filename,
-                    "content_length": len(content),
-                    "blob_url": blob_url,
+                    "url": url,
                     "category": category,
-                    "processing_details": processing_result.get("metadata", {})
+                    "unchanged": "not_modified"
                 }
+                result["validators"] = fetched["validators"]
+                return result
+            document = fetched["document"]
+            
+            entry = self._unchanged_text(url, document["content"])
+            if entry:
+                result = self._unchanged_result(entry, category, "text", url=url)
+                result["validators"] = fetched["validators"]
+                return result
+            
+            # Index the document as token-bounded chunks
+            chunks = self.chunker.chunk_document(document)
+            indexing_success = self._index_chunks(chunks)
+            
+            if indexing_success is True:
+                result = self._url_result(url, document, len(chunks), category)
+                result.update(self._record_ingestion(url, None, document, chunks))
+                result["validators"] = fetched["validators"]
+                return result
             else:
                 return {
                     "success": False,
-                    "document_id": document_id,
-                    "filename": filename,
-                    "error": indexing_result if isinstance(indexing_result, str) else "Failed to index document in search service"
+                    "error": "Failed to index document in search service"
                 }
                 
+        except HTTPError as e:
+            logger.error(f"Error processing URL {url}: {str(e)}")
+            return {
+                "success": False,
+                "error": str(e),
+                "status_code": e.response.status_code if e.response is not None else None
+            }
         except Exception as e:
-            logger.error(f"Error processing file {filename}: {str(e)}")
+            logger.error(f"Error processing URL {url}: {str(e)}")
             return {
                 "success": False,
                 "error": str(e)
             }
     
-    def process_url(self, url: str, category: str = "web") -> Dict[str, Any]:
-        """Process content from a URL"""
-        try:
-            # Fetch the web page
-            response = requests.get(url, timeout=30)
-            response.raise_for_status()
-            
-            # Process as HTML
-            processing_result = self._process_html(response.content, url)
-            
+    # ------------------------------------------------------------------ resumable jobs
+    # Used by the ingestion job queue. The job argument carries the checkpoint of
+    # earlier attempts (see job_queue.JobContext): stages already recorded there
+    # are skipped, and chunks are indexed in slices so a retry resumes after the
+    # last slice that was stored. Errors that a retry cannot fix are returned as
+    # {"success": False, ...}; anything raised is retried.
+    
+    def _index_chunks_resumably(self, job, chunks: List[Dict[str, Any]]) -> None:
+        """Index chunks in slices, checkpointing how many are stored"""
+        indexed = job.checkpoint.get("indexed_chunks", 0)
+        while indexed < len(chunks):
+            job.report("indexing", 0.4 + 0.6 * indexed / len(chunks),
+                       f"Indexed {indexed} of {len(chunks)} chunks")
+            batch = chunks[indexed:indexed + self.job_index_batch_chunks]
+            indexing_result = self._index_chunks(batch)
+            if indexing_result is not True:
+                raise RuntimeError(indexing_result if isinstance(indexing_result, str)
+                                   else "Failed to index document in search service")
+            indexed += len(batch)
+            job.save_checkpoint(indexed_chunks=indexed)
+    
+    def process_file_job(self, job, file_path: str, filename: str, category: str = "general",
+                         source_key: Optional[str] = None) -> Dict[str, Any]:
+        """Process a spooled file as a resumable job: extract, upload, then index in slices"""
+        document = job.load_artifact("document")
+        if document is None:
+            if "source_hash" not in job.checkpoint:
+                job.save_checkpoint(source_hash=self._source_hash(file_path))
+            source_hash = job.checkpoint["source_hash"]
+            manifest_key = self._manifest_key(source_key, filename, source_hash)
+            entry = self._unchanged_source(manifest_key, source_hash)
+            if entry:
+                return self._unchanged_result(entry, category, "source", filename=filename)
+            
+            job.report("extracting", 0.05, f"Extracting text from {filename}")
+            processing_result = extract_file_content(file_path, filename)
             if not processing_result["success"]:
                 return processing_result
-            
-            content = processing_result["content"]
-            
-            if not content.strip():
+            if not processing_result["content"].strip():
                 return {
                     "success": False,
-                    "error": "No extractable text content found at URL"
-                }
-            
-            # Generate document ID
-            document_id = self._generate_document_id(url, content)
-            
-            # Prepare document for indexing
-            document = {
-                "id": document_id,
-                "title": processing_result.get("metadata", {}).get("title") or url,
-                "content": content,
-                "source": url,
-                "category": category,
-                "created_date": datetime.now().isoformat(),
-                "metadata": {
-                    "url": url,
-                    "content_length": len(content),
-                    "fetch_date": datetime.now().isoformat(),
-                    **processing_result.get("metadata", {})
+                    "error": "No extractable text content found in file"
                 }
-            }
+            entry = self._unchanged_text(manifest_key, processing_result["content"], source_hash)
+            if entry:
+                return self._unchanged_result(entry, category, "text", filename=filename)
             
-            # Index the document
-            indexing_success = self.search_service.index_document(document)
+            if "blob_url" not in job.checkpoint:
+                job.report("uploading", 0.25, "Uploading to blob storage")
+                job.save_checkpoint(blob_url=self.upload_file(file_path, filename))
             
-            if indexing_success:
-                return {
-                    "success": True,
-                    "document_id": document_id,
-                    "url": url,
-                    "title": document["title"],
-                    "content_length": len(content),
-                    "category": category
-                }
+            document = self._file_document(file_path, filename, category, processing_result,
+                                           job.checkpoint["blob_url"])
+            job.save_artifact("document", document)
+        
+        chunks = self.chunker.chunk_document(document)
+        self._index_chunks_resumably(job, chunks)
+        return {
+            "success": True,
+            "document_id": document["id"],
+            "filename": filename,
+            "content_length": len(document["content"]),
+            "chunk_count": len(chunks),
+            "blob_url": job.checkpoint["blob_url"],
+            "category": category,
+            **self._record_ingestion(self._manifest_key(source_key, filename, job.checkpoint.get("source_hash")),
+                                     job.checkpoint.get("source_hash"), document, chunks, job.checkpoint["blob_url"])
+        }
+    
+    def process_url_job(self, job, url: str, category: str = "web") -> Dict[str, Any]:
+        """Process a URL as a resumable job: fetch and extract, then index in slices"""
+        document = job.load_artifact("document")
+        if document is None:
+            job.report("fetching", 0.05, f"Fetching {url}")
+            try:
+                fetched = self._fetch_url_document(url, category)
+            except HTTPError as e:
+                # Client errors other than throttling will not go away on retry
+                status_code = e.response.status_code if e.response is not None else 500
+                if status_code < 500 and status_code != 429:
+                    return {
+                        "success": False,
+                        "error": str(e)
+                    }
+                raise
+            if not fetched["success"]:
+                return fetched
+            document = fetched["document"]
+            entry = self._unchanged_text(url, document["content"])
+            if entry:
+                return self._unchanged_result(entry, category, "text", url=url)
+            job.save_artifact("document", document)
+        
+        chunks = self.chunker.chunk_document(document)
+        self._index_chunks_resumably(job, chunks)
+        result = self._url_result(url, document, len(chunks), category)
+        result.update(self._record_ingestion(url, None, document, chunks))
+        return result
+    
+    def batch_process_files(self, files: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Process multiple files in batch
+        
+        Files flow through a staged pipeline (extract -> prepare -> embed -> index)
+        so parsing, blob uploads, embedding and indexing of different files overlap.
+        A file is skipped before extraction when its bytes are unchanged since it
+        was last indexed (matched by its "source_key", default the filename plus
+        content hash), and after extraction when its text is unchanged. Results
+        follow the order of files.
+        "content" may be bytes or a file path; files that already live in Blob
+        Storage can pass "blob_url" to skip the upload.
+        """
+        sources: Dict[int, tuple] = {}
+        
+        def skip_unchanged(position: int, processing_result: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+            if processing_result is None:
+                file_info = files[position]
+                source_hash = self._source_hash(file_info["content"])
+                source_key = self._manifest_key(file_info.get("source_key"), file_info["filename"], source_hash)
+                sources[position] = (source_key, source_hash)
+                entry, reason = self._unchanged_source(source_key, source_hash), "source"
             else:
-                return {
-                    "success": False,
-                    "error": "Failed to index document in search service"
-                }
-                
-        except Exception as e:
-            logger.error(f"Error processing URL {url}: {str(e)}")
+                source_key, source_hash = sources[position]
+                entry, reason = self._unchanged_text(source_key, processing_result["content"], source_hash), "text"
+            if entry is None:
+                return None
             return {
-                "success": False,
-                "error": str(e)
+                "document_id": entry["document_id"],
+                "chunk_count": len(entry["chunk_hashes"]),
+                "unchanged": reason
             }
-    
-    def batch_process_files(self, files: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Process multiple files in batch"""
-        results = {
-            "successful": [],
-            "failed": [],
-            "total_processed": 0,
-            "total_files": len(files)
-        }
         
-        for file_info in files:
-            try:
-                result = self.process_file(
-                    file_content=file_info["content"],
-                    filename=file_info["filename"],
-                    category=file_info.get("category", "general")
-                )
-                
-                results["total_processed"] += 1
-                
-                if result["success"]:
-                    results["successful"].append({
-                        "filename": file_info["filename"],
-                        "document_id": result["document_id"]
-                    })
-                else:
-                    results["failed"].append({
-                        "filename": file_info["filename"],
-                        "error": result["error"]
-                    })
-                    
-            except Exception as e:
-                results["failed"].append({
-                    "filename": file_info.get("filename", "unknown"),
-                    "error": str(e)
-                })
+        def record(position: int, prepared: Dict[str, Any]) -> None:
+            source_key, source_hash = sources[position]
+            self._record_ingestion(source_key, source_hash, prepared["document"], prepared["chunks"],
+                                   prepared["blob_url"])
         
+        pipeline = IngestionPipeline(
+            extract=extract_file_content,
+            prepare=self._build_file_document,
+            search_service=self.search_service,
+            on_indexed=record,
+            skip=skip_unchanged
+        )
+        results = pipeline.run(files)
+        results["unchanged"] = sum(1 for result in results["successful"] if result.get("unchanged"))
         return results
     
+    def delete_document(self, document_id: str) -> bool:
+        """Delete a document from the search index and forget the sources recorded for it"""
+        if not self.search_service.delete_document(document_id):
+            return False
+        if self.manifest is not None:
+            self.manifest.remove_document(document_id)
+        return True
+    
     def get_processing_statistics(self) -> Dict[str, Any]:
         """Get statistics about processed documents"""
         try:
@@ -482,11 +607,16 @@ class DocumentProcessor:
             return {
                 "total_documents": search_stats.get("document_count", 0),
                 "index_size": search_stats.get("storage_size", 0),
-                "supported_file_types": list(self.supported_types.keys()),
-                "storage_configured": self.blob_service_client is not None
+                "supported_file_types": self.extractors.supported_types(),
+                "extractors": self.extractors.get_statistics(),
+                "ingestion_manifest": self.manifest.get_statistics() if self.manifest else None,
+                "storage_configured": self.blob_service_client is not None,
+                "embedding_cache": self.search_service.get_embedding_cache_statistics(),
+                "query_cache": self.search_service.get_query_cache_statistics()
             }
         except Exception as e:
             logger.error(f"Error getting processing statistics: {str(e)}")
             return {
                 "error": str(e)
             }
+
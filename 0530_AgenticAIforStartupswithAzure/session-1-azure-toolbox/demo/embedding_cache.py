@@ -0,0 +1,190 @@
+"""
+Persistent embedding cache for the Knowledge Worker Agent
+Stores embedding vectors on disk so unchanged text is never embedded twice
+"""
+import os
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+import unicodedata
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class EmbeddingCache:
+    """Content-addressed, size-capped embedding cache backed by a memory-mapped matrix
+
+    Vectors live in a fixed-capacity ``vectors.dat`` matrix (one row per slot) and a
+    small SQLite index maps cache keys to rows. When the cache is full the least
+    recently used row is overwritten.
+    """
+
+    def __init__(self, cache_dir: str, dimensions: int, max_entries: int = 50000, dtype: str = "float16"):
+        """Open (or create) the cache in cache_dir"""
+        self.cache_dir = cache_dir
+        self.dimensions = dimensions
+        self.max_entries = max_entries
+        self.dtype = np.dtype(dtype)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(cache_dir, "index.db"), check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, slot INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+
+        # Drop the cache if it was created with a different layout
+        layout = f"{dimensions}:{max_entries}:{self.dtype.name}"
+        row = self._db.execute("SELECT value FROM meta WHERE name = 'layout'").fetchone()
+        vectors_path = os.path.join(cache_dir, "vectors.dat")
+        if row is None or row[0] != layout or not os.path.exists(vectors_path):
+            if row is not None:
+                logger.warning(f"Embedding cache layout changed ({row[0]} -> {layout}), resetting cache")
+            self._db.execute("DELETE FROM entries")
+            self._db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('layout', ?)", (layout,))
+            self._db.commit()
+            mode = "w+"
+        else:
+            mode = "r+"
+
+        self._vectors = np.memmap(vectors_path, dtype=self.dtype, mode=mode, shape=(max_entries, dimensions))
+        self._count = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        logger.info(f"Embedding cache opened at '{cache_dir}' with {self._count}/{max_entries} entries")
+
+    @staticmethod
+    def make_key(text: str, deployment: str, dimensions: int) -> str:
+        """Build the cache key from normalized text, deployment name and dimension"""
+        normalized = " ".join(unicodedata.normalize("NFC", text).split())
+        digest = hashlib.sha256(f"{deployment}\n{dimensions}\n{normalized}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def get_many(self, keys: List[str]) -> List[Optional[List[float]]]:
+        """Look up vectors for keys, returning None for misses (in input order)"""
+        if not keys:
+            return []
+
+        with self._lock:
+            slots = {}
+            unique_keys = list(set(keys))
+            for start in range(0, len(unique_keys), 500):
+                chunk = unique_keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._db.execute(
+                    f"SELECT key, slot FROM entries WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                slots.update(rows)
+
+            results = []
+            for key in keys:
+                slot = slots.get(key)
+                if slot is None:
+                    self.misses += 1
+                    results.append(None)
+                else:
+                    self.hits += 1
+                    results.append(self._vectors[slot].astype(np.float32).tolist())
+
+            if slots:
+                now = time.time()
+                self._db.executemany(
+                    "UPDATE entries SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in slots]
+                )
+                self._db.commit()
+            return results
+
+    def get(self, key: str) -> Optional[List[float]]:
+        """Look up a single vector"""
+        return self.get_many([key])[0]
+
+    def put_many(self, items: Dict[str, List[float]]) -> None:
+        """Store vectors, evicting least recently used entries when full"""
+        with self._lock:
+            now = time.time()
+            for key, vector in items.items():
+                if not vector or len(vector) != self.dimensions:
+                    continue
+
+                row = self._db.execute("SELECT slot FROM entries WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    slot = row[0]
+                elif self._count < self.max_entries:
+                    # Slots stay dense because evictions reuse the freed row
+                    slot = self._count
+                    self._count += 1
+                else:
+                    oldest_key, slot = self._db.execute(
+                        "SELECT key, slot FROM entries ORDER BY last_access LIMIT 1"
+                    ).fetchone()
+                    self._db.execute("DELETE FROM entries WHERE key = ?", (oldest_key,))
+                    self.evictions += 1
+
+                self._vectors[slot] = np.asarray(vector, dtype=self.dtype)
+                self._db.execute(
+                    "INSERT OR REPLACE INTO entries (key, slot, last_access) VALUES (?, ?, ?)",
+                    (key, slot, now)
+                )
+
+            self._vectors.flush()
+            self._db.commit()
+
+    def put(self, key: str, vector: List[float]) -> None:
+        """Store a single vector"""
+        self.put_many({key: vector})
+
+    def clear(self) -> None:
+        """Remove every entry from the cache"""
+        with self._lock:
+            self._db.execute("DELETE FROM entries")
+            self._db.commit()
+            self._count = 0
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Return hit/miss counters and occupancy"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": self._count,
+            "max_entries": self.max_entries,
+            "dtype": self.dtype.name,
+            "size_bytes": self.max_entries * self.dimensions * self.dtype.itemsize
+        }
+
+    def close(self) -> None:
+        """Flush vectors and close the index database"""
+        with self._lock:
+            self._vectors.flush()
+            self._db.close()
+
+
+_shared_caches: Dict[str, EmbeddingCache] = {}
+_shared_lock = threading.Lock()
+
+
+def get_embedding_cache(cache_dir: str, dimensions: int, max_entries: int = 50000, dtype: str = "float16") -> EmbeddingCache:
+    """Return the process-wide cache for cache_dir
+
+    Every service in a process must share one instance per directory, otherwise
+    each would track its own slot allocation over the same files.
+    """
+    key = os.path.abspath(cache_dir)
+    with _shared_lock:
+        if key not in _shared_caches:
+            _shared_caches[key] = EmbeddingCache(cache_dir, dimensions, max_entries, dtype)
+        return _shared_caches[key]
@@ -0,0 +1,205 @@
+"""
+Execution limits for the Knowledge Worker Agent web app
+Caps concurrent work per route class, runs blocking work on per-route worker pools and sheds load when saturated
+"""
+import os
+import math
+import time
+import asyncio
+import logging
+import threading
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Route class -> (concurrency, queue length, queue timeout seconds, own worker pool).
+# Chat and search await async clients and need no threads of their own; uploads
+# and URLs only spool and queue work for the ingestion job workers; status checks
+# run blocking SDK calls, so they get a pool sized to their concurrency and
+# cannot occupy the threads other routes rely on.
+ROUTE_DEFAULTS = {
+    "chat": (8, 16, 5.0, False),
+    "search": (16, 32, 2.0, False),
+    "upload": (4, 8, 10.0, False),
+    "url": (8, 16, 5.0, False),
+    "status": (2, 4, 5.0, True),
+}
+
+
+class Overloaded(Exception):
+    """Raised when a route has no free slot; the request should be retried after retry_after seconds"""
+
+    def __init__(self, route: str, reason: str, retry_after: int, queued: int):
+        super().__init__(f"The {route} service is busy ({reason}), retry in {retry_after}s")
+        self.route = route
+        self.reason = reason
+        self.retry_after = retry_after
+        self.queued = queued
+
+
+class RouteLimiter:
+    """Concurrency limit with a bounded wait queue for one route class
+
+    At most max_concurrency requests hold a slot. Up to max_queue more wait
+    for one, each for at most queue_timeout seconds; anything beyond that is
+    rejected at once with Overloaded, whose retry_after estimates how long the
+    current queue takes to drain from the average time a slot is held.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, queue_timeout: float,
+                 workers: bool = False):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix=f"route-{name}") \
+            if workers else None
+
+        self.in_flight = 0
+        self.queued = 0
+        self.peak_in_flight = 0
+        self.peak_queued = 0
+        self.admitted = 0
+        self.completed = 0
+        self.rejected = {"queue_full": 0, "queue_timeout": 0}
+        self.wait_seconds = 0.0
+        self.busy_seconds = 0.0
+
+    def retry_after(self) -> int:
+        """Seconds until the current queue is expected to drain (1 to 60)"""
+        held = self.busy_seconds / self.completed if self.completed else 1.0
+        return max(1, min(60, math.ceil(held * (self.queued + 1) / self.max_concurrency)))
+
+    def _reject(self, reason: str) -> Overloaded:
+        self.rejected[reason] += 1
+        logger.warning(f"Shedding {self.name} request: {reason} "
+                       f"({self.in_flight} in flight, {self.queued} queued)")
+        return Overloaded(self.name, reason.replace("_", " "), self.retry_after(), self.queued)
+
+    def check(self) -> None:
+        """Raise Overloaded if a request arriving now would be rejected without queueing"""
+        if self._semaphore.locked() and self.queued >= self.max_queue:
+            raise self._reject("queue_full")
+
+    async def acquire(self) -> Callable[[], None]:
+        """Wait for a slot and return the function that releases it (safe to call more than once)"""
+        self.check()
+
+        waited = time.perf_counter()
+        if not self._semaphore.locked():
+            # A slot is free; acquire() returns without suspending
+            await self._semaphore.acquire()
+        else:
+            self.queued += 1
+            self.peak_queued = max(self.peak_queued, self.queued)
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise self._reject("queue_timeout") from None
+            finally:
+                self.queued -= 1
+
+        started = time.perf_counter()
+        self.wait_seconds += started - waited
+        self.admitted += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        released = False
+
+        def release() -> None:
+            nonlocal released
+            if released:
+                return
+            released = True
+            self.in_flight -= 1
+            self.completed += 1
+            self.busy_seconds += time.perf_counter() - started
+            self._semaphore.release()
+
+        return release
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one of the route's slots for the duration of the block"""
+        release = await self.acquire()
+        try:
+            yield
+        finally:
+            release()
+
+    async def call(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run blocking work on the route's worker pool (the caller should already hold a slot)"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Wait for a slot, then run blocking work on the route's worker pool"""
+        async with self.slot():
+            return await self.call(func, *args, **kwargs)
+
+    def get_statistics(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "worker_threads": self.max_concurrency if self._executor else 0,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queued,
+            "peak_in_flight": self.peak_in_flight,
+            "peak_queue_depth": self.peak_queued,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "avg_wait_ms": round(self.wait_seconds * 1000 / self.admitted, 1) if self.admitted else 0.0,
+            "avg_busy_ms": round(self.busy_seconds * 1000 / self.completed, 1) if self.completed else 0.0,
+            "retry_after_seconds": self.retry_after()
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+
+class ExecutionLimits:
+    """The route limiters of one server process, configured from LIMIT_<ROUTE>_* environment settings"""
+
+    def __init__(self):
+        self.limiters: Dict[str, RouteLimiter] = {}
+        for name, (concurrency, queue, timeout, workers) in ROUTE_DEFAULTS.items():
+            prefix = f"LIMIT_{name.upper()}"
+            self.limiters[name] = RouteLimiter(
+                name,
+                max_concurrency=max(1, int(os.getenv(f"{prefix}_CONCURRENCY", str(concurrency)))),
+                max_queue=max(0, int(os.getenv(f"{prefix}_QUEUE", str(queue)))),
+                queue_timeout=float(os.getenv(f"{prefix}_QUEUE_TIMEOUT_SECONDS", str(timeout))),
+                workers=workers
+            )
+
+    def __getitem__(self, name: str) -> RouteLimiter:
+        return self.limiters[name]
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Return each route's limits, occupancy, queue depth and rejections"""
+        return {name: limiter.get_statistics() for name, limiter in self.limiters.items()}
+
+    def shutdown(self) -> None:
+        """Stop the worker pools"""
+        for limiter in self.limiters.values():
+            limiter.shutdown()
+
+
+_shared_limits: Optional[ExecutionLimits] = None
+_shared_lock = threading.Lock()
+
+
+def get_execution_limits() -> ExecutionLimits:
+    """Return the process-wide route limiters"""
+    global _shared_limits
+    with _shared_lock:
+        if _shared_limits is None:
+            _shared_limits = ExecutionLimits()
+        return _shared_limits
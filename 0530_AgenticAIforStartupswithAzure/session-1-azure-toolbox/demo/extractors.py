@@ -0,0 +1,332 @@
+"""
+Text extractor plugins for the Knowledge Worker Agent
+Maps file extensions to extractors whose heavy parsing libraries are imported on first use
+"""
+import os
+import time
+import logging
+import importlib
+import threading
+from importlib.metadata import entry_points
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# File content passed around as raw bytes or as the path of a file spooled to disk
+FileSource = Union[bytes, str]
+
+Extractor = Callable[[FileSource, str], Dict[str, Any]]
+
+# Third-party packages register extractors under this group, one entry point per
+# extension, e.g. in pyproject.toml:
+#   [project.entry-points."knowledge_worker.extractors"]
+#   ".epub" = "epub_plugin:extract_epub"
+ENTRY_POINT_GROUP = "knowledge_worker.extractors"
+
+
+def _read_text(file_content: FileSource) -> str:
+    """Decode UTF-8 text from bytes or straight from a file path"""
+    if isinstance(file_content, str):
+        with open(file_content, encoding='utf-8') as text_file:
+            return text_file.read()
+    return file_content.decode('utf-8')
+
+
+# ---------------------------------------------------------------------- built-in extractors
+# Each one imports its parser inside the function, so the cost is paid by the
+# first file of that type rather than by every process that imports this module.
+
+def extract_pdf(file_content: FileSource, filename: str) -> Dict[str, Any]:
+    """Extract text from PDF file"""
+    from pdf_extractor import PdfExtractor
+    return PdfExtractor().extract(file_content, filename)
+
+
+def extract_docx(file_content: FileSource, filename: str) -> Dict[str, Any]:
+    """Extract text from Word document"""
+    try:
+        import io
+        from docx import Document
+        docx_file = file_content if isinstance(file_content, str) else io.BytesIO(file_content)
+        paragraphs = Document(docx_file).paragraphs
+
+        # Join once instead of growing a string per paragraph
+        text_content = "\n".join(paragraph.text for paragraph in paragraphs)
+
+        return {
+            "success": True,
+            "content": text_content.strip(),
+            "paragraph_count": len(paragraphs),
+            "metadata": {
+                "paragraphs": len(paragraphs),
+                "file_type": "docx"
+            }
+        }
+    except Exception as e:
+        logger.error(f"Error processing DOCX {filename}: {str(e)}")
+        return {
+            "success": False,
+            "error": str(e)
+        }
+
+
+def extract_text(file_content: FileSource, filename: str) -> Dict[str, Any]:
+    """Process plain text file"""
+    try:
+        text_content = _read_text(file_content)
+
+        return {
+            "success": True,
+            "content": text_content.strip(),
+            "character_count": len(text_content),
+            "metadata": {
+                "characters": len(text_content),
+                "lines": len(text_content.split('\n')),
+                "file_type": "text"
+            }
+        }
+    except Exception as e:
+        logger.error(f"Error processing text file {filename}: {str(e)}")
+        return {
+            "success": False,
+            "error": str(e)
+        }
+
+
+def extract_html(file_content: FileSource, filename: str) -> Dict[str, Any]:
+    """Extract text from HTML file"""
+    try:
+        from bs4 import BeautifulSoup
+        html_content = _read_text(file_content)
+        soup = BeautifulSoup(html_content, 'html.parser')
+
+        # Remove script and style elements
+        for script in soup(["script", "style"]):
+            script.decompose()
+
+        # Get text content
+        text_content = soup.get_text()
+
+        # Clean up whitespace
+        lines = (line.strip() for line in text_content.splitlines())
+        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+        text_content = ' '.join(chunk for chunk in chunks if chunk)
+
+        return {
+            "success": True,
+            "content": text_content,
+            "metadata": {
+                "title": soup.title.string if soup.title else None,
+                "file_type": "html"
+            }
+        }
+    except Exception as e:
+        logger.error(f"Error processing HTML {filename}: {str(e)}")
+        return {
+            "success": False,
+            "error": str(e)
+        }
+
+
+def extract_markdown(file_content: FileSource, filename: str) -> Dict[str, Any]:
+    """Process markdown file"""
+    try:
+        text_content = _read_text(file_content)
+
+        # Extract title from first heading if available
+        lines = text_content.split('\n')
+        title = None
+        for line in lines:
+            if line.startswith('# '):
+                title = line[2:].strip()
+                break
+
+        return {
+            "success": True,
+            "content": text_content.strip(),
+            "character_count": len(text_content),
+            "metadata": {
+                "characters": len(text_content),
+                "lines": len(text_content.split('\n')),
+                "title": title,
+                "file_type": "markdown"
+            }
+        }
+    except Exception as e:
+        logger.error(f"Error processing markdown file {filename}: {str(e)}")
+        return {
+            "success": False,
+            "error": str(e)
+        }
+
+
+# ---------------------------------------------------------------------- registry
+
+class ExtractorPlugin:
+    """An extractor registered for some extensions, resolved on first use
+
+    target is a callable, a "module:function" path or an entry point. load()
+    imports the modules listed in requires and then the target, so a missing
+    parser library is reported when a file of that type first arrives.
+    """
+
+    def __init__(self, name: str, extensions: List[str], target: Any, source: str = "builtin",
+                 requires: Sequence[str] = ()):
+        self.name = name
+        self.extensions = extensions
+        self.target = target
+        self.source = source
+        self.requires = tuple(requires)
+        self.load_ms: Optional[float] = None
+        self._extractor: Optional[Extractor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._extractor is not None
+
+    def load(self) -> Extractor:
+        """Import the extractor and its dependencies if needed and return it"""
+        if self._extractor is not None:
+            return self._extractor
+        with self._lock:
+            if self._extractor is None:
+                started = time.perf_counter()
+                for module_name in self.requires:
+                    importlib.import_module(module_name)
+                if hasattr(self.target, "load"):
+                    self._extractor = self.target.load()
+                elif isinstance(self.target, str):
+                    module_name, _, attribute = self.target.partition(":")
+                    self._extractor = getattr(importlib.import_module(module_name), attribute)
+                else:
+                    self._extractor = self.target
+                self.load_ms = round((time.perf_counter() - started) * 1000, 1)
+                logger.info(f"Loaded extractor '{self.name}' in {self.load_ms} ms")
+        return self._extractor
+
+
+class ExtractorRegistry:
+    """Extension -> extractor plugin map, extended by register() or entry points
+
+    Entry points are discovered the first time an extension is looked up or the
+    supported types are listed. Entry points override built-ins for the same
+    extension; register() overrides both. Extractors added with register() at
+    runtime are only visible in this process, so ingestion worker processes
+    see them only if the registering module is imported there as well; entry
+    points are visible everywhere.
+    """
+
+    def __init__(self):
+        self._plugins: Dict[str, ExtractorPlugin] = {}
+        self._entry_points_loaded = False
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _normalize(extension: str) -> str:
+        extension = extension.lower()
+        return extension if extension.startswith(".") else f".{extension}"
+
+    def register(self, extensions: Union[str, List[str]], target: Any, name: Optional[str] = None,
+                 source: str = "runtime", requires: Sequence[str] = ()) -> ExtractorPlugin:
+        """Register an extractor (callable or "module:function") for one or more extensions"""
+        extensions = [self._normalize(extension) for extension in
+                      ([extensions] if isinstance(extensions, str) else extensions)]
+        plugin = ExtractorPlugin(name or getattr(target, "__name__", str(target)), extensions, target, source, requires)
+        with self._lock:
+            for extension in extensions:
+                self._plugins[extension] = plugin
+        return plugin
+
+    def _discover_entry_points(self) -> None:
+        if self._entry_points_loaded:
+            return
+        with self._lock:
+            if self._entry_points_loaded:
+                return
+            self._entry_points_loaded = True
+            try:
+                discovered = list(entry_points(group=ENTRY_POINT_GROUP))
+            except Exception as e:
+                logger.warning(f"Could not read extractor entry points: {str(e)}")
+                return
+            for entry_point in discovered:
+                current = self._plugins.get(self._normalize(entry_point.name))
+                if current is None or current.source != "runtime":
+                    self.register(entry_point.name, entry_point, name=entry_point.value, source="entry_point")
+            if discovered:
+                logger.info(f"Registered {len(discovered)} extractor entry points")
+
+    def get(self, extension: str) -> Optional[ExtractorPlugin]:
+        """Return the plugin for an extension, or None"""
+        self._discover_entry_points()
+        return self._plugins.get(self._normalize(extension))
+
+    def supported_types(self) -> List[str]:
+        """List the registered extensions"""
+        self._discover_entry_points()
+        return sorted(self._plugins)
+
+    def extract(self, file_content: FileSource, filename: str) -> Dict[str, Any]:
+        """Extract text from a file using the extractor registered for its extension"""
+        file_extension = os.path.splitext(filename)[1].lower()
+        plugin = self.get(file_extension) if file_extension else None
+
+        if plugin is None:
+            return {
+                "success": False,
+                "error": f"Unsupported file type: {file_extension}",
+                "supported_types": self.supported_types()
+            }
+
+        try:
+            extractor = plugin.load()
+        except Exception as e:
+            logger.error(f"Error loading extractor '{plugin.name}' for {file_extension}: {str(e)}")
+            return {
+                "success": False,
+                "error": f"Extractor for {file_extension} is unavailable: {str(e)}"
+            }
+        return extractor(file_content, filename)
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Return each plugin's extensions, origin and whether (and how fast) it was loaded"""
+        self._discover_entry_points()
+        plugins = {}
+        for plugin in set(self._plugins.values()):
+            plugins[plugin.name] = {
+                "extensions": sorted(extension for extension, registered in self._plugins.items() if registered is plugin),
+                "source": plugin.source,
+                "loaded": plugin.loaded,
+                "load_ms": plugin.load_ms
+            }
+        return plugins
+
+
+_registry = ExtractorRegistry()
+_registry.register(".pdf", extract_pdf, source="builtin", requires=["pdf_extractor"])
+_registry.register(".docx", extract_docx, source="builtin", requires=["docx"])
+_registry.register(".txt", extract_text, source="builtin")
+_registry.register([".html", ".htm"], extract_html, source="builtin", requires=["bs4"])
+_registry.register([".md", ".markdown"], extract_markdown, source="builtin")
+
+
+def get_extractor_registry() -> ExtractorRegistry:
+    """Return the process-wide extractor registry"""
+    return _registry
+
+
+def register_extractor(extensions: Union[str, List[str]], target: Any, name: Optional[str] = None,
+                       requires: Sequence[str] = ()) -> ExtractorPlugin:
+    """Register an extractor in the process-wide registry"""
+    return _registry.register(extensions, target, name, requires=requires)
+
+
+def extract_file_content(file_content: FileSource, filename: str) -> Dict[str, Any]:
+    """Extract text from a file using the extractor registered for its extension
+
+    A module-level function so the ingestion pipeline can run it in worker processes.
+    """
+    return _registry.extract(file_content, filename)
@@ -0,0 +1,196 @@
+"""
+Shared HTTP client for the Knowledge Worker Agent
+Pools keep-alive connections, retries throttled and failed calls with jittered backoff, and caps concurrency per host
+"""
+import os
+import time
+import random
+import logging
+import threading
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class JitteredRetry(Retry):
+    """urllib3 Retry with full-jitter backoff
+
+    Idempotent requests are retried on connection errors and on 429/5xx.
+    POSTs (e.g. Azure Functions actions, which may send an email) are only
+    retried on 429 and 503, where the service rejected the request without
+    running it. Retry-After headers are honoured.
+    """
+
+    UNPROCESSED_STATUSES = frozenset({429, 503})
+
+    def get_backoff_time(self) -> float:
+        backoff = super().get_backoff_time()
+        return random.uniform(0, backoff) if backoff else 0
+
+    def is_retry(self, method: str, status_code: int, has_retry_after: bool = False) -> bool:
+        if status_code in self.UNPROCESSED_STATUSES:
+            return True
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+class HostStatistics:
+    """Request counters for one host"""
+
+    def __init__(self, limit: int):
+        self.semaphore = threading.BoundedSemaphore(limit)
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.wait_seconds = 0.0
+        self.request_seconds = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "avg_wait_ms": round(self.wait_seconds * 1000 / self.requests, 1) if self.requests else 0.0,
+            "avg_latency_ms": round(self.request_seconds * 1000 / self.requests, 1) if self.requests else 0.0
+        }
+
+
+class PooledHttpClient:
+    """Thread-safe requests.Session with a sized keep-alive pool, retries and per-host limits
+
+    Connections to a host are kept open and reused across calls, so only the
+    first request to a host pays the TCP and TLS handshake. At most
+    per_host_limit requests run against one host at a time; further callers
+    wait up to acquire_timeout seconds for a slot.
+    """
+
+    def __init__(self, pool_connections: int = 10, pool_maxsize: int = 20, max_retries: int = 3,
+                 backoff_factor: float = 0.5, backoff_max: float = 10, per_host_limit: Optional[int] = None,
+                 timeout: float = 30, acquire_timeout: float = 30):
+        """Create the session and mount the pooled, retrying adapter"""
+        self.pool_maxsize = pool_maxsize
+        self.per_host_limit = min(per_host_limit or pool_maxsize, pool_maxsize)
+        self.timeout = timeout
+        self.acquire_timeout = acquire_timeout
+
+        retry = JitteredRetry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            backoff_max=backoff_max,
+            status_forcelist=(429, 500, 502, 503, 504),
+            raise_on_status=False
+        )
+        self._adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", self._adapter)
+        self.session.mount("http://", self._adapter)
+
+        self._hosts: Dict[str, HostStatistics] = {}
+        self._lock = threading.Lock()
+
+    def _host(self, url: str) -> HostStatistics:
+        host = urlsplit(url).netloc.lower()
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = HostStatistics(self.per_host_limit)
+            return self._hosts[host]
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Send a request through the shared pool, waiting for a free slot on the host"""
+        kwargs.setdefault("timeout", self.timeout)
+        host = self._host(url)
+        waited = time.perf_counter()
+        if not host.semaphore.acquire(timeout=self.acquire_timeout):
+            raise TimeoutError(f"No free connection slot for {urlsplit(url).netloc} after {self.acquire_timeout}s")
+        started = time.perf_counter()
+        with self._lock:
+            host.in_flight += 1
+            host.peak_in_flight = max(host.peak_in_flight, host.in_flight)
+            host.wait_seconds += started - waited
+        response = None
+        try:
+            response = self.session.request(method, url, **kwargs)
+            return response
+        finally:
+            retries = getattr(getattr(response, "raw", None), "retries", None)
+            with self._lock:
+                host.in_flight -= 1
+                host.requests += 1
+                host.request_seconds += time.perf_counter() - started
+                if response is None or response.status_code >= 500:
+                    host.errors += 1
+                if retries is not None and retries.history:
+                    host.retries += len(retries.history)
+            host.semaphore.release()
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def _pool_statistics(self) -> Dict[str, Any]:
+        """Connection reuse and occupancy of each urllib3 host pool"""
+        pools = {}
+        manager = self._adapter.poolmanager
+        for key in list(manager.pools.keys()):
+            pool = manager.pools.get(key)
+            if pool is None:
+                continue
+            slots = list(pool.pool.queue) if pool.pool is not None else []
+            requests_sent = pool.num_requests
+            pools[f"{pool.scheme}://{pool.host}:{pool.port}"] = {
+                "maxsize": pool.pool.maxsize if pool.pool is not None else 0,
+                "in_use": (pool.pool.maxsize - len(slots)) if pool.pool is not None else 0,
+                "idle": sum(connection is not None for connection in slots),
+                "connections_opened": pool.num_connections,
+                "requests": requests_sent,
+                "connection_reuse": round(1 - pool.num_connections / requests_sent, 4) if requests_sent else 0.0
+            }
+        return pools
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Return per-host request counters and pool utilization"""
+        with self._lock:
+            hosts = {host: statistics.as_dict() for host, statistics in self._hosts.items()}
+        return {
+            "pool_maxsize": self.pool_maxsize,
+            "per_host_limit": self.per_host_limit,
+            "hosts": hosts,
+            "pools": self._pool_statistics()
+        }
+
+    def close(self) -> None:
+        """Close pooled connections"""
+        self.session.close()
+
+
+_shared_client: Optional[PooledHttpClient] = None
+_shared_lock = threading.Lock()
+
+
+def get_http_client() -> PooledHttpClient:
+    """Return the process-wide HTTP client configured from HTTP_* environment settings"""
+    global _shared_client
+    with _shared_lock:
+        if _shared_client is None:
+            _shared_client = PooledHttpClient(
+                pool_connections=int(os.getenv("HTTP_POOL_CONNECTIONS", "10")),
+                pool_maxsize=int(os.getenv("HTTP_POOL_MAXSIZE", "20")),
+                max_retries=int(os.getenv("HTTP_MAX_RETRIES", "3")),
+                backoff_factor=float(os.getenv("HTTP_BACKOFF_FACTOR", "0.5")),
+                backoff_max=float(os.getenv("HTTP_BACKOFF_MAX_SECONDS", "10")),
+                per_host_limit=int(os.getenv("HTTP_PER_HOST_CONCURRENCY", "0")) or None,
+                timeout=float(os.getenv("HTTP_TIMEOUT_SECONDS", "30"))
+            )
+        return _shared_client
@@ -0,0 +1,215 @@
+"""
+Ingestion manifest for the Knowledge Worker Agent
+Records the source, text and chunk hashes of every ingested file so unchanged sources are skipped on re-ingestion
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, List, Optional, Union
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_HASH_BLOCK_BYTES = 1024 * 1024
+
+
+class IngestionManifest:
+    """SQLite record of what was ingested from each source (file name, path or URL)
+
+    For each source it keeps the SHA-256 of the raw bytes, of the extracted
+    text and of every chunk, the document id the text was indexed under and
+    whether indexing finished. Re-ingesting a source then costs:
+
+    - a hash of the bytes when they are unchanged;
+    - an extraction when the bytes changed but the text did not (e.g. a
+      re-saved Word file);
+    - for changed text, a re-index in which only chunks whose text is new
+      need embedding (the others hit the embedding cache), after which the
+      previous version's chunks are deleted.
+
+    Lookups accept an exists(document_id) check against the index; an entry
+    whose document has since been deleted is dropped instead of matched.
+    """
+
+    def __init__(self, cache_dir: str):
+        """Open (or create) the manifest in cache_dir"""
+        self.cache_dir = cache_dir
+
+        self.source_hits = 0
+        self.text_hits = 0
+        self.changed = 0
+        self.new = 0
+        self.chunks_unchanged = 0
+        self.chunks_changed = 0
+        self.missing = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(cache_dir, "manifest.db"), check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sources ("
+            "source_key TEXT PRIMARY KEY, source_hash TEXT, text_hash TEXT NOT NULL, document_id TEXT NOT NULL, "
+            "chunk_hashes TEXT NOT NULL, blob_url TEXT, state TEXT NOT NULL, updated REAL NOT NULL)"
+        )
+        self._db.commit()
+        self._count = self._db.execute("SELECT COUNT(*) FROM sources").fetchone()[0]
+        logger.info(f"Ingestion manifest opened at '{cache_dir}' with {self._count} sources")
+
+    # ------------------------------------------------------------------ hashing
+
+    @staticmethod
+    def source_hash(file_content: Union[bytes, str]) -> str:
+        """SHA-256 of raw bytes, or of a file on disk read in blocks"""
+        digest = hashlib.sha256()
+        if isinstance(file_content, str):
+            with open(file_content, "rb") as source:
+                for block in iter(lambda: source.read(_HASH_BLOCK_BYTES), b""):
+                    digest.update(block)
+        else:
+            digest.update(file_content)
+        return digest.hexdigest()
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def chunk_hashes(cls, chunks: List[Dict[str, Any]]) -> List[str]:
+        return [cls.text_hash(chunk["content"]) for chunk in chunks]
+
+    # ------------------------------------------------------------------ lookups
+
+    def get(self, source_key: str) -> Optional[Dict[str, Any]]:
+        """Return the manifest entry for a source, or None"""
+        with self._lock:
+            row = self._db.execute("SELECT * FROM sources WHERE source_key = ?", (source_key,)).fetchone()
+        if row is None:
+            return None
+        entry = dict(row)
+        entry["chunk_hashes"] = json.loads(entry["chunk_hashes"])
+        return entry
+
+    def _indexed(self, source_key: str, entry: Dict[str, Any], exists: Optional[Callable[[str], bool]]) -> bool:
+        """Whether the entry's document is still in the index; forget the entry if it is not"""
+        if exists is None or exists(entry["document_id"]):
+            return True
+        logger.info(f"Document '{entry['document_id']}' for {source_key} is no longer indexed")
+        self.remove(source_key)
+        with self._lock:
+            self.missing += 1
+        return False
+
+    def unchanged_source(self, source_key: str, source_hash: str,
+                         exists: Optional[Callable[[str], bool]] = None) -> Optional[Dict[str, Any]]:
+        """Return the entry if the source was fully indexed with these exact bytes"""
+        entry = self.get(source_key)
+        if entry and entry["state"] == "indexed" and entry["source_hash"] == source_hash \
+                and self._indexed(source_key, entry, exists):
+            with self._lock:
+                self.source_hits += 1
+            return entry
+        return None
+
+    def unchanged_text(self, source_key: str, text: str, source_hash: Optional[str] = None,
+                       exists: Optional[Callable[[str], bool]] = None) -> Optional[Dict[str, Any]]:
+        """Return the entry if the source's extracted text was already indexed, noting its new source hash"""
+        entry = self.get(source_key)
+        if entry and entry["state"] == "indexed" and entry["text_hash"] == self.text_hash(text) \
+                and self._indexed(source_key, entry, exists):
+            with self._lock:
+                self.text_hits += 1
+                if source_hash and source_hash != entry["source_hash"]:
+                    self._db.execute("UPDATE sources SET source_hash = ?, updated = ? WHERE source_key = ?",
+                                     (source_hash, time.time(), source_key))
+                    self._db.commit()
+            return entry
+        return None
+
+    # ------------------------------------------------------------------ recording
+
+    def record(self, source_key: str, source_hash: Optional[str], document: Dict[str, Any],
+               chunks: List[Dict[str, Any]], blob_url: Optional[str] = None) -> Dict[str, Any]:
+        """Record an indexed source and return what changed against the previous entry
+
+        The result holds the previous document id (when the text changed, its
+        chunks are stale) and how many chunks are unchanged or new.
+        """
+        previous = self.get(source_key)
+        hashes = self.chunk_hashes(chunks)
+        previous_hashes = set(previous["chunk_hashes"]) if previous else set()
+        unchanged = sum(chunk_hash in previous_hashes for chunk_hash in hashes)
+
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sources (source_key, source_hash, text_hash, document_id, chunk_hashes, "
+                "blob_url, state, updated) VALUES (?, ?, ?, ?, ?, ?, 'indexed', ?)",
+                (source_key, source_hash, self.text_hash(document["content"]), document["id"],
+                 json.dumps(hashes), blob_url, time.time())
+            )
+            self._db.commit()
+            if previous is None:
+                self._count += 1
+                self.new += 1
+            else:
+                self.changed += 1
+            self.chunks_unchanged += unchanged
+            self.chunks_changed += len(hashes) - unchanged
+
+        stale_document_id = previous["document_id"] if previous and previous["document_id"] != document["id"] else None
+        return {
+            "previous_document_id": stale_document_id,
+            "chunks_unchanged": unchanged,
+            "chunks_changed": len(hashes) - unchanged
+        }
+
+    def remove(self, source_key: str) -> None:
+        """Forget a source (e.g. after its document was deleted)"""
+        with self._lock:
+            cursor = self._db.execute("DELETE FROM sources WHERE source_key = ?", (source_key,))
+            self._db.commit()
+            self._count -= cursor.rowcount
+
+    def remove_document(self, document_id: str) -> int:
+        """Forget every source indexed under a document id (call when the document is deleted)"""
+        with self._lock:
+            cursor = self._db.execute("DELETE FROM sources WHERE document_id = ?", (document_id,))
+            self._db.commit()
+            self._count -= cursor.rowcount
+        return cursor.rowcount
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Return how many sources and chunks were skipped, changed or new"""
+        return {
+            "sources": self._count,
+            "unchanged_sources": self.source_hits,
+            "unchanged_text": self.text_hits,
+            "changed": self.changed,
+            "new": self.new,
+            "chunks_unchanged": self.chunks_unchanged,
+            "chunks_changed": self.chunks_changed,
+            "missing_documents": self.missing
+        }
+
+    def close(self) -> None:
+        """Close the manifest database"""
+        with self._lock:
+            self._db.close()
+
+
+_shared_manifests: Dict[str, IngestionManifest] = {}
+_shared_lock = threading.Lock()
+
+
+def get_ingestion_manifest(cache_dir: str) -> IngestionManifest:
+    """Return the process-wide ingestion manifest for cache_dir"""
+    key = os.path.abspath(cache_dir)
+    with _shared_lock:
+        if key not in _shared_manifests:
+            _shared_manifests[key] = IngestionManifest(cache_dir)
+        return _shared_manifests[key]
@@ -0,0 +1,315 @@
+"""
+Staged ingestion pipeline for the Knowledge Worker Agent
+Overlaps extraction, chunking, embedding and indexing of file batches using bounded queues
+"""
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Callable, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Marks the end of a stage's input
+_STOP = object()
+
+
+class _Stage:
+    """A pool of worker threads moving items from an inbox queue to an outbox queue
+
+    Workers pull up to max_batch units of work at a time (without waiting for a
+    batch to fill) and hand them to the handler, which updates the items in place.
+    Items that already failed or were skipped upstream are passed through
+    untouched. Bounded queues give backpressure: a worker blocks when the next
+    stage falls behind.
+    """
+
+    def __init__(self, name: str, handler: Callable[[List[Dict[str, Any]]], None], workers: int,
+                 inbox: queue.Queue, outbox: queue.Queue, max_batch: int = 1,
+                 weight: Callable[[Dict[str, Any]], int] = None):
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.inbox = inbox
+        self.outbox = outbox
+        self.max_batch = max(1, max_batch)
+        self.weight = weight or (lambda item: 1)
+
+        self.items = 0
+        self.batches = 0
+        self.busy_seconds = 0.0
+        self._active = self.workers
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"ingest-{self.name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def join(self) -> None:
+        for thread in self._threads:
+            thread.join()
+
+    def _next_batch(self) -> Optional[List[Dict[str, Any]]]:
+        """Block for one item, then take whatever else is already queued up to max_batch"""
+        item = self.inbox.get()
+        if item is _STOP:
+            # Put the marker back so sibling workers also stop
+            self.inbox.put(_STOP)
+            return None
+
+        batch = [item]
+        size = self.weight(item)
+        while size < self.max_batch:
+            try:
+                item = self.inbox.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self.inbox.put(_STOP)
+                break
+            batch.append(item)
+            size += self.weight(item)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                break
+
+            pending = [item for item in batch if item["error"] is None and item["skipped"] is None]
+            if pending:
+                started = time.perf_counter()
+                try:
+                    self.handler(pending)
+                except Exception as e:
+                    logger.error(f"Ingestion stage '{self.name}' failed for {len(pending)} files: {str(e)}")
+                    for item in pending:
+                        item["error"] = str(e)
+                with self._lock:
+                    self.busy_seconds += time.perf_counter() - started
+                    self.items += len(pending)
+                    self.batches += 1
+
+            for item in batch:
+                self.outbox.put(item)
+
+        with self._lock:
+            self._active -= 1
+            last_worker = self._active == 0
+        if last_worker:
+            self.outbox.put(_STOP)
+
+    def get_statistics(self, elapsed: float) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "items": self.items,
+            "batches": self.batches,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "utilization": round(self.busy_seconds / (elapsed * self.workers), 3) if elapsed else 0.0
+        }
+
+
+class IngestionPipeline:
+    """Runs a file batch through extract -> prepare -> embed -> index stages concurrently
+
+    Extraction is CPU-bound and runs in a process pool; preparing (chunking and
+    blob upload), embedding and indexing are I/O-bound and run in thread pools.
+    Throughput is bounded by the slowest stage instead of the sum of all stages.
+    """
+
+    def __init__(self, extract: Callable[[bytes, str], Dict[str, Any]],
+                 prepare: Callable[[bytes, str, str, Dict[str, Any]], Dict[str, Any]],
+                 search_service, on_indexed: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+                 skip: Optional[Callable[[int, Optional[Dict[str, Any]]], Optional[Dict[str, Any]]]] = None):
+        """Initialize the pipeline from stage callables and INGEST_* environment settings
+
+        extract must be a module-level function so it can be sent to worker processes.
+        on_indexed(position, prepared) is called for each file whose chunks were all
+        indexed, with the file's position in the batch.
+        skip(position, processing) is called before a file is extracted (processing
+        is None) and again with its extraction result; when it returns a dict the
+        file goes no further and is reported as successful with those fields.
+        """
+        self.extract = extract
+        self.prepare = prepare
+        self.search_service = search_service
+        self.on_indexed = on_indexed
+        self.skip = skip
+
+        self.extract_workers = int(os.getenv("INGEST_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+        self.extract_processes = os.getenv("INGEST_EXTRACT_PROCESSES", "true").lower() == "true"
+        self.prepare_workers = int(os.getenv("INGEST_PREPARE_WORKERS", "4"))
+        self.embed_workers = int(os.getenv("INGEST_EMBED_WORKERS", "4"))
+        self.index_workers = int(os.getenv("INGEST_INDEX_WORKERS", "2"))
+        self.queue_size = int(os.getenv("INGEST_QUEUE_SIZE", "32"))
+
+    def _create_process_pool(self, file_count: int) -> Optional[ProcessPoolExecutor]:
+        """Start the extraction process pool, or return None to extract in threads"""
+        if not self.extract_processes or file_count < 2 or self.extract_workers < 2:
+            return None
+        try:
+            return ProcessPoolExecutor(max_workers=min(self.extract_workers, file_count))
+        except Exception as e:
+            logger.warning(f"Process pool unavailable ({str(e)}), extracting in threads")
+            return None
+
+    @staticmethod
+    def _chunk_count(item: Dict[str, Any]) -> int:
+        prepared = item.get("prepared")
+        return len(prepared["chunks"]) if prepared else 1
+
+    def run(self, files: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Process files and return the successful/failed batch report"""
+        started = time.perf_counter()
+        process_pool = self._create_process_pool(len(files))
+
+        def mark_skipped(item, processing) -> bool:
+            skipped = self.skip(item["position"], processing) if self.skip is not None else None
+            if skipped is None:
+                return False
+            item["content"] = None
+            item["skipped"] = skipped
+            return True
+
+        def extract(items):
+            for item in items:
+                if mark_skipped(item, None):
+                    continue
+                if process_pool is not None:
+                    result = process_pool.submit(self.extract, item["content"], item["filename"]).result()
+                else:
+                    result = self.extract(item["content"], item["filename"])
+                if result["success"]:
+                    item["processing"] = result
+                else:
+                    item["error"] = result["error"]
+
+        def prepare(items):
+            for item in items:
+                processing = item.pop("processing")
+                if mark_skipped(item, processing):
+                    continue
+                # Files already in Blob Storage carry their URL and are not uploaded again
+                options = {"blob_url": item["blob_url"]} if item["blob_url"] else {}
+                prepared = self.prepare(item["content"], item["filename"], item["category"], processing, **options)
+                item["content"] = None
+                if not prepared["success"]:
+                    item["error"] = prepared["error"]
+                elif not prepared["chunks"]:
+                    item["error"] = "No chunks to index"
+                else:
+                    item["prepared"] = prepared
+
+        def embed(items):
+            # Chunks from several files share multi-input embedding requests
+            chunks = [chunk for item in items for chunk in item["prepared"]["chunks"]
+                      if not chunk.get("content_vector")]
+            embeddings = self.search_service.generate_embeddings_batch([chunk["content"] for chunk in chunks])
+            for chunk, embedding in zip(chunks, embeddings):
+                if embedding:
+                    chunk["content_vector"] = embedding
+
+        def index(items):
+            chunks = [chunk for item in items for chunk in item["prepared"]["chunks"]]
+            chunk_errors: Dict[str, str] = {}
+            for chunk, result in zip(chunks, self.search_service.index_documents(chunks)):
+                if not result["success"]:
+                    chunk_errors.setdefault(chunk["parent_id"], result["error"] or "Failed to index document in search service")
+            for item in items:
+                error = chunk_errors.get(item["prepared"]["document"]["id"])
+                if error:
+                    item["error"] = error
+                elif self.on_indexed is not None:
+                    self.on_indexed(item["position"], item["prepared"])
+
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(5)]
+        stages = [
+            _Stage("extract", extract, self.extract_workers, queues[0], queues[1]),
+            _Stage("prepare", prepare, self.prepare_workers, queues[1], queues[2]),
+            _Stage("embed", embed, self.embed_workers, queues[2], queues[3],
+                   max_batch=self.search_service.embedding_batch_size, weight=self._chunk_count),
+            _Stage("index", index, self.index_workers, queues[3], queues[4],
+                   max_batch=self.search_service.upload_batch_size, weight=self._chunk_count)
+        ]
+
+        def feed():
+            for position, file_info in enumerate(files):
+                item = {
+                    "position": position,
+                    "filename": file_info.get("filename", "unknown"),
+                    "category": file_info.get("category", "general"),
+                    "content": file_info.get("content"),
+                    "source_key": file_info.get("source_key"),
+                    "blob_url": file_info.get("blob_url"),
+                    "prepared": None,
+                    "skipped": None,
+                    "error": None
+                }
+                if item["content"] is None or "filename" not in file_info:
+                    item["error"] = "File entry requires 'filename' and 'content'"
+                queues[0].put(item)
+            queues[0].put(_STOP)
+
+        try:
+            for stage in stages:
+                stage.start()
+            feeder = threading.Thread(target=feed, name="ingest-feed", daemon=True)
+            feeder.start()
+
+            finished = []
+            while True:
+                item = queues[-1].get()
+                if item is _STOP:
+                    break
+                finished.append(item)
+
+            feeder.join()
+            for stage in stages:
+                stage.join()
+        finally:
+            if process_pool is not None:
+                process_pool.shutdown()
+
+        results = {
+            "successful": [],
+            "failed": [],
+            "total_processed": len(finished),
+            "total_files": len(files)
+        }
+        for item in sorted(finished, key=lambda item: item["position"]):
+            source = {"source_key": item["source_key"]} if item["source_key"] else {}
+            if item["error"] is None and item["skipped"] is not None:
+                results["successful"].append({
+                    "filename": item["filename"],
+                    **source,
+                    **item["skipped"]
+                })
+            elif item["error"] is None:
+                results["successful"].append({
+                    "filename": item["filename"],
+                    **source,
+                    "document_id": item["prepared"]["document"]["id"],
+                    "chunk_count": len(item["prepared"]["chunks"])
+                })
+            else:
+                results["failed"].append({
+                    "filename": item["filename"],
+                    **source,
+                    "error": item["error"]
+                })
+
+        elapsed = time.perf_counter() - started
+        results["pipeline"] = {
+            "elapsed_seconds": round(elapsed, 3),
+            "stages": {stage.name: stage.get_statistics(elapsed) for stage in stages}
+        }
+        logger.info(f"Ingested {len(results['successful'])}/{len(files)} files in {elapsed:.1f}s")
+        return results
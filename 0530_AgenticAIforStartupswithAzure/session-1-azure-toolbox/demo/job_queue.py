@@ -0,0 +1,472 @@
+"""
+Background ingestion job queue for the Knowledge Worker Agent
+Runs uploads and URL fetches on worker threads with retries, keeping job state and checkpoints in SQLite
+"""
+import os
+import json
+import time
+import uuid
+import random
+import shutil
+import asyncio
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+
+from execution_limits import Overloaded
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+
+class JobStore:
+    """SQLite store of job state, checkpoints and artifacts, plus the input files of unfinished jobs
+
+    Job rows hold the status, progress, small JSON checkpoint and final result;
+    larger intermediate results (such as an extracted document) are kept as
+    artifacts in a separate table so progress updates stay cheap. Claims take
+    a write lock, so several server processes can share one store.
+    """
+
+    def __init__(self, job_dir: str):
+        """Open (or create) the store in job_dir"""
+        self.job_dir = job_dir
+        self.files_dir = os.path.join(job_dir, "files")
+        self._lock = threading.Lock()
+
+        os.makedirs(self.files_dir, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(job_dir, "jobs.db"), check_same_thread=False,
+                                   timeout=30, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, payload TEXT NOT NULL, "
+            "stage TEXT, progress REAL NOT NULL DEFAULT 0, message TEXT, checkpoint TEXT NOT NULL DEFAULT '{}', "
+            "result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, max_attempts INTEGER NOT NULL, "
+            "created REAL NOT NULL, updated REAL NOT NULL, started REAL, finished REAL, "
+            "next_attempt_at REAL NOT NULL, lease_until REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, next_attempt_at)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS artifacts (job_id TEXT NOT NULL, name TEXT NOT NULL, value TEXT NOT NULL, "
+            "PRIMARY KEY (job_id, name))"
+        )
+
+    @staticmethod
+    def _row(row: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        job = dict(row)
+        for field in ("payload", "checkpoint", "result"):
+            job[field] = json.loads(job[field]) if job[field] else None
+        return job
+
+    def file_path(self, job_id: str, filename: str) -> str:
+        """Where the input file of a job is kept until the job finishes"""
+        return os.path.join(self.files_dir, job_id + os.path.splitext(filename)[1])
+
+    def insert(self, job_id: str, kind: str, payload: Dict[str, Any], max_attempts: int) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, kind, status, payload, stage, max_attempts, created, updated, next_attempt_at) "
+                "VALUES (?, ?, 'queued', ?, 'queued', ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), max_attempts, now, now, now)
+            )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._row(self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def recent(self, limit: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._db.execute("SELECT * FROM jobs ORDER BY created DESC LIMIT ?", (limit,)).fetchall()
+        return [self._row(row) for row in rows]
+
+    def claim(self, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        """Mark the oldest due queued job as running and return it, or None"""
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued' AND next_attempt_at <= ? "
+                    "ORDER BY next_attempt_at LIMIT 1", (now,)
+                ).fetchone()
+                if row is not None:
+                    self._db.execute(
+                        "UPDATE jobs SET status = 'running', attempts = attempts + 1, started = ?, updated = ?, "
+                        "lease_until = ? WHERE id = ?", (now, now, now + lease_seconds, row["id"])
+                    )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            if row is None:
+                return None
+            return self._row(self._db.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone())
+
+    def update(self, job_id: str, **fields) -> None:
+        fields["updated"] = time.time()
+        for field in ("checkpoint", "result"):
+            if field in fields:
+                fields[field] = json.dumps(fields[field])
+        assignments = ", ".join(f"{field} = ?" for field in fields)
+        with self._lock:
+            self._db.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def recover(self) -> int:
+        """Requeue running jobs whose worker stopped renewing the lease (e.g. the process crashed)"""
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET status = 'queued', stage = 'requeued', message = 'Resuming after interruption', "
+                "updated = ?, next_attempt_at = ? WHERE status = 'running' AND lease_until < ?", (now, now, now)
+            )
+        return cursor.rowcount
+
+    def release(self, job_ids: List[str]) -> int:
+        """Requeue running jobs at once, for a worker that is shutting down while it still holds them"""
+        if not job_ids:
+            return 0
+        now = time.time()
+        placeholders = ", ".join("?" for _ in job_ids)
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET status = 'queued', stage = 'requeued', message = 'Resuming after restart', "
+                f"updated = ?, next_attempt_at = ?, lease_until = NULL WHERE status = 'running' AND id IN ({placeholders})",
+                (now, now, *job_ids)
+            )
+        return cursor.rowcount
+
+    def purge(self, finished_before: float) -> int:
+        """Delete finished jobs (and their artifacts) older than the given time"""
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM artifacts WHERE job_id IN "
+                "(SELECT id FROM jobs WHERE status IN ('succeeded', 'failed') AND finished < ?)", (finished_before,)
+            )
+            cursor = self._db.execute(
+                "DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND finished < ?", (finished_before,)
+            )
+        return cursor.rowcount
+
+    def save_artifact(self, job_id: str, name: str, value: Any) -> None:
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO artifacts (job_id, name, value) VALUES (?, ?, ?)",
+                             (job_id, name, json.dumps(value)))
+
+    def load_artifact(self, job_id: str, name: str) -> Optional[Any]:
+        with self._lock:
+            row = self._db.execute("SELECT value FROM artifacts WHERE job_id = ? AND name = ?", (job_id, name)).fetchone()
+        return json.loads(row["value"]) if row else None
+
+    def delete_artifacts(self, job_id: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM artifacts WHERE job_id = ?", (job_id,))
+
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs per status"""
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) AS jobs FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["jobs"] for row in rows}
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class JobContext:
+    """Handle a running job uses to report progress and read or record its checkpoint
+
+    checkpoint holds what earlier attempts recorded with save_checkpoint(), so
+    a retried or resumed job can skip the stages it already completed. Every
+    report also renews the job's lease.
+    """
+
+    def __init__(self, store: JobStore, job: Dict[str, Any], lease_seconds: float):
+        self.store = store
+        self.job_id = job["id"]
+        self.checkpoint: Dict[str, Any] = job["checkpoint"] or {}
+        self.lease_seconds = lease_seconds
+
+    def report(self, stage: str, progress: float, message: Optional[str] = None) -> None:
+        self.store.update(self.job_id, stage=stage, progress=round(progress, 3), message=message,
+                          lease_until=time.time() + self.lease_seconds)
+
+    def save_checkpoint(self, **values) -> None:
+        self.checkpoint.update(values)
+        self.store.update(self.job_id, checkpoint=self.checkpoint, lease_until=time.time() + self.lease_seconds)
+
+    def save_artifact(self, name: str, value: Any) -> None:
+        self.store.save_artifact(self.job_id, name, value)
+
+    def load_artifact(self, name: str) -> Optional[Any]:
+        return self.store.load_artifact(self.job_id, name)
+
+
+class IngestionJobQueue:
+    """Durable queue of document ingestion jobs processed by background worker threads
+
+    submit_file() and submit_url() record a job and return at once. Workers
+    claim jobs from the store and run DocumentProcessor.process_file_job() or
+    process_url_job(). Raised errors are retried up to max_attempts times with
+    jittered exponential backoff, resuming from the job's checkpoint; errors
+    the processor returns as results fail the job straight away. A job whose
+    worker stops renewing its lease (the process died) is requeued on the
+    next sweep, so lease_seconds must exceed the longest single stage.
+    """
+
+    def __init__(self, processor, store: JobStore, workers: int = 2, max_attempts: int = 3,
+                 retry_backoff: float = 5.0, lease_seconds: float = 600, max_pending: int = 100,
+                 retention_hours: float = 24, poll_interval: float = 0.5):
+        self.processor = processor
+        self.store = store
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.lease_seconds = lease_seconds
+        self.max_pending = max_pending
+        self.retention_seconds = retention_hours * 3600
+        self.poll_interval = poll_interval
+
+        self.retries = 0
+        self.completed_seconds = 0.0
+        self.completed = 0
+        self._threads: List[threading.Thread] = []
+        self._running: Set[str] = set()
+        self._stopping = threading.Event()
+        self._wakeup = threading.Condition()
+        self._last_sweep = 0.0
+        self._sweep_lock = threading.Lock()
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------ submission
+
+    def _check_capacity(self) -> None:
+        counts = self.store.counts()
+        pending = counts.get("queued", 0) + counts.get("running", 0)
+        if pending >= self.max_pending:
+            held = self.completed_seconds / self.completed if self.completed else 10.0
+            retry_after = max(1, min(300, int(held * (pending - self.max_pending + 1) / max(1, self.workers))))
+            raise Overloaded("jobs", "job queue full", retry_after, pending)
+
+    def _enqueue(self, job_id: str, kind: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        self.store.insert(job_id, kind, payload, self.max_attempts)
+        with self._wakeup:
+            self._wakeup.notify()
+        logger.info(f"Queued {kind} job {job_id}")
+        return self.get(job_id)
+
+    def submit_file(self, file_path: str, filename: str, category: str = "general",
+                    source_key: Optional[str] = None) -> Dict[str, Any]:
+        """Queue a spooled file for ingestion; the file is moved into the job store"""
+        self._check_capacity()
+        job_id = uuid.uuid4().hex
+        stored_path = self.store.file_path(job_id, filename)
+        shutil.move(file_path, stored_path)
+        return self._enqueue(job_id, "file", {"file_path": stored_path, "filename": filename, "category": category,
+                                              "source_key": source_key})
+
+    def submit_url(self, url: str, category: str = "web") -> Dict[str, Any]:
+        """Queue a URL for fetching and ingestion"""
+        self._check_capacity()
+        return self._enqueue(uuid.uuid4().hex, "url", {"url": url, "category": category})
+
+    # ------------------------------------------------------------------ inspection
+
+    @staticmethod
+    def _timestamp(value: Optional[float]) -> Optional[str]:
+        return datetime.fromtimestamp(value).isoformat() if value else None
+
+    def _public(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        payload = {key: value for key, value in job["payload"].items() if key != "file_path"}
+        return {
+            "job_id": job["id"],
+            "kind": job["kind"],
+            "status": job["status"],
+            "stage": job["stage"],
+            "progress": job["progress"],
+            "message": job["message"],
+            **payload,
+            "attempts": job["attempts"],
+            "max_attempts": job["max_attempts"],
+            "result": job["result"],
+            "error": job["error"],
+            "created": self._timestamp(job["created"]),
+            "updated": self._timestamp(job["updated"]),
+            "finished": self._timestamp(job["finished"])
+        }
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return a job's status, progress and result, or None"""
+        job = self.store.get(job_id)
+        return self._public(job) if job else None
+
+    def list_jobs(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Return the most recent jobs, newest first"""
+        return [self._public(job) for job in self.store.recent(limit)]
+
+    async def watch(self, job_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """Yield the job each time it changes, ending after it succeeds or fails
+
+        Polls the store, so it also follows jobs run by another server process.
+        """
+        last_update = None
+        while True:
+            job = await asyncio.to_thread(self.get, job_id)
+            if job is None:
+                return
+            if job["updated"] != last_update:
+                last_update = job["updated"]
+                yield job
+            if job["status"] in TERMINAL_STATUSES:
+                return
+            await asyncio.sleep(self.poll_interval)
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Return job counts by status, worker count, retries and average job duration"""
+        return {
+            "workers": len(self._threads),
+            "jobs": self.store.counts(),
+            "max_pending": self.max_pending,
+            "retries": self.retries,
+            "completed": self.completed,
+            "avg_job_seconds": round(self.completed_seconds / self.completed, 2) if self.completed else 0.0
+        }
+
+    # ------------------------------------------------------------------ workers
+
+    def start(self) -> None:
+        """Requeue interrupted jobs and start the worker threads"""
+        if self._threads:
+            return
+        self._stopping.clear()
+        self._sweep(force=True)
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"ingest-job-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Started {self.workers} ingestion job workers")
+
+    def stop(self, timeout: float = 5) -> None:
+        """Stop taking jobs; a job still running is resumed from its checkpoint after restart
+
+        Jobs still running after the join timeout are requeued straight away
+        rather than left leased for up to lease_seconds.
+        """
+        self._stopping.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        with self._lock:
+            held = list(self._running)
+        released = self.store.release(held)
+        if released:
+            logger.warning(f"Requeued {released} ingestion jobs still running at shutdown")
+
+    def _sweep(self, force: bool = False) -> None:
+        """Requeue jobs with expired leases and purge old finished jobs, at most once a minute"""
+        with self._sweep_lock:
+            if not force and time.time() - self._last_sweep < 60:
+                return
+            self._last_sweep = time.time()
+        recovered = self.store.recover()
+        if recovered:
+            logger.warning(f"Requeued {recovered} interrupted ingestion jobs")
+        self.store.purge(time.time() - self.retention_seconds)
+
+    def _work(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                self._sweep()
+                job = self.store.claim(self.lease_seconds)
+            except Exception as e:
+                logger.error(f"Error claiming ingestion job: {str(e)}")
+                job = None
+            if job is None:
+                with self._wakeup:
+                    self._wakeup.wait(timeout=1.0)
+                continue
+            with self._lock:
+                self._running.add(job["id"])
+            try:
+                self._run(job)
+            finally:
+                with self._lock:
+                    self._running.discard(job["id"])
+
+    def _process(self, context: JobContext, job: Dict[str, Any]) -> Dict[str, Any]:
+        payload = job["payload"]
+        if job["kind"] == "file":
+            return self.processor.process_file_job(context, payload["file_path"], payload["filename"], payload["category"],
+                                                   payload.get("source_key"))
+        return self.processor.process_url_job(context, payload["url"], payload["category"])
+
+    def _run(self, job: Dict[str, Any]) -> None:
+        context = JobContext(self.store, job, self.lease_seconds)
+        started = time.perf_counter()
+        try:
+            result = self._process(context, job)
+        except Exception as e:
+            if job["attempts"] < job["max_attempts"]:
+                delay = random.uniform(0.5, 1.0) * self.retry_backoff * 2 ** (job["attempts"] - 1)
+                with self._lock:
+                    self.retries += 1
+                logger.warning(f"Ingestion job {job['id']} attempt {job['attempts']} failed, "
+                               f"retrying in {delay:.1f}s: {str(e)}")
+                self.store.update(job["id"], status="queued", stage="retrying", error=str(e),
+                                  message=f"Attempt {job['attempts']} failed, retrying",
+                                  next_attempt_at=time.time() + delay)
+                return
+            logger.error(f"Ingestion job {job['id']} failed after {job['attempts']} attempts: {str(e)}")
+            result = {"success": False, "error": str(e)}
+
+        if result.get("success"):
+            self.store.update(job["id"], status="succeeded", stage="done", progress=1.0, message=None,
+                              result=result, error=None, finished=time.time())
+            with self._lock:
+                self.completed += 1
+                self.completed_seconds += time.perf_counter() - started
+        else:
+            self.store.update(job["id"], status="failed", stage="failed", result=result,
+                              error=result.get("error"), finished=time.time())
+        self._cleanup(job)
+
+    def _cleanup(self, job: Dict[str, Any]) -> None:
+        """Drop the input file and artifacts of a finished job"""
+        self.store.delete_artifacts(job["id"])
+        file_path = job["payload"].get("file_path")
+        if file_path and os.path.exists(file_path):
+            os.unlink(file_path)
+
+
+_shared_queue: Optional[IngestionJobQueue] = None
+_shared_lock = threading.Lock()
+
+
+def get_job_queue(processor) -> IngestionJobQueue:
+    """Return the process-wide ingestion job queue configured from JOB_* environment settings"""
+    global _shared_queue
+    with _shared_lock:
+        if _shared_queue is None:
+            _shared_queue = IngestionJobQueue(
+                processor,
+                JobStore(os.getenv("JOB_QUEUE_DIR", ".cache/jobs")),
+                workers=int(os.getenv("JOB_WORKERS", "2")),
+                max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "3")),
+                retry_backoff=float(os.getenv("JOB_RETRY_BACKOFF_SECONDS", "5")),
+                lease_seconds=float(os.getenv("JOB_LEASE_SECONDS", "600")),
+                max_pending=int(os.getenv("JOB_MAX_PENDING", "100")),
+                retention_hours=float(os.getenv("JOB_RETENTION_HOURS", "24")),
+                poll_interval=float(os.getenv("JOB_PROGRESS_POLL_SECONDS", "0.5"))
+            )
+        return _shared_queue
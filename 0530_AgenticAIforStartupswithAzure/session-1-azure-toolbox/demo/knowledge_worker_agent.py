@@ -4,12 +4,22 @@ Integrates Azure OpenAI, Azure AI Search, and Azure Functions for intelligent do
 """
 import os
 import json
+import time
+import asyncio
 import logging
-from typing import List, Dict, Any, Optional
+from types import SimpleNamespace
+from functools import cached_property
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import List, Dict, Any, Optional, AsyncIterator
 from datetime import datetime
-from openai import AzureOpenAI
-from azure_search_service import AzureSearchService
-import requests
+from openai import AzureOpenAI, AsyncAzureOpenAI
+from http_client import PooledHttpClient
+from service_container import ServiceContainer, get_service_container
+from speculative_search import SpeculativeSearch, SpeculationStatistics
+from summary_cache import SummaryCache, get_summary_cache
+from summarizer import DocumentSummarizer
+from token_budget import HistoryCompactor, TokenUsage
+from tokenization import encoding_name_for, truncate_to_tokens
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -18,23 +28,55 @@ logger = logging.getLogger(__name__)
 class KnowledgeWorkerAgent:
     """Intelligent agent for knowledge work tasks using Azure AI services"""
     
-    def __init__(self):
-        """Initialize the knowledge worker agent"""
-        # Initialize Azure OpenAI client
-        self.openai_client = AzureOpenAI(
-            api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-            api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-06-01"),
-            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
-        )
+    # Bump when the summary prompt changes so cached summaries are regenerated
+    SUMMARY_PROMPT_VERSION = 2
+    
+    def __init__(self, services: Optional[ServiceContainer] = None):
+        """Initialize the knowledge worker agent
+        
+        Azure clients come from the shared service container and are only
+        built when a turn first needs them.
+        """
+        self.services = services or get_service_container()
         self.deployment_name = os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME", "gpt-4o")
         
-        # Initialize Azure Search service
-        self.search_service = AzureSearchService()
+        # Prompt token budget: old history is rolled into a running summary and tool results are capped
+        self.token_encoding = os.getenv("AGENT_TOKENIZER_ENCODING") or encoding_name_for(self.deployment_name)
+        self.tool_result_max_tokens = int(os.getenv("AGENT_TOOL_RESULT_MAX_TOKENS", "4000"))
         
         # Azure Functions configuration
         self.function_app_url = os.getenv("AZURE_FUNCTION_APP_URL")
         self.function_key = os.getenv("AZURE_FUNCTION_KEY")
         
+        # Tool calls from one assistant message run concurrently, each with its own timeout;
+        # the concurrency limit applies per turn so concurrent chats never queue behind each other
+        self.tool_concurrency = int(os.getenv("AGENT_TOOL_CONCURRENCY", "4"))
+        self.tool_timeout_seconds = float(os.getenv("AGENT_TOOL_TIMEOUT_SECONDS", "30"))
+        # Summaries make several sequential completion calls, so they get a longer timeout of their own
+        self.summary_timeout_seconds = float(os.getenv("AGENT_SUMMARY_TIMEOUT_SECONDS", "180"))
+        
+        # Opt-in: search for the user's message while the first completion runs
+        self.speculative_search = os.getenv("AGENT_SPECULATIVE_SEARCH", "false").lower() == "true"
+        self.speculative_top = int(os.getenv("AGENT_SPECULATIVE_TOP", "5"))
+        self.speculative_min_overlap = float(os.getenv("AGENT_SPECULATIVE_MIN_OVERLAP", "0.5"))
+        self._prefetch_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("AGENT_SPECULATIVE_CONCURRENCY", "8")),
+            thread_name_prefix="agent-prefetch"
+        )
+        self.speculation_stats = SpeculationStatistics()
+        
+        # Persistent summaries keyed by document id and content hash
+        self.summary_cache = None
+        if os.getenv("SUMMARY_CACHE_ENABLED", "true").lower() == "true":
+            try:
+                self.summary_cache = get_summary_cache(
+                    cache_dir=os.getenv("SUMMARY_CACHE_DIR", ".cache/summaries"),
+                    max_entries=int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", "10000")),
+                    max_sections=int(os.getenv("SUMMARY_CACHE_MAX_SECTIONS", "100000"))
+                )
+            except Exception as e:
+                logger.warning(f"Summary cache disabled: {str(e)}")
+        
         # Agent system prompt
         self.system_prompt = """You are a knowledgeable AI assistant that helps users find and analyze information from documents. 
         
@@ -116,69 +158,169 @@ class KnowledgeWorkerAgent:
             }
         ]
     
-    def search_documents(self, query: str, top_results: int = 5) -> Dict[str, Any]:
+    @cached_property
+    def openai_client(self) -> AzureOpenAI:
+        """Shared Azure OpenAI client"""
+        return self.services.openai_client()
+    
+    @cached_property
+    def async_openai_client(self) -> AsyncAzureOpenAI:
+        """Shared async client used by achat() so web routes never block the event loop"""
+        return self.services.async_openai_client()
+    
+    @cached_property
+    def search_service(self):
+        return self.services.search_service()
+    
+    @cached_property
+    def async_search_service(self):
+        return self.services.async_search_service()
+    
+    @cached_property
+    def http_client(self) -> PooledHttpClient:
+        return self.services.http_client()
+    
+    @cached_property
+    def history_compactor(self) -> HistoryCompactor:
+        return HistoryCompactor(
+            self.openai_client,
+            self.async_openai_client,
+            self.deployment_name,
+            self.token_encoding
+        )
+    
+    @cached_property
+    def summarizer(self) -> DocumentSummarizer:
+        return DocumentSummarizer(
+            self.openai_client,
+            self.async_openai_client,
+            self.deployment_name,
+            cache=self.summary_cache,
+            variant=self._summary_variant
+        )
+    
+    @staticmethod
+    def _search_result(query: str, results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Build the search tool result"""
+        return {
+            "success": True,
+            "results": results,
+            "total_found": len(results),
+            "query": query
+        }
+    
+    @staticmethod
+    def _search_error(query: str, error: Exception) -> Dict[str, Any]:
+        """Build the search tool error result"""
+        logger.error(f"Error searching documents: {str(error)}")
+        return {
+            "success": False,
+            "error": str(error),
+            "results": [],
+            "total_found": 0,
+            "query": query
+        }
+    
+    def search_documents(self, query: str, top_results: int = 5, use_cache: bool = True) -> Dict[str, Any]:
         """Search for relevant documents using Azure AI Search"""
         try:
-            results = self.search_service.search_documents(query, top=top_results)
+            results = self.search_service.search_documents(query, top=top_results, use_cache=use_cache)
+            return self._search_result(query, results)
+        except Exception as e:
+            return self._search_error(query, e)
+    
+    async def asearch_documents(self, query: str, top_results: int = 5, use_cache: bool = True) -> Dict[str, Any]:
+        """Search for relevant documents without blocking the event loop"""
+        try:
+            results = await self.async_search_service.search_documents(query, top=top_results, use_cache=use_cache)
+            return self._search_result(query, results)
+        except Exception as e:
+            return self._search_error(query, e)
+    
+    @property
+    def _summary_variant(self) -> str:
+        return f"{self.deployment_name}:v{self.SUMMARY_PROMPT_VERSION}"
+    
+    def _cached_summary(self, document_id: str, document: Dict[str, Any]):
+        """Return (content_hash, cached summary or None) for a fetched document"""
+        content_hash = SummaryCache.content_hash(document.get("title"), document.get("content"))
+        if self.summary_cache is None:
+            return content_hash, None
+        cached = self.summary_cache.get(document_id, content_hash, self._summary_variant)
+        return content_hash, cached["summary"] if cached else None
+    
+    def _store_summary(self, document_id: str, content_hash: str, summary: Optional[str]) -> None:
+        if self.summary_cache is not None and summary:
+            self.summary_cache.put(document_id, content_hash, self._summary_variant, summary)
+    
+    @staticmethod
+    def _summary_result(document_id: str, document: Dict[str, Any], summary: str, cached: bool,
+                        coverage: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Build the summarize tool result"""
+        result = {
+            "success": True,
+            "document_id": document_id,
+            "title": document.get('title'),
+            "source": document.get('source'),
+            "summary": summary,
+            "cached": cached
+        }
+        if coverage:
+            result["coverage"] = coverage
+        return result
+    
+    @staticmethod
+    def _document_not_found(document_id: str) -> Dict[str, Any]:
+        return {
+            "success": False,
+            "error": f"Document with ID '{document_id}' not found"
+        }
+    
+    def summarize_document(self, document_id: str, deadline: Optional[float] = None) -> Dict[str, Any]:
+        """Get and summarize a specific document, reusing a cached summary if its content is unchanged
+        
+        No further completion calls are made once the perf_counter() deadline has passed.
+        """
+        try:
+            # Look the document up by key instead of searching for it
+            document = self.search_service.get_document(document_id)
+            
+            if not document:
+                return self._document_not_found(document_id)
+            
+            content_hash, summary = self._cached_summary(document_id, document)
+            if summary is not None:
+                return self._summary_result(document_id, document, summary, cached=True)
+            
+            # Summarize the whole document: sections in parallel, then merged
+            summarized = self.summarizer.summarize(document, deadline=deadline)
+            summary = summarized.pop("summary")
+            self._store_summary(document_id, content_hash, summary)
+            return self._summary_result(document_id, document, summary, cached=False, coverage=summarized)
             
-            return {
-                "success": True,
-                "results": results,
-                "total_found": len(results),
-                "query": query
-            }
         except Exception as e:
-            logger.error(f"Error searching documents: {str(e)}")
+            logger.error(f"Error summarizing document: {str(e)}")
             return {
                 "success": False,
-                "error": str(e),
-                "results": [],
-                "total_found": 0,
-                "query": query
+                "error": str(e)
             }
     
-    def summarize_document(self, document_id: str) -> Dict[str, Any]:
-        """Get and summarize a specific document"""
+    async def asummarize_document(self, document_id: str) -> Dict[str, Any]:
+        """Get and summarize a specific document without blocking the event loop"""
         try:
-            # Search for the specific document
-            results = self.search_service.search_documents(f"id:{document_id}", top=1)
-            
-            if not results:
-                return {
-                    "success": False,
-                    "error": f"Document with ID '{document_id}' not found"
-                }
+            document = await self.async_search_service.get_document(document_id)
             
-            document = results[0]
+            if not document:
+                return self._document_not_found(document_id)
             
-            # Generate summary using OpenAI
-            summary_prompt = f"""Please provide a comprehensive summary of the following document:
-
-Title: {document.get('title', 'N/A')}
-Content: {document.get('content', '')[:4000]}  # Limit content for token management
-
-Provide a structured summary including:
-1. Main topics covered
-2. Key insights or findings
-3. Important details
-4. Actionable items (if any)"""
-
-            response = self.openai_client.chat.completions.create(
-                model=self.deployment_name,
-                messages=[
-                    {"role": "system", "content": "You are a professional document analyst. Provide clear, structured summaries."},
-                    {"role": "user", "content": summary_prompt}
-                ],
-                temperature=0.3
-            )
+            content_hash, summary = self._cached_summary(document_id, document)
+            if summary is not None:
+                return self._summary_result(document_id, document, summary, cached=True)
             
-            return {
-                "success": True,
-                "document_id": document_id,
-                "title": document.get('title'),
-                "source": document.get('source'),
-                "summary": response.choices[0].message.content
-            }
+            summarized = await self.summarizer.asummarize(document)
+            summary = summarized.pop("summary")
+            self._store_summary(document_id, content_hash, summary)
+            return self._summary_result(document_id, document, summary, cached=False, coverage=summarized)
             
         except Exception as e:
             logger.error(f"Error summarizing document: {str(e)}")
@@ -203,7 +345,7 @@ Provide a structured summary including:
                 "x-functions-key": self.function_key
             }
             
-            response = requests.post(
+            response = self.http_client.post(
                 function_url,
                 headers=headers,
                 json=parameters,
@@ -229,8 +371,13 @@ Provide a structured summary including:
                 "error": str(e)
             }
     
-    def process_function_call(self, function_call) -> Dict[str, Any]:
-        """Process a function call from the AI model"""
+    async def aexecute_action(self, action_type: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        """Execute an action using Azure Functions on a worker thread"""
+        # The Functions call uses the blocking pooled requests session, so keep it off the event loop
+        return await asyncio.to_thread(self.execute_action, action_type, parameters)
+    
+    def process_function_call(self, function_call, deadline: Optional[float] = None) -> Dict[str, Any]:
+        """Process a function call from the AI model, stopping summary work at the deadline if given"""
         function_name = function_call.name
         arguments = json.loads(function_call.arguments)
         
@@ -240,7 +387,7 @@ Provide a structured summary including:
                 top_results=arguments.get("top_results", 5)
             )
         elif function_name == "summarize_document":
-            return self.summarize_document(arguments["document_id"])
+            return self.summarize_document(arguments["document_id"], deadline=deadline)
         elif function_name == "execute_action":
             return self.execute_action(
                 action_type=arguments["action_type"],
@@ -252,17 +399,264 @@ Provide a structured summary including:
                 "error": f"Unknown function: {function_name}"
             }
     
+    async def aprocess_function_call(self, function_call) -> Dict[str, Any]:
+        """Process a function call from the AI model using the async tools"""
+        function_name = function_call.name
+        arguments = json.loads(function_call.arguments)
+        
+        if function_name == "search_documents":
+            return await self.asearch_documents(
+                query=arguments["query"],
+                top_results=arguments.get("top_results", 5)
+            )
+        elif function_name == "summarize_document":
+            return await self.asummarize_document(arguments["document_id"])
+        elif function_name == "execute_action":
+            return await self.aexecute_action(
+                action_type=arguments["action_type"],
+                parameters=arguments["parameters"]
+            )
+        else:
+            return {
+                "success": False,
+                "error": f"Unknown function: {function_name}"
+            }
+    
+    def _tool_timeout(self, function_call) -> float:
+        """Seconds a tool call may take: AGENT_SUMMARY_TIMEOUT_SECONDS for summaries, else AGENT_TOOL_TIMEOUT_SECONDS"""
+        if function_call.name == "summarize_document":
+            return self.summary_timeout_seconds
+        return self.tool_timeout_seconds
+    
+    def _tool_failure(self, function_call, error: Exception) -> Dict[str, Any]:
+        """Build the tool result for a call that raised or timed out"""
+        if isinstance(error, (FutureTimeoutError, asyncio.TimeoutError)):
+            message = f"Tool '{function_call.name}' timed out after {self._tool_timeout(function_call):g}s"
+        else:
+            message = str(error)
+        logger.error(f"Error running tool {function_call.name}: {message}")
+        return {
+            "success": False,
+            "error": message
+        }
+    
+    @staticmethod
+    def _function_call_entry(tool_call, result: Dict[str, Any], started: float, finished: float) -> Dict[str, Any]:
+        return {
+            "tool_call_id": tool_call.id,
+            "result": result,
+            "duration_ms": round((finished - started) * 1000, 1)
+        }
+    
+    def _timed_function_call(self, function_call, deadline: float):
+        """Run a tool call on a worker thread, returning its result and finish time"""
+        return self.process_function_call(function_call, deadline=deadline), time.perf_counter()
+    
+    def _start_speculation(self, user_message: str) -> Optional[SpeculativeSearch]:
+        """Start searching for the user's message on a worker thread, if speculative search is enabled"""
+        if not self.speculative_search:
+            return None
+        speculation = SpeculativeSearch(user_message, self.speculative_top)
+        
+        def prefetch():
+            try:
+                return self.search_documents(speculation.query, top_results=speculation.top)
+            finally:
+                speculation.mark_finished()
+        
+        speculation.pending = self._prefetch_executor.submit(prefetch)
+        return speculation
+    
+    def _astart_speculation(self, user_message: str) -> Optional[SpeculativeSearch]:
+        """Start searching for the user's message as a task, if speculative search is enabled"""
+        if not self.speculative_search:
+            return None
+        speculation = SpeculativeSearch(user_message, self.speculative_top)
+        
+        async def prefetch():
+            try:
+                return await self.asearch_documents(speculation.query, top_results=speculation.top)
+            finally:
+                speculation.mark_finished()
+        
+        speculation.pending = asyncio.create_task(prefetch())
+        return speculation
+    
+    def _finish_speculation(self, speculation: Optional[SpeculativeSearch]) -> None:
+        """Discard an unclaimed prefetch and record the turn's outcome"""
+        if speculation is None:
+            return
+        if not speculation.claimed:
+            speculation.pending.cancel()
+        self.speculation_stats.record_finished(speculation)
+    
+    def _claim_speculation(self, speculation: Optional[SpeculativeSearch], tool_call) -> Optional[SpeculativeSearch]:
+        if speculation is not None and speculation.claim(tool_call.function, self.speculative_min_overlap):
+            return speculation
+        return None
+    
+    def _reuse_prefetched(self, speculation: SpeculativeSearch, function_call, prefetched: Dict[str, Any],
+                          claimed_at: float) -> Optional[Dict[str, Any]]:
+        """Adapt the prefetched search to the tool call, or return None if the prefetch failed"""
+        if not prefetched.get("success"):
+            self.speculation_stats.record_error()
+            return None
+        self.speculation_stats.record_hit(speculation.latency_saved(claimed_at))
+        return speculation.adapt_result(prefetched, function_call)
+    
+    def _timed_speculative_call(self, speculation: SpeculativeSearch, function_call, deadline: float):
+        """Answer a search tool call from the prefetch, falling back to a fresh search before the deadline"""
+        claimed_at = time.perf_counter()
+        prefetched = speculation.pending.result(timeout=max(0.0, deadline - claimed_at))
+        result = self._reuse_prefetched(speculation, function_call, prefetched, claimed_at)
+        if result is None:
+            if time.perf_counter() >= deadline:
+                # The turn has already reported this call as timed out
+                raise FutureTimeoutError()
+            result = self.process_function_call(function_call, deadline=deadline)
+        return result, time.perf_counter()
+    
+    async def _aspeculative_call(self, speculation: SpeculativeSearch, function_call) -> Dict[str, Any]:
+        claimed_at = time.perf_counter()
+        result = self._reuse_prefetched(speculation, function_call, await speculation.pending, claimed_at)
+        if result is None:
+            result = await self.aprocess_function_call(function_call)
+        return result
+    
+    def run_tool_calls(self, tool_calls, speculation: Optional[SpeculativeSearch] = None) -> List[Dict[str, Any]]:
+        """Run one assistant message's tool calls concurrently, returning results in call order
+        
+        The calls share a pool owned by this turn, so only its own calls compete
+        for AGENT_TOOL_CONCURRENCY slots. A call that outlives its timeout
+        (AGENT_SUMMARY_TIMEOUT_SECONDS for summaries, AGENT_TOOL_TIMEOUT_SECONDS
+        otherwise) gets an error result; its worker thread cannot be interrupted,
+        but it starts no further model calls or fallback searches after the
+        deadline and finishes in the background without holding up other turns.
+        """
+        started = time.perf_counter()
+        deadlines = [started + self._tool_timeout(tool_call.function) for tool_call in tool_calls]
+        executor = ThreadPoolExecutor(
+            max_workers=max(1, min(self.tool_concurrency, len(tool_calls))),
+            thread_name_prefix="agent-tool"
+        )
+        try:
+            futures = []
+            for tool_call, deadline in zip(tool_calls, deadlines):
+                if self._claim_speculation(speculation, tool_call):
+                    futures.append(executor.submit(self._timed_speculative_call, speculation, tool_call.function,
+                                                   deadline))
+                else:
+                    futures.append(executor.submit(self._timed_function_call, tool_call.function, deadline))
+            
+            function_results = []
+            for tool_call, future, deadline in zip(tool_calls, futures, deadlines):
+                try:
+                    result, finished = future.result(timeout=max(0.0, deadline - time.perf_counter()))
+                except Exception as e:
+                    future.cancel()
+                    result, finished = self._tool_failure(tool_call.function, e), time.perf_counter()
+                function_results.append(self._function_call_entry(tool_call, result, started, finished))
+            return function_results
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    async def _arun_tool_call(self, tool_call, semaphore: asyncio.Semaphore,
+                              speculation: Optional[SpeculativeSearch] = None) -> Dict[str, Any]:
+        """Run one tool call under the turn's concurrency limit, from a claimed prefetch if given
+        
+        The timeout covers waiting for a slot as well as the call itself.
+        """
+        started = time.perf_counter()
+        
+        async def call():
+            async with semaphore:
+                if speculation is not None:
+                    return await self._aspeculative_call(speculation, tool_call.function)
+                return await self.aprocess_function_call(tool_call.function)
+        
+        try:
+            result = await asyncio.wait_for(call(), self._tool_timeout(tool_call.function))
+        except Exception as e:
+            result = self._tool_failure(tool_call.function, e)
+        return self._function_call_entry(tool_call, result, started, time.perf_counter())
+    
+    async def arun_tool_calls(self, tool_calls, speculation: Optional[SpeculativeSearch] = None) -> List[Dict[str, Any]]:
+        """Run one assistant message's tool calls concurrently, returning results in call order"""
+        semaphore = asyncio.Semaphore(self.tool_concurrency)
+        calls = [self._arun_tool_call(tool_call, semaphore, self._claim_speculation(speculation, tool_call))
+                 for tool_call in tool_calls]
+        return list(await asyncio.gather(*calls))
+    
+    def _append_tool_messages(self, messages: List[Dict[str, Any]], function_results: List[Dict[str, Any]]) -> None:
+        """Add tool results to the conversation in the order the model requested them
+        
+        Each result is cut to AGENT_TOOL_RESULT_MAX_TOKENS so a large search
+        result cannot push the final request past the context window.
+        """
+        for function_result in function_results:
+            content = json.dumps(function_result["result"])
+            truncated = truncate_to_tokens(content, self.tool_result_max_tokens, self.token_encoding)
+            if len(truncated) < len(content):
+                logger.warning(f"Tool result for {function_result['tool_call_id']} truncated to "
+                               f"{self.tool_result_max_tokens} tokens")
+                truncated += " [truncated]"
+            messages.append({
+                "role": "tool",
+                "content": truncated,
+                "tool_call_id": function_result["tool_call_id"]
+            })
+    
+    def _build_messages(self, user_message: str, conversation_history: List[Dict[str, str]],
+                        usage: TokenUsage) -> List[Dict[str, Any]]:
+        """Build the messages array for a chat turn, compacting history to the prompt budget"""
+        return self.history_compactor.compact(self.system_prompt, conversation_history or [], user_message,
+                                              self.available_tools, usage)
+    
+    async def _abuild_messages(self, user_message: str, conversation_history: List[Dict[str, str]],
+                               usage: TokenUsage) -> List[Dict[str, Any]]:
+        """Async counterpart of _build_messages()"""
+        return await self.history_compactor.acompact(self.system_prompt, conversation_history or [], user_message,
+                                                     self.available_tools, usage)
+    
+    @staticmethod
+    def _assistant_tool_call_message(message) -> Dict[str, Any]:
+        """Convert the assistant's tool-calling message into a request message"""
+        return {
+            "role": "assistant",
+            "content": message.content,
+            "tool_calls": [
+                {
+                    "id": tc.id,
+                    "type": tc.type,
+                    "function": {
+                        "name": tc.function.name,
+                        "arguments": tc.function.arguments
+                    }
+                } for tc in message.tool_calls
+            ]
+        }
+    
+    @staticmethod
+    def _chat_result(response: str, function_results: List[Dict[str, Any]], usage: TokenUsage) -> Dict[str, Any]:
+        """Build the chat response returned to the web interface"""
+        return {
+            "success": True,
+            "response": response,
+            "function_calls": function_results,
+            "token_usage": usage.as_dict(),
+            "timestamp": datetime.now().isoformat()
+        }
+    
     def chat(self, user_message: str, conversation_history: List[Dict[str, str]] = None) -> Dict[str, Any]:
         """Main chat interface for the knowledge worker agent"""
+        speculation = None
+        usage = TokenUsage(self.token_encoding)
         try:
-            # Prepare conversation history
-            if conversation_history is None:
-                conversation_history = []
+            # Build messages array within the prompt token budget
+            messages = self._build_messages(user_message, conversation_history, usage)
             
-            # Build messages array
-            messages = [{"role": "system", "content": self.system_prompt}]
-            messages.extend(conversation_history)
-            messages.append({"role": "user", "content": user_message})
+            # Optionally prefetch retrieval while the model decides which tools to call
+            speculation = self._start_speculation(user_message)
             
             # Call OpenAI with function calling
             response = self.openai_client.chat.completions.create(
@@ -275,39 +669,15 @@ Provide a structured summary including:
             )
             
             message = response.choices[0].message
-              # Check if the model wants to call a function
+            usage.record_response("tool_selection" if message.tool_calls else "answer", response, messages, self.available_tools)
+            # Check if the model wants to call a function
             if message.tool_calls:
                 # Add the assistant's message with tool_calls to the conversation
-                messages.append({
-                    "role": "assistant",
-                    "content": message.content,
-                    "tool_calls": [
-                        {
-                            "id": tc.id,
-                            "type": tc.type,
-                            "function": {
-                                "name": tc.function.name,
-                                "arguments": tc.function.arguments
-                            }
-                        } for tc in message.tool_calls
-                    ]
-                })
+                messages.append(self._assistant_tool_call_message(message))
                 
-                # Process function calls
-                function_results = []
-                for tool_call in message.tool_calls:
-                    function_result = self.process_function_call(tool_call.function)
-                    function_results.append({
-                        "tool_call_id": tool_call.id,
-                        "result": function_result
-                    })
-                    
-                    # Add function result to conversation
-                    messages.append({
-                        "role": "tool",
-                        "content": json.dumps(function_result),
-                        "tool_call_id": tool_call.id
-                    })
+                # Process function calls concurrently and add their results to the conversation
+                function_results = self.run_tool_calls(message.tool_calls, speculation)
+                self._append_tool_messages(messages, function_results)
                 
                 # Get final response after function calls
                 final_response = self.openai_client.chat.completions.create(
@@ -316,23 +686,59 @@ Provide a structured summary including:
                     temperature=0.7,
                     max_tokens=1500
                 )
+                usage.record_response("answer", final_response, messages)
                 
-                final_message = final_response.choices[0].message.content
-                
-                return {
-                    "success": True,
-                    "response": final_message,
-                    "function_calls": function_results,
-                    "timestamp": datetime.now().isoformat()
-                }
+                return self._chat_result(final_response.choices[0].message.content, function_results, usage)
             else:
                 # Direct response without function calls
-                return {
-                    "success": True,
-                    "response": message.content,
-                    "function_calls": [],
-                    "timestamp": datetime.now().isoformat()
-                }
+                return self._chat_result(message.content, [], usage)
+                
+        except Exception as e:
+            logger.error(f"Error in chat: {str(e)}")
+            return {
+                "success": False,
+                "error": str(e),
+                "timestamp": datetime.now().isoformat()
+            }
+        finally:
+            self._finish_speculation(speculation)
+    
+    async def achat(self, user_message: str, conversation_history: List[Dict[str, str]] = None) -> Dict[str, Any]:
+        """Async chat interface; awaits every model, search and action call"""
+        speculation = None
+        usage = TokenUsage(self.token_encoding)
+        try:
+            messages = await self._abuild_messages(user_message, conversation_history, usage)
+            speculation = self._astart_speculation(user_message)
+            
+            response = await self.async_openai_client.chat.completions.create(
+                model=self.deployment_name,
+                messages=messages,
+                tools=self.available_tools,
+                tool_choice="auto",
+                temperature=0.7,
+                max_tokens=1500
+            )
+            
+            message = response.choices[0].message
+            usage.record_response("tool_selection" if message.tool_calls else "answer", response, messages, self.available_tools)
+            if message.tool_calls:
+                messages.append(self._assistant_tool_call_message(message))
+                
+                function_results = await self.arun_tool_calls(message.tool_calls, speculation)
+                self._append_tool_messages(messages, function_results)
+                
+                final_response = await self.async_openai_client.chat.completions.create(
+                    model=self.deployment_name,
+                    messages=messages,
+                    temperature=0.7,
+                    max_tokens=1500
+                )
+                usage.record_response("answer", final_response, messages)
+                
+                return self._chat_result(final_response.choices[0].message.content, function_results, usage)
+            else:
+                return self._chat_result(message.content, [], usage)
                 
         except Exception as e:
             logger.error(f"Error in chat: {str(e)}")
@@ -341,6 +747,131 @@ Provide a structured summary including:
                 "error": str(e),
                 "timestamp": datetime.now().isoformat()
             }
+        finally:
+            self._finish_speculation(speculation)
+    
+    @staticmethod
+    def _merge_tool_call_deltas(tool_calls: Dict[int, Dict[str, str]], deltas) -> None:
+        """Accumulate streamed tool-call fragments (keyed by index) into complete calls"""
+        for delta in deltas:
+            call = tool_calls.setdefault(delta.index, {"id": "", "name": "", "arguments": ""})
+            if delta.id:
+                call["id"] = delta.id
+            if delta.function:
+                call["name"] += delta.function.name or ""
+                call["arguments"] += delta.function.arguments or ""
+    
+    async def _astream_completion(self, messages: List[Dict[str, Any]], tool_calls: Dict[int, Dict[str, str]],
+                                  use_tools: bool) -> AsyncIterator[str]:
+        """Stream a completion, yielding answer text and collecting any tool calls"""
+        options = {"tools": self.available_tools, "tool_choice": "auto"} if use_tools else {}
+        stream = await self.async_openai_client.chat.completions.create(
+            model=self.deployment_name,
+            messages=messages,
+            temperature=0.7,
+            max_tokens=1500,
+            stream=True,
+            **options
+        )
+        async for chunk in stream:
+            # Azure sends content-filter results as chunks without choices
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.tool_calls:
+                self._merge_tool_call_deltas(tool_calls, delta.tool_calls)
+            if delta.content:
+                yield delta.content
+    
+    async def achat_stream(self, user_message: str,
+                           conversation_history: List[Dict[str, str]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Streaming chat interface; yields events as the turn progresses
+        
+        Events are dicts with a "type" of "tool_call_start", "tool_call_end",
+        "token", "done" (the achat result plus timing) or "error". Both
+        completions are streamed, so a direct answer starts arriving with the
+        model's first token and tool calls are reported as they run.
+        """
+        started = time.perf_counter()
+        first_token_ms = None
+        parts: List[str] = []
+        function_results: List[Dict[str, Any]] = []
+        speculation = None
+        usage = TokenUsage(self.token_encoding)
+        try:
+            messages = await self._abuild_messages(user_message, conversation_history, usage)
+            speculation = self._astart_speculation(user_message)
+            
+            tool_calls: Dict[int, Dict[str, str]] = {}
+            for use_tools in (True, False):
+                round_start = len(parts)
+                async for text in self._astream_completion(messages, tool_calls, use_tools):
+                    if first_token_ms is None:
+                        first_token_ms = round((time.perf_counter() - started) * 1000, 1)
+                    parts.append(text)
+                    yield {"type": "token", "content": text}
+                
+                # Streamed responses carry no usage on this API version, so count locally
+                usage.record_estimate("tool_selection" if tool_calls else "answer", messages, "".join(parts[round_start:]),
+                                      self.available_tools if use_tools else None,
+                                      [call["arguments"] for call in tool_calls.values()])
+                
+                if not tool_calls:
+                    break
+                
+                calls = [
+                    SimpleNamespace(id=call["id"], type="function",
+                                    function=SimpleNamespace(name=call["name"], arguments=call["arguments"]))
+                    for _, call in sorted(tool_calls.items())
+                ]
+                messages.append(self._assistant_tool_call_message(
+                    SimpleNamespace(content="".join(parts) or None, tool_calls=calls)
+                ))
+                tool_calls = {}
+                tool_calls_by_id = {tool_call.id: tool_call.function.name for tool_call in calls}
+                
+                for tool_call in calls:
+                    yield {"type": "tool_call_start", "tool_call_id": tool_call.id,
+                           "name": tool_call.function.name, "arguments": tool_call.function.arguments}
+                
+                # Tools run concurrently; report each one as it finishes, then record them in call order
+                completed = {}
+                semaphore = asyncio.Semaphore(self.tool_concurrency)
+                for next_done in asyncio.as_completed([self._arun_tool_call(tool_call, semaphore,
+                                                                            self._claim_speculation(speculation, tool_call))
+                                                    for tool_call in calls]):
+                    entry = await next_done
+                    completed[entry["tool_call_id"]] = entry
+                    yield {"type": "tool_call_end", "tool_call_id": entry["tool_call_id"],
+                           "name": tool_calls_by_id[entry["tool_call_id"]], "success": entry["result"].get("success", False),
+                           "duration_ms": entry["duration_ms"]}
+                turn_results = [completed[tool_call.id] for tool_call in calls]
+                function_results.extend(turn_results)
+                self._append_tool_messages(messages, turn_results)
+            
+            result = self._chat_result("".join(parts), function_results, usage)
+            result["timing"] = {
+                "time_to_first_token_ms": first_token_ms,
+                "total_ms": round((time.perf_counter() - started) * 1000, 1)
+            }
+            logger.info(f"Streamed chat turn: first token after {first_token_ms} ms, "
+                        f"{len(function_results)} tool calls")
+            yield {"type": "done", **result}
+            
+        except Exception as e:
+            logger.error(f"Error in streaming chat: {str(e)}")
+            yield {
+                "type": "error",
+                "success": False,
+                "error": str(e),
+                "timestamp": datetime.now().isoformat()
+            }
+        finally:
+            self._finish_speculation(speculation)
+    
+    def get_speculation_statistics(self) -> Dict[str, Any]:
+        """Return speculative search hit rate and latency saved"""
+        return {"enabled": self.speculative_search, **self.speculation_stats.get_statistics()}
     
     def get_agent_status(self) -> Dict[str, Any]:
         """Get the current status of the agent and its services"""
@@ -376,6 +907,11 @@ Provide a structured summary including:
                         "url": self.function_app_url
                     }
                 },
+                "speculative_search": self.get_speculation_statistics(),
+                "prompt_budget": self.history_compactor.get_statistics(),
+                "http_client": self.http_client.get_statistics(),
+                "service_container": self.services.get_statistics(),
+                "summary_cache": self.summary_cache.get_statistics() if self.summary_cache else None,
                 "timestamp": datetime.now().isoformat()
             }
         except Exception as e:
@@ -385,3 +921,9 @@ Provide a structured summary including:
                 "error": str(e),
                 "timestamp": datetime.now().isoformat()
             }
+    
+    async def aclose(self) -> None:
+        """Stop the agent's worker threads (the shared clients are closed by the service container)"""
+        self._prefetch_executor.shutdown(wait=False, cancel_futures=True)
+        if "summarizer" in self.__dict__:
+            self.summarizer.close()
@@ -0,0 +1,536 @@
+"""
+Local in-process search backend for the Knowledge Worker Agent
+Stores vectors in a memory-mapped NumPy matrix so dev, CI and load tests run without Azure AI Search
+"""
+import os
+import re
+import json
+import asyncio
+import hashlib
+import logging
+import shutil
+import sqlite3
+import threading
+from types import SimpleNamespace
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+
+import numpy as np
+from openai import AzureOpenAI
+
+from azure_search_service import SearchServiceBase
+from bm25_index import BM25Index, reciprocal_rank_fusion
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Fields that can appear in "field eq 'value'" filters against the local index
+_FILTERABLE_FIELDS = {"id", "parent_id", "category"}
+_FILTER_CLAUSE = re.compile(r"^\s*(\w+)\s+eq\s+'((?:[^']|'')*)'\s*$")
+
+
+class HashingEmbeddingClient:
+    """Offline stand-in for the Azure OpenAI embeddings client
+
+    Hashes words and word pairs into a fixed-size signed vector. It captures
+    lexical overlap only, but it is deterministic and needs no network, which is
+    what tests and local runs need.
+    """
+
+    def __init__(self, dimensions: int):
+        self.dimensions = dimensions
+        self.embeddings = self
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        words = re.findall(r"\w+", text.lower())
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dimensions
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def create(self, input, model: str = None, **kwargs):
+        texts = [input] if isinstance(input, str) else list(input)
+        return SimpleNamespace(data=[SimpleNamespace(index=i, embedding=self._embed(text))
+                                     for i, text in enumerate(texts)])
+
+
+class LocalSearchService(SearchServiceBase):
+    """Search service with the AzureSearchService surface, backed by files on local disk
+
+    Vectors are L2-normalized into a float32 ``vectors.f32`` matrix (one row per
+    chunk), so cosine similarity is a single matrix-vector product. Documents and
+    row assignments live in SQLite. Above LOCAL_INDEX_ANN_THRESHOLD vectors an
+    HNSW graph (hnswlib, optional) answers unfiltered queries approximately.
+    Like Azure's hybrid query, vector hits are fused with BM25 keyword hits
+    using reciprocal rank fusion.
+    """
+
+    def __init__(self, openai_client: Optional[AzureOpenAI] = None):
+        """Open (or create) the local index for AZURE_SEARCH_INDEX_NAME"""
+        super().__init__()
+
+        self.index_dir = os.path.join(os.getenv("LOCAL_INDEX_DIR", os.path.join(".cache", "local_index")),
+                                      self.index_name)
+        self.ann_threshold = int(os.getenv("LOCAL_INDEX_ANN_THRESHOLD", "20000"))
+        self.hnsw_m = int(os.getenv("LOCAL_INDEX_HNSW_M", "16"))
+        self.hnsw_ef_construction = int(os.getenv("LOCAL_INDEX_HNSW_EF_CONSTRUCTION", "200"))
+        self.hnsw_ef_search = int(os.getenv("LOCAL_INDEX_HNSW_EF_SEARCH", "100"))
+        self.hybrid_search = os.getenv("LOCAL_HYBRID_SEARCH", "true").lower() == "true"
+        self.rrf_k = int(os.getenv("LOCAL_RRF_K", "60"))
+
+        # Embed with Azure OpenAI when it is configured, otherwise hash locally
+        embeddings_mode = os.getenv("LOCAL_EMBEDDINGS", "auto").lower()
+        if embeddings_mode == "azure" or (embeddings_mode == "auto" and os.getenv("AZURE_OPENAI_ENDPOINT")):
+            self.openai_client = openai_client or AzureOpenAI(
+                api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+                api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-06-01"),
+                azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
+            )
+        else:
+            logger.info("Using offline hashing embeddings for the local search backend")
+            self.openai_client = HashingEmbeddingClient(self.embedding_dimensions)
+            self.embedding_deployment = "local-hashing"
+            self.embedding_cache = None
+
+        self._lock = threading.RLock()
+        self._ann = None
+        self._ann_dirty = False
+        self._closed = False
+        self._open()
+
+    # ------------------------------------------------------------------ storage
+
+    def _open(self) -> None:
+        """Open the document table and vector matrix, resetting them if the layout changed"""
+        os.makedirs(self.index_dir, exist_ok=True)
+        self._vectors_path = os.path.join(self.index_dir, "vectors.f32")
+        self._ann_path = os.path.join(self.index_dir, "hnsw.bin")
+
+        self._db = sqlite3.connect(os.path.join(self.index_dir, "index.db"), check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "id TEXT PRIMARY KEY, row INTEGER NOT NULL UNIQUE, parent_id TEXT, category TEXT, "
+            "document TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS documents_parent_id ON documents (parent_id)")
+
+        row = self._db.execute("SELECT value FROM meta WHERE name = 'dimensions'").fetchone()
+        if row is None or int(row[0]) != self.embedding_dimensions or not os.path.exists(self._vectors_path):
+            if row is not None:
+                logger.warning(f"Local index dimensions changed ({row[0]} -> {self.embedding_dimensions}), resetting index")
+            self._db.execute("DELETE FROM documents")
+            self._db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('dimensions', ?)",
+                             (str(self.embedding_dimensions),))
+            self._db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('revision', '0')")
+            self._db.commit()
+            for path in (self._vectors_path, self._ann_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            shutil.rmtree(os.path.join(self.index_dir, "bm25"), ignore_errors=True)
+            self._resize_vector_file(1024)
+
+        row_bytes = self.embedding_dimensions * 4
+        capacity = os.path.getsize(self._vectors_path) // row_bytes
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+",
+                                  shape=(capacity, self.embedding_dimensions))
+
+        rows = [row for (row,) in self._db.execute("SELECT row FROM documents")]
+        self._valid = np.zeros(capacity, dtype=bool)
+        self._valid[rows] = True
+        self._row_count = max(rows) + 1 if rows else 0
+        self._free_rows = sorted(set(range(self._row_count)) - set(rows), reverse=True)
+        self._revision = int(self._db.execute("SELECT value FROM meta WHERE name = 'revision'").fetchone()[0])
+        self._load_ann()
+        self.keyword_index = BM25Index(os.path.join(self.index_dir, "bm25"))
+        logger.info(f"Local search index opened at '{self.index_dir}' with {len(rows)} entries")
+
+    def _resize_vector_file(self, capacity: int) -> None:
+        with open(self._vectors_path, "ab") as vector_file:
+            vector_file.truncate(capacity * self.embedding_dimensions * 4)
+
+    def _ensure_capacity(self, needed_rows: int) -> None:
+        """Grow the vector matrix (doubling) so it holds at least needed_rows rows"""
+        capacity = self._vectors.shape[0]
+        if needed_rows <= capacity:
+            return
+        new_capacity = max(capacity * 2, needed_rows)
+        self._vectors.flush()
+        del self._vectors
+        self._resize_vector_file(new_capacity)
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+",
+                                  shape=(new_capacity, self.embedding_dimensions))
+        self._valid = np.concatenate([self._valid, np.zeros(new_capacity - capacity, dtype=bool)])
+        if self._ann is not None:
+            self._ann.resize_index(new_capacity)
+
+    def _allocate_row(self) -> int:
+        if self._free_rows:
+            return self._free_rows.pop()
+        self._row_count += 1
+        self._ensure_capacity(self._row_count)
+        return self._row_count - 1
+
+    def _bump_revision(self) -> None:
+        self._revision += 1
+        self._db.execute("UPDATE meta SET value = ? WHERE name = 'revision'", (str(self._revision),))
+
+    # -------------------------------------------------------------- ANN index
+
+    def _load_ann(self) -> None:
+        """Load the saved HNSW graph if it matches the current index revision"""
+        if hnswlib is None or not os.path.exists(self._ann_path):
+            return
+        row = self._db.execute("SELECT value FROM meta WHERE name = 'ann_revision'").fetchone()
+        if row is None or int(row[0]) != self._revision:
+            return
+        try:
+            ann = hnswlib.Index(space="cosine", dim=self.embedding_dimensions)
+            ann.load_index(self._ann_path, max_elements=self._vectors.shape[0])
+            ann.set_ef(self.hnsw_ef_search)
+            self._ann = ann
+        except Exception as e:
+            logger.warning(f"Could not load saved HNSW index, it will be rebuilt: {str(e)}")
+
+    def _ensure_ann(self) -> None:
+        """Build the HNSW graph once the index outgrows exact search"""
+        if self._ann is not None or hnswlib is None or int(self._valid.sum()) < self.ann_threshold:
+            return
+        rows = np.flatnonzero(self._valid)
+        logger.info(f"Building HNSW index over {len(rows)} vectors")
+        ann = hnswlib.Index(space="cosine", dim=self.embedding_dimensions)
+        ann.init_index(max_elements=self._vectors.shape[0], ef_construction=self.hnsw_ef_construction, M=self.hnsw_m)
+        ann.add_items(self._vectors[rows], rows)
+        ann.set_ef(self.hnsw_ef_search)
+        self._ann = ann
+        self._ann_dirty = True
+
+    def _save_ann(self) -> None:
+        if self._ann is None or not self._ann_dirty:
+            return
+        self._ann.save_index(self._ann_path)
+        self._db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('ann_revision', ?)", (str(self._revision),))
+        self._db.commit()
+        self._ann_dirty = False
+
+    # ------------------------------------------------------------- public API
+
+    def create_search_index(self) -> bool:
+        """The local index is created on open; kept for interface parity"""
+        logger.info(f"Local search index '{self.index_name}' ready at '{self.index_dir}'")
+        return True
+
+    def _write(self, search_documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Upsert schema-mapped documents and return per-document results"""
+        results = []
+        records = []
+        with self._lock:
+            for search_document in search_documents:
+                vector = np.asarray(search_document["content_vector"], dtype=np.float32)
+                if vector.shape != (self.embedding_dimensions,):
+                    results.append({"id": search_document["id"], "success": False, "status_code": 400,
+                                    "error": f"Vector has {vector.size} dimensions, expected {self.embedding_dimensions}"})
+                    continue
+                norm = np.linalg.norm(vector)
+                vector = vector / norm if norm else vector
+
+                existing = self._db.execute("SELECT row FROM documents WHERE id = ?", (search_document["id"],)).fetchone()
+                row = existing[0] if existing else self._allocate_row()
+                self._vectors[row] = vector
+                self._valid[row] = True
+                if self._ann is not None:
+                    # add_items with an existing (or deleted) label replaces it
+                    self._ann.add_items(vector[np.newaxis, :], [row])
+                    self._ann_dirty = True
+
+                record = {key: value for key, value in search_document.items() if key != "content_vector"}
+                records.append((search_document["id"], row, record["parent_id"], record["category"], json.dumps(record)))
+                self.keyword_index.add(search_document["id"], f"{record['title']}\n{record['content']}")
+                results.append({"id": search_document["id"], "success": True, "status_code": 201, "error": None})
+
+            if records:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO documents (id, row, parent_id, category, document) VALUES (?, ?, ?, ?, ?)",
+                    records
+                )
+                self._bump_revision()
+                self._vectors.flush()
+                self._db.commit()
+                self.keyword_index.commit()
+        return results
+
+    def index_documents(self, documents: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Bulk index documents, returning one result per input document in input order"""
+        results: List[Dict[str, Any]] = []
+        positions: Dict[str, List[int]] = {}
+
+        for window in self._windows(documents, self.upload_batch_size):
+            valid = self._validate_window(window, results)
+            pending = [(position, doc) for position, doc in valid if not doc.get("content_vector")]
+            embeddings = self.generate_embeddings_batch([doc["content"] for _, doc in pending])
+            search_documents = self._build_window_documents(valid, pending, embeddings, results, positions)
+            for result in self._write(search_documents):
+                for position in positions.get(result["id"], []):
+                    results[position] = result
+
+        self._invalidate_query_cache()
+        succeeded = sum(1 for result in results if result["success"])
+        logger.info(f"Indexed {succeeded}/{len(results)} documents locally")
+        return results
+
+    def index_document(self, document: Dict[str, Any]) -> bool:
+        """Index a single document, returning True or an error message for the API response"""
+        try:
+            result = self.index_documents([document])[0]
+            if result["success"]:
+                return True
+            logger.error(f"Failed to index document '{document.get('id')}': {result['error']}")
+            return result["error"] or False
+        except Exception as e:
+            logger.error(f"Error indexing document '{document.get('id', 'unknown')}': {str(e)}")
+            return str(e)
+
+    @staticmethod
+    def _parse_filter(filters: str) -> Tuple[str, List[str]]:
+        """Translate "field eq 'value' and ..." filters into a SQL condition"""
+        conditions, parameters = [], []
+        for clause in re.split(r"\s+and\s+", filters.strip(), flags=re.IGNORECASE):
+            match = _FILTER_CLAUSE.match(clause)
+            if not match or match.group(1) not in _FILTERABLE_FIELDS:
+                raise ValueError(f"Unsupported filter for the local search backend: {clause}")
+            conditions.append(f"{match.group(1)} = ?")
+            parameters.append(match.group(2).replace("''", "'"))
+        return " AND ".join(conditions), parameters
+
+    def _filter_rows(self, filters: str) -> Tuple[np.ndarray, List[str]]:
+        """Return the rows and keys of documents matching a filter"""
+        condition, parameters = self._parse_filter(filters)
+        matches = self._db.execute(f"SELECT row, id FROM documents WHERE {condition}", parameters).fetchall()
+        return np.array([row for row, _ in matches], dtype=np.int64), [key for _, key in matches]
+
+    def _nearest_rows(self, query_vector: np.ndarray, k: int, rows: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """Return (row, cosine similarity) pairs for the k nearest vectors, optionally among given rows"""
+        if rows is None:
+            self._ensure_ann()
+            active = int(self._valid.sum())
+            if self._ann is not None and active:
+                try:
+                    self._ann.set_ef(max(self.hnsw_ef_search, k))
+                    labels, distances = self._ann.knn_query(query_vector, k=min(k, active))
+                    return [(int(row), 1.0 - float(distance)) for row, distance in zip(labels[0], distances[0])]
+                except RuntimeError as e:
+                    logger.warning(f"HNSW query failed, using exact search: {str(e)}")
+            rows = np.flatnonzero(self._valid[:self._row_count])
+
+        if rows.size == 0:
+            return []
+        scores = self._vectors[rows] @ query_vector
+        if rows.size > k:
+            best = np.argpartition(-scores, k - 1)[:k]
+        else:
+            best = np.arange(rows.size)
+        best = best[np.argsort(-scores[best])]
+        return [(int(rows[i]), float(scores[i])) for i in best]
+
+    def _fetch_documents(self, column: str, values: List[Any]) -> Dict[Any, Dict[str, Any]]:
+        """Load stored documents by row or id"""
+        if not values:
+            return {}
+        placeholders = ",".join("?" * len(values))
+        return {
+            value: json.loads(document) for value, document in self._db.execute(
+                f"SELECT {column}, document FROM documents WHERE {column} IN ({placeholders})", values
+            )
+        }
+
+    def search_documents(self, query: str, top: int = 5, use_semantic_search: bool = True,
+                         filters: Optional[str] = None, use_cache: bool = True) -> List[Dict[str, Any]]:
+        """Perform hybrid (cosine k-NN + BM25) search; semantic ranking is not available locally"""
+        try:
+            cached, cache_key, generation = self._lookup_cached_search(query, top, use_semantic_search, filters, use_cache)
+            if cached is not None:
+                return cached
+
+            query_embedding = self.generate_embeddings(query)
+            if not query_embedding:
+                return []
+            query_vector = np.asarray(query_embedding, dtype=np.float32)
+            norm = np.linalg.norm(query_vector)
+            query_vector = query_vector / norm if norm else query_vector
+
+            k = top * self.chunk_search_oversample
+            with self._lock:
+                rows, keys = self._filter_rows(filters) if filters else (None, None)
+                nearest = self._nearest_rows(query_vector, k, rows)
+                stored = self._fetch_documents("row", [row for row, _ in nearest])
+                ranked = [(stored[row]["id"], score) for row, score in nearest if row in stored]
+                documents = {stored[row]["id"]: stored[row] for row, _ in nearest if row in stored}
+
+                if self.hybrid_search:
+                    keyword_hits = self.keyword_index.search(query, k, keys)
+                    ranked = reciprocal_rank_fusion(
+                        [[key for key, _ in ranked], [key for key, _ in keyword_hits]], self.rrf_k
+                    )[:k]
+                    missing = [key for key, _ in ranked if key not in documents]
+                    documents.update(self._fetch_documents("id", missing))
+
+            formatted_results = []
+            for key, score in ranked:
+                if key in documents:
+                    hit = dict(documents[key])
+                    hit["@search.score"] = score
+                    formatted_results.append(self._format_search_result(hit))
+
+            collapsed_results = self._collapse_chunk_results(formatted_results, top)
+            logger.info(f"Found {len(collapsed_results)} documents ({len(formatted_results)} chunks) for query: {query}")
+            self._store_cached_search(cache_key, generation, collapsed_results)
+            return collapsed_results
+        except Exception as e:
+            logger.error(f"Error searching documents: {str(e)}")
+            return []
+
+    def get_document(self, document_id: str) -> Optional[Dict[str, Any]]:
+        """Fetch a document by key, reassembling its chunks"""
+        try:
+            with self._lock:
+                entries = [json.loads(document) for (document,) in self._db.execute(
+                    "SELECT document FROM documents WHERE parent_id = ?", (document_id,))]
+                if not entries:
+                    entries = [json.loads(document) for (document,) in self._db.execute(
+                        "SELECT document FROM documents WHERE id = ?", (document_id,))]
+            return self._assemble_document(document_id, entries) if entries else None
+        except Exception as e:
+            logger.error(f"Error getting document '{document_id}': {str(e)}")
+            return None
+
+    def document_exists(self, document_id: str) -> bool:
+        """Check whether a document (or any of its chunks) is in the local index"""
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM documents WHERE id = ? OR parent_id = ? LIMIT 1",
+                                    (document_id, document_id)).fetchone() is not None
+
+    def delete_document(self, document_id: str) -> bool:
+        """Delete a document (and all of its chunks) from the local index"""
+        try:
+            with self._lock:
+                matches = self._db.execute(
+                    "SELECT row, id FROM documents WHERE id = ? OR parent_id = ?", (document_id, document_id)).fetchall()
+                rows = [row for row, _ in matches]
+                self._db.execute("DELETE FROM documents WHERE id = ? OR parent_id = ?", (document_id, document_id))
+                self.keyword_index.delete([key for _, key in matches])
+                self.keyword_index.commit()
+                for row in rows:
+                    self._valid[row] = False
+                    self._free_rows.append(row)
+                    if self._ann is not None:
+                        self._ann.mark_deleted(row)
+                        self._ann_dirty = True
+                self._bump_revision()
+                self._db.commit()
+            self._invalidate_query_cache()
+            logger.info(f"Document '{document_id}' deleted successfully ({len(rows)} index entries)")
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting document: {str(e)}")
+            return False
+
+    def get_index_statistics(self) -> Dict[str, Any]:
+        """Get statistics about the local index"""
+        try:
+            storage_size = sum(os.path.getsize(os.path.join(self.index_dir, name))
+                               for name in os.listdir(self.index_dir))
+            return {
+                "document_count": int(self._valid.sum()),
+                "storage_size": storage_size,
+                "backend": "local",
+                "approximate_search": self._ann is not None,
+                "keyword_index": self.keyword_index.get_statistics()
+            }
+        except Exception as e:
+            logger.error(f"Error getting index statistics: {str(e)}")
+            return {}
+
+    def close(self) -> None:
+        """Flush vectors, save the HNSW graph and keyword index and close the database"""
+        with self._lock:
+            if self._closed:
+                return
+            self._vectors.flush()
+            self._save_ann()
+            self.keyword_index.close()
+            self._db.close()
+            self._closed = True
+
+
+class AsyncLocalSearchService:
+    """Awaitable wrapper around the shared LocalSearchService for the async routes"""
+
+    def __init__(self):
+        self._service = get_local_search_service()
+        self.index_name = self._service.index_name
+
+    async def create_search_index(self) -> bool:
+        return await asyncio.to_thread(self._service.create_search_index)
+
+    async def generate_embeddings(self, text: str) -> List[float]:
+        return await asyncio.to_thread(self._service.generate_embeddings, text)
+
+    async def generate_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.to_thread(self._service.generate_embeddings_batch, texts)
+
+    async def index_documents(self, documents: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self._service.index_documents, list(documents))
+
+    async def index_document(self, document: Dict[str, Any]) -> bool:
+        return await asyncio.to_thread(self._service.index_document, document)
+
+    async def search_documents(self, query: str, top: int = 5, use_semantic_search: bool = True,
+                               filters: Optional[str] = None, use_cache: bool = True) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self._service.search_documents, query, top, use_semantic_search, filters, use_cache)
+
+    async def get_document(self, document_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._service.get_document, document_id)
+
+    async def document_exists(self, document_id: str) -> bool:
+        return await asyncio.to_thread(self._service.document_exists, document_id)
+
+    async def delete_document(self, document_id: str) -> bool:
+        return await asyncio.to_thread(self._service.delete_document, document_id)
+
+    async def get_index_statistics(self) -> Dict[str, Any]:
+        return await asyncio.to_thread(self._service.get_index_statistics)
+
+    def get_embedding_cache_statistics(self) -> Dict[str, Any]:
+        return self._service.get_embedding_cache_statistics()
+
+    def get_query_cache_statistics(self) -> Dict[str, Any]:
+        return self._service.get_query_cache_statistics()
+
+    async def close(self) -> None:
+        await asyncio.to_thread(self._service.close)
+
+
+_shared_services: Dict[str, LocalSearchService] = {}
+_shared_lock = threading.Lock()
+
+
+def get_local_search_service(openai_client: Optional[AzureOpenAI] = None) -> LocalSearchService:
+    """Return the process-wide local index for the configured index name
+
+    All callers share one instance so row allocation and the HNSW graph are
+    never updated by two objects over the same files.
+    """
+    index_name = os.getenv("AZURE_SEARCH_INDEX_NAME", "knowledge-base")
+    with _shared_lock:
+        service = _shared_services.get(index_name)
+        if service is None or service._closed:
+            service = _shared_services[index_name] = LocalSearchService(openai_client)
+        return service
@@ -0,0 +1,167 @@
+"""
+PDF text extraction for the Knowledge Worker Agent
+Streams page text lazily and fans page ranges of large PDFs out to worker processes
+"""
+import io
+import os
+import logging
+import tempfile
+import multiprocessing
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+import PyPDF2
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PdfSource = Union[bytes, str]
+
+
+@contextmanager
+def _open_reader(source: PdfSource) -> Iterator[PyPDF2.PdfReader]:
+    """Open a PDF from raw bytes or a file path
+
+    Paths are read through an open file handle; PyPDF2 would otherwise load the
+    whole file into memory.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        yield PyPDF2.PdfReader(io.BytesIO(source))
+        return
+    with open(source, "rb") as pdf_file:
+        yield PyPDF2.PdfReader(pdf_file)
+
+
+def iter_pdf_pages(source: PdfSource, start: int = 0, stop: Optional[int] = None,
+                   filename: str = "") -> Iterator[Tuple[int, str]]:
+    """Yield (page_number, text) for pages [start, stop), numbered from 1
+
+    Pages are parsed one at a time; a page that fails to extract yields empty text.
+    """
+    with _open_reader(source) as reader:
+        yield from _iter_reader_pages(reader, start, stop, filename)
+
+
+def _iter_reader_pages(reader: PyPDF2.PdfReader, start: int = 0, stop: Optional[int] = None,
+                       filename: str = "") -> Iterator[Tuple[int, str]]:
+    """Yield page text from an already opened reader"""
+    stop = len(reader.pages) if stop is None else min(stop, len(reader.pages))
+    for index in range(start, stop):
+        try:
+            text = reader.pages[index].extract_text() or ""
+        except Exception as page_error:
+            logger.warning(f"Error extracting text from page {index + 1} of {filename}: {str(page_error)}")
+            text = ""
+        yield index + 1, text.strip()
+
+
+def _extract_page_range(source: PdfSource, start: int, stop: int, filename: str) -> List[Tuple[int, str]]:
+    """Extract one page range (module-level so it can run in a worker process)"""
+    return list(iter_pdf_pages(source, start, stop, filename))
+
+
+class PdfExtractor:
+    """Extracts PDF text page by page, in parallel for large documents"""
+
+    def __init__(self):
+        """Initialize from PDF_* environment settings"""
+        self.workers = int(os.getenv("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+        self.parallel_min_pages = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "200"))
+        self.page_range_size = int(os.getenv("PDF_PAGE_RANGE_SIZE", "50"))
+
+    def _use_processes(self, page_count: int) -> bool:
+        # Never nest pools: when already running inside a worker process, extract serially
+        return (self.workers > 1 and page_count >= self.parallel_min_pages
+                and multiprocessing.parent_process() is None)
+
+    def _iter_parallel(self, path: str, page_count: int, filename: str) -> Iterator[Tuple[int, str]]:
+        """Yield pages in order while worker processes extract page ranges
+
+        Only a few ranges are in flight at once, so memory stays close to the
+        size of those ranges rather than the whole document's parsed pages.
+        """
+        ranges = deque((start, min(start + self.page_range_size, page_count))
+                       for start in range(0, page_count, self.page_range_size))
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(ranges))) as pool:
+            in_flight = deque()
+            while ranges or in_flight:
+                while ranges and len(in_flight) < self.workers * 2:
+                    start, stop = ranges.popleft()
+                    in_flight.append(pool.submit(_extract_page_range, path, start, stop, filename))
+                yield from in_flight.popleft().result()
+
+    def iter_pages(self, source: PdfSource, reader: PyPDF2.PdfReader, filename: str = "") -> Iterator[Tuple[int, str]]:
+        """Yield (page_number, text) for every page of an opened PDF, in page order"""
+        page_count = len(reader.pages)
+        if not self._use_processes(page_count):
+            yield from _iter_reader_pages(reader, filename=filename)
+            return
+
+        logger.info(f"Extracting {page_count} pages of {filename} in ranges of {self.page_range_size} "
+                    f"across {self.workers} processes")
+        if isinstance(source, str):
+            yield from self._iter_parallel(source, page_count, filename)
+            return
+
+        # Hand workers a file path instead of pickling the whole PDF into every task
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as spool:
+            spool.write(source)
+        try:
+            yield from self._iter_parallel(spool.name, page_count, filename)
+        finally:
+            os.unlink(spool.name)
+
+    def extract(self, source: PdfSource, filename: str) -> Dict[str, Any]:
+        """Extract text from PDF bytes or a PDF file path, recording where each page starts in the text"""
+        try:
+            with _open_reader(source) as reader:
+                page_count = len(reader.pages)
+
+                # Check if PDF is valid and has pages
+                if page_count == 0:
+                    logger.warning(f"PDF {filename} has no pages")
+                    return {
+                        "success": False,
+                        "error": "PDF file has no pages"
+                    }
+
+                parts = []
+                page_offsets = []
+                offset = 0
+                for page_number, page_text in self.iter_pages(source, reader, filename):
+                    if not page_text:
+                        continue
+                    page_offsets.append([page_number, offset])
+                    parts.append(page_text)
+                    offset += len(page_text) + 1
+
+            # Check if we extracted any text
+            if not parts:
+                logger.warning(f"No text could be extracted from PDF {filename}")
+                return {
+                    "success": False,
+                    "error": "No extractable text found in PDF file. This might be a scanned PDF or image-based PDF."
+                }
+
+            logger.info(f"Successfully extracted text from {len(parts)}/{page_count} pages in {filename}")
+
+            return {
+                "success": True,
+                "content": "\n".join(parts),
+                "page_count": page_count,
+                "metadata": {
+                    "pages": page_count,
+                    "pages_processed": len(parts),
+                    "file_type": "pdf",
+                    "page_offsets": page_offsets
+                }
+            }
+        except Exception as e:
+            logger.error(f"Error processing PDF {filename}: {str(e)}")
+            return {
+                "success": False,
+                "error": f"PDF processing failed: {str(e)}"
+            }
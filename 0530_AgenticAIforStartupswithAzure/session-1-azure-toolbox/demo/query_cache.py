@@ -0,0 +1,110 @@
+"""
+Search result cache for the Knowledge Worker Agent
+Keeps recent search results in memory so repeated queries skip embedding and search calls
+"""
+import copy
+import time
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class QueryCache:
+    """Size-bounded LRU cache of search results with a time-to-live
+
+    Any change to the index calls invalidate(), which drops every entry and bumps
+    a generation counter. A search that started before the change passes the
+    generation it saw to put(), so its (possibly stale) result is not stored.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 300):
+        """Create an empty cache"""
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.generation = 0
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(query: str, top: int, use_semantic_search: bool, filters: Optional[str] = None) -> Tuple:
+        """Build the cache key from the normalized query and search options"""
+        normalized = " ".join(unicodedata.normalize("NFC", query).lower().split())
+        return (normalized, top, use_semantic_search, filters or "")
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return a copy of the cached result, or None on a miss or expired entry"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            stored_at, value = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return copy.deepcopy(value)
+
+    def put(self, key: Hashable, value: Any, generation: Optional[int] = None) -> None:
+        """Store a result unless the index changed since `generation` was read"""
+        value = copy.deepcopy(value)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self) -> None:
+        """Drop every cached result after the index changed"""
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+            self.invalidations += 1
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Return hit/miss counters and occupancy"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "expirations": self.expirations,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds
+        }
+
+
+_shared_caches: Dict[str, QueryCache] = {}
+_shared_lock = threading.Lock()
+
+
+def get_query_cache(index_name: str, max_entries: int = 1000, ttl_seconds: float = 300) -> QueryCache:
+    """Return the process-wide result cache for an index
+
+    The sync and async search services share it, so a write through either one
+    invalidates results cached by the other.
+    """
+    with _shared_lock:
+        if index_name not in _shared_caches:
+            _shared_caches[index_name] = QueryCache(max_entries, ttl_seconds)
+        return _shared_caches[index_name]
@@ -0,0 +1,43 @@
+"""
+Search backend selection for the Knowledge Worker Agent
+Picks Azure AI Search or the local in-process index based on SEARCH_BACKEND, importing only the selected backend
+"""
+import os
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SEARCH_BACKENDS = ("azure", "local")
+
+
+def get_search_backend() -> str:
+    """Return the configured backend name ("azure" by default)"""
+    backend = os.getenv("SEARCH_BACKEND", "azure").lower()
+    if backend not in SEARCH_BACKENDS:
+        raise ValueError(f"Unknown SEARCH_BACKEND '{backend}', expected one of {', '.join(SEARCH_BACKENDS)}")
+    return backend
+
+
+def create_search_service(openai_client=None, transport=None):
+    """Create the synchronous search service for the configured backend
+
+    openai_client and transport are optional shared clients (see service_container).
+    """
+    if get_search_backend() == "local":
+        from local_search_service import get_local_search_service
+        return get_local_search_service(openai_client)
+
+    from azure_search_service import AzureSearchService
+    return AzureSearchService(openai_client, transport)
+
+
+def create_async_search_service(openai_client=None, transport=None):
+    """Create the async search service for the configured backend"""
+    if get_search_backend() == "local":
+        from local_search_service import AsyncLocalSearchService
+        return AsyncLocalSearchService()
+
+    from async_azure_search_service import AsyncAzureSearchService
+    return AsyncAzureSearchService(openai_client, transport)
@@ -0,0 +1,232 @@
+"""
+Shared service container for the Knowledge Worker Agent
+Builds each Azure client once per process, on first use, over shared connection pools
+"""
+import os
+import time
+import logging
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional
+
+from search_backends import get_search_backend
+
+if TYPE_CHECKING:
+    import httpx
+    from azure.core.pipeline.transport import RequestsTransport
+    from openai import AzureOpenAI, AsyncAzureOpenAI
+    from async_azure_search_service import PooledAioHttpTransport
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class ServiceContainer:
+    """Process-wide registry of lazily built clients and services
+
+    Every component is created the first time it is asked for and then shared,
+    so importing the web app opens no connections and a worker holds exactly
+    one client per service. The SDKs themselves are imported by the builders,
+    so a process only loads the clients and search backend it uses:
+
+    - one AzureOpenAI and one AsyncAzureOpenAI client, used for chat,
+      summaries and embeddings, each over one httpx pool of
+      AZURE_OPENAI_MAX_CONNECTIONS connections;
+    - one sync and one async search service whose SearchClient and
+      SearchIndexClient share an azure.core transport over one pool of
+      AZURE_SEARCH_MAX_CONNECTIONS connections;
+    - the Blob Storage client and the pooled HTTP client for actions and URLs.
+
+    The socket ceiling per worker is therefore the sum of those pool sizes
+    (see get_statistics()). The container owns these clients; close them with
+    aclose() (or close() outside an event loop) on shutdown.
+    """
+
+    def __init__(self):
+        """Read pool sizes; nothing is built until first use"""
+        self.openai_max_connections = int(os.getenv("AZURE_OPENAI_MAX_CONNECTIONS", "20"))
+        self.search_max_connections = int(os.getenv("AZURE_SEARCH_MAX_CONNECTIONS", "20"))
+
+        self._instances: Dict[str, Any] = {}
+        self._build_ms: Dict[str, float] = {}
+        self._lock = threading.RLock()
+
+    def _get(self, name: str, factory: Callable[[], Any]) -> Any:
+        """Return the named component, building it on first use"""
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        with self._lock:
+            if name not in self._instances:
+                started = time.perf_counter()
+                self._instances[name] = factory()
+                self._build_ms[name] = round((time.perf_counter() - started) * 1000, 1)
+                logger.info(f"Created shared {name} in {self._build_ms[name]} ms")
+            return self._instances[name]
+
+    # ------------------------------------------------------------------ Azure OpenAI
+
+    def _openai_options(self) -> Dict[str, Any]:
+        return {
+            "api_key": os.getenv("AZURE_OPENAI_API_KEY"),
+            "api_version": os.getenv("AZURE_OPENAI_API_VERSION", "2024-06-01"),
+            "azure_endpoint": os.getenv("AZURE_OPENAI_ENDPOINT")
+        }
+
+    def _openai_limits(self) -> "httpx.Limits":
+        import httpx
+        return httpx.Limits(max_connections=self.openai_max_connections,
+                            max_keepalive_connections=self.openai_max_connections)
+
+    def _build_openai_client(self) -> "AzureOpenAI":
+        from openai import AzureOpenAI, DefaultHttpxClient
+        return AzureOpenAI(http_client=DefaultHttpxClient(limits=self._openai_limits()), **self._openai_options())
+
+    def _build_async_openai_client(self) -> "AsyncAzureOpenAI":
+        from openai import AsyncAzureOpenAI, DefaultAsyncHttpxClient
+        return AsyncAzureOpenAI(http_client=DefaultAsyncHttpxClient(limits=self._openai_limits()),
+                                **self._openai_options())
+
+    def openai_client(self) -> "AzureOpenAI":
+        """Shared synchronous Azure OpenAI client"""
+        return self._get("openai_client", self._build_openai_client)
+
+    def async_openai_client(self) -> "AsyncAzureOpenAI":
+        """Shared async Azure OpenAI client"""
+        return self._get("async_openai_client", self._build_async_openai_client)
+
+    # ------------------------------------------------------------------ Azure AI Search
+
+    def _build_search_transport(self) -> "RequestsTransport":
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        from azure.core.pipeline.transport import RequestsTransport
+
+        session = requests.Session()
+        # azure-core applies its own retry policy, so the adapter must not retry
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.search_max_connections,
+                              max_retries=Retry(total=False, redirect=False, raise_on_status=False))
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return RequestsTransport(session=session, session_owner=False)
+
+    def search_transport(self) -> "RequestsTransport":
+        """Shared azure.core transport for the sync search clients"""
+        return self._get("search_transport", self._build_search_transport)
+
+    def _build_async_search_transport(self) -> "PooledAioHttpTransport":
+        from async_azure_search_service import PooledAioHttpTransport
+        return PooledAioHttpTransport(self.search_max_connections)
+
+    def async_search_transport(self) -> "PooledAioHttpTransport":
+        """Shared aio transport for the async search clients"""
+        return self._get("async_search_transport", self._build_async_search_transport)
+
+    def search_service(self):
+        """Shared synchronous search service for the configured backend"""
+        def build():
+            from search_backends import create_search_service
+            if get_search_backend() == "local":
+                return create_search_service(self.openai_client())
+            return create_search_service(self.openai_client(), self.search_transport())
+        return self._get("search_service", build)
+
+    def async_search_service(self):
+        """Shared async search service for the configured backend"""
+        def build():
+            from search_backends import create_async_search_service
+            if get_search_backend() == "local":
+                return create_async_search_service()
+            return create_async_search_service(self.async_openai_client(), self.async_search_transport())
+        return self._get("async_search_service", build)
+
+    # ------------------------------------------------------------------ other clients
+
+    def blob_service_client(self):
+        """Shared Blob Storage client, or None when storage is not configured"""
+        def build():
+            # The Blob SDK is slow to import, so only processes that upload pay for it
+            storage_account_name = os.getenv("AZURE_STORAGE_ACCOUNT_NAME")
+            storage_account_key = os.getenv("AZURE_STORAGE_ACCOUNT_KEY")
+            if not (storage_account_name and storage_account_key):
+                logger.warning("Azure Storage not configured - file upload disabled")
+                return False
+            from azure.storage.blob import BlobServiceClient
+            return BlobServiceClient(
+                account_url=f"https://{storage_account_name}.blob.core.windows.net",
+                credential=storage_account_key
+            )
+        return self._get("blob_service_client", build) or None
+
+    def http_client(self):
+        """Shared pooled HTTP client for Functions actions and URL fetches"""
+        from http_client import get_http_client
+        return self._get("http_client", get_http_client)
+
+    # ------------------------------------------------------------------ lifecycle
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Return which components exist, how long each took to build, and their connection limits"""
+        with self._lock:
+            built = dict(self._build_ms)
+        pool_sizes = {
+            "openai_client": self.openai_max_connections,
+            "async_openai_client": self.openai_max_connections,
+            "search_transport": self.search_max_connections,
+            "async_search_transport": self.search_max_connections
+        }
+        limits = {name: size for name, size in pool_sizes.items() if name in built}
+        statistics = {
+            "components": built,
+            "connection_limits": limits,
+            "max_pooled_sockets": sum(limits.values())
+        }
+        if "http_client" in built:
+            # Bounded per host rather than in total
+            statistics["http_client_per_host_limit"] = self.http_client().per_host_limit
+        return statistics
+
+    def _pop(self, name: str) -> Optional[Any]:
+        with self._lock:
+            self._build_ms.pop(name, None)
+            return self._instances.pop(name, None)
+
+    def close(self) -> None:
+        """Close the synchronous clients that were built"""
+        service = self._pop("search_service")
+        if service is not None and hasattr(service, "close"):
+            service.close()
+        transport = self._pop("search_transport")
+        if transport is not None:
+            transport.session.close()
+        for name in ("openai_client", "blob_service_client", "http_client"):
+            client = self._pop(name)
+            if client:
+                client.close()
+
+    async def aclose(self) -> None:
+        """Close every client that was built (call on application shutdown)"""
+        service = self._pop("async_search_service")
+        if service is not None:
+            await service.close()
+        transport = self._pop("async_search_transport")
+        if transport is not None:
+            await transport.close()
+        client = self._pop("async_openai_client")
+        if client is not None:
+            await client.close()
+        self.close()
+
+
+_shared_container: Optional[ServiceContainer] = None
+_shared_lock = threading.Lock()
+
+
+def get_service_container() -> ServiceContainer:
+    """Return the process-wide service container"""
+    global _shared_container
+    with _shared_lock:
+        if _shared_container is None:
+            _shared_container = ServiceContainer()
+        return _shared_container
@@ -0,0 +1,142 @@
+"""
+Speculative retrieval for the Knowledge Worker Agent
+Starts a search for the user's message while the first completion runs, and hands it to a matching search tool call
+"""
+import re
+import json
+import time
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def query_overlap(first: str, second: str) -> float:
+    """Jaccard overlap of the lowercase word sets of two queries"""
+    first_terms = set(re.findall(r"\w+", first.lower()))
+    second_terms = set(re.findall(r"\w+", second.lower()))
+    if not first_terms or not second_terms:
+        return 0.0
+    return len(first_terms & second_terms) / len(first_terms | second_terms)
+
+
+class SpeculativeSearch:
+    """One prefetched search for a chat turn
+
+    `pending` is the running search (a concurrent.futures.Future for chat(), an
+    asyncio.Task for achat()); its result is the agent's search tool result. At
+    most one tool call may claim it.
+    """
+
+    def __init__(self, query: str, top: int, pending: Any = None):
+        self.query = query
+        self.top = top
+        self.pending = pending
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+        self.claimed = False
+        self.search_requested = False
+
+    def mark_finished(self) -> None:
+        self.finished = time.perf_counter()
+
+    def claim(self, function_call, min_overlap: float) -> bool:
+        """Return True if this search tool call can use the prefetched result"""
+        if function_call.name != "search_documents":
+            return False
+        self.search_requested = True
+        if self.claimed:
+            return False
+        try:
+            arguments = self._arguments(function_call)
+        except ValueError:
+            return False
+        if arguments.get("top_results", 5) > self.top:
+            return False
+        if query_overlap(self.query, arguments.get("query", "")) < min_overlap:
+            return False
+        self.claimed = True
+        return True
+
+    @staticmethod
+    def _arguments(function_call) -> Dict[str, Any]:
+        return json.loads(function_call.arguments)
+
+    def adapt_result(self, search_result: Dict[str, Any], function_call) -> Dict[str, Any]:
+        """Trim the prefetched result to the tool call's result count
+
+        The result keeps the query that was actually searched (the user's message);
+        the tool call's own query is reported alongside it as `requested_query`.
+        """
+        arguments = self._arguments(function_call)
+        results = search_result["results"][:arguments.get("top_results", 5)]
+        return {
+            **search_result,
+            "results": results,
+            "total_found": len(results),
+            "query": self.query,
+            "requested_query": arguments["query"],
+            "speculative": True
+        }
+
+    def latency_saved(self, claimed_at: float) -> float:
+        """Seconds the tool call saved versus starting the same search when it was requested
+
+        Without speculation the search would have finished at claimed_at + duration;
+        with it, the result was ready at max(claimed_at, finished).
+        """
+        duration = (self.finished or claimed_at) - self.started
+        return max(0.0, min(duration, claimed_at - self.started))
+
+
+class SpeculationStatistics:
+    """Thread-safe counters for speculative searches"""
+
+    def __init__(self):
+        self.speculations = 0
+        self.hits = 0
+        self.misses = 0
+        self.unused = 0
+        self.errors = 0
+        self.latency_saved_seconds = 0.0
+        self.wasted_search_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record_hit(self, saved_seconds: float) -> None:
+        with self._lock:
+            self.hits += 1
+            self.latency_saved_seconds += saved_seconds
+
+    def record_error(self) -> None:
+        with self._lock:
+            self.errors += 1
+
+    def record_finished(self, speculation: SpeculativeSearch) -> None:
+        """Count a turn's speculation once the turn is over"""
+        with self._lock:
+            self.speculations += 1
+            if speculation.claimed:
+                return
+            if speculation.search_requested:
+                self.misses += 1
+            else:
+                self.unused += 1
+            if speculation.finished is not None:
+                self.wasted_search_seconds += speculation.finished - speculation.started
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Return hit rate and latency saved"""
+        return {
+            "speculations": self.speculations,
+            "hits": self.hits,
+            "misses": self.misses,
+            "unused": self.unused,
+            "errors": self.errors,
+            "hit_rate": round(self.hits / self.speculations, 4) if self.speculations else 0.0,
+            "latency_saved_ms_total": round(self.latency_saved_seconds * 1000, 1),
+            "latency_saved_ms_per_hit": round(self.latency_saved_seconds * 1000 / self.hits, 1) if self.hits else 0.0,
+            "wasted_search_ms_total": round(self.wasted_search_seconds * 1000, 1)
+        }
@@ -0,0 +1,265 @@
+"""
+Document summarization for the Knowledge Worker Agent
+Summarizes long documents map-reduce style: sections in parallel, then a tree of merges
+"""
+import os
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from summary_cache import SummaryCache
+from text_chunker import TextChunker
+from tokenization import count_tokens
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_SYSTEM_MESSAGE = {"role": "system", "content": "You are a professional document analyst. Provide clear, structured summaries."}
+
+_STRUCTURE = """Provide a structured summary including:
+1. Main topics covered
+2. Key insights or findings
+3. Important details
+4. Actionable items (if any)"""
+
+
+class DocumentSummarizer:
+    """Hierarchical summarizer with cached intermediate summaries
+
+    Documents that fit in one section are summarized in a single call. Longer
+    ones are split into token-bounded sections that are summarized concurrently
+    (map); the section summaries are then packed into groups that fit one
+    request and merged level by level until one group remains, which produces
+    the final structured summary (reduce). With the default sizes a document
+    of up to ~30 sections needs one map round and the final call.
+
+    Section and merge summaries are cached by a hash of their input, so after a
+    small edit only the changed section and the merges above it are recomputed.
+    """
+
+    def __init__(self, openai_client, async_openai_client, deployment_name: str,
+                 cache: Optional[SummaryCache] = None, variant: str = ""):
+        """Initialize from clients and SUMMARY_* environment settings"""
+        self.openai_client = openai_client
+        self.async_openai_client = async_openai_client
+        self.deployment_name = deployment_name
+        self.cache = cache
+        self.variant = variant or deployment_name
+
+        self.section_tokens = int(os.getenv("SUMMARY_SECTION_TOKENS", "3000"))
+        self.section_summary_tokens = int(os.getenv("SUMMARY_SECTION_SUMMARY_TOKENS", "400"))
+        self.reduce_input_tokens = int(os.getenv("SUMMARY_REDUCE_INPUT_TOKENS", "12000"))
+        self.max_concurrency = int(os.getenv("SUMMARY_MAX_CONCURRENCY", "8"))
+
+        self.chunker = TextChunker(max_tokens=self.section_tokens, overlap_tokens=0)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="summarize")
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    # ------------------------------------------------------------------ prompts
+
+    @staticmethod
+    def _single_messages(title: str, content: str) -> List[Dict[str, str]]:
+        """Prompt for a document that fits in one request"""
+        return [_SYSTEM_MESSAGE, {"role": "user", "content": f"""Please provide a comprehensive summary of the following document:
+
+Title: {title or 'N/A'}
+Content: {content}
+
+{_STRUCTURE}"""}]
+
+    @staticmethod
+    def _section_messages(title: str, number: int, total: int, text: str) -> List[Dict[str, str]]:
+        return [_SYSTEM_MESSAGE, {"role": "user", "content": f"""Summarize part {number} of {total} of the document "{title or 'N/A'}".
+Keep its main topics, key findings, important details (names, numbers, dates) and any action items.
+Be concise; this summary will be combined with the summaries of the other parts.
+
+{text}"""}]
+
+    @staticmethod
+    def _numbered(summaries: List[str]) -> str:
+        return "\n\n".join(f"Part {number}:\n{summary}" for number, summary in enumerate(summaries, 1))
+
+    def _merge_messages(self, title: str, summaries: List[str]) -> List[Dict[str, str]]:
+        return [_SYSTEM_MESSAGE, {"role": "user", "content": f"""The following are summaries of consecutive parts of the document "{title or 'N/A'}".
+Combine them into one concise summary that keeps every main topic, key finding, important detail and action item.
+
+{self._numbered(summaries)}"""}]
+
+    def _final_messages(self, title: str, summaries: List[str]) -> List[Dict[str, str]]:
+        return [_SYSTEM_MESSAGE, {"role": "user", "content": f"""Please provide a comprehensive summary of the following document, given as summaries of its consecutive parts:
+
+Title: {title or 'N/A'}
+
+{self._numbered(summaries)}
+
+{_STRUCTURE}"""}]
+
+    # ------------------------------------------------------------------ planning
+
+    def _sections(self, content: str) -> List[str]:
+        return [chunk["content"] for chunk in self.chunker.chunk_text(content or "")]
+
+    def _section_requests(self, title: str, sections: List[str]) -> List[Tuple[str, List[Dict[str, str]]]]:
+        return [
+            (self._cache_key("section", f"{title}\n{section}"), self._section_messages(title, number, len(sections), section))
+            for number, section in enumerate(sections, 1)
+        ]
+
+    def _merge_requests(self, title: str, groups: List[List[str]]) -> List[Tuple[str, List[Dict[str, str]]]]:
+        return [
+            (self._cache_key("merge", f"{title}\n" + "\n\x00\n".join(group)), self._merge_messages(title, group))
+            for group in groups
+        ]
+
+    def _cache_key(self, kind: str, text: str) -> str:
+        return SummaryCache.section_key(self.variant, kind, text)
+
+    def _group(self, summaries: List[str]) -> List[List[str]]:
+        """Pack consecutive summaries into groups that fit one reduce request (at least two per group)"""
+        groups: List[List[str]] = []
+        current: List[str] = []
+        current_tokens = 0
+        for summary in summaries:
+            tokens = count_tokens(summary)
+            if len(current) >= 2 and current_tokens + tokens > self.reduce_input_tokens:
+                groups.append(current)
+                current, current_tokens = [], 0
+            current.append(summary)
+            current_tokens += tokens
+        if current:
+            if len(current) == 1 and groups:
+                groups[-1].append(current[0])
+            else:
+                groups.append(current)
+        return groups
+
+    # ------------------------------------------------------------------ model calls
+
+    def _complete(self, messages: List[Dict[str, str]], max_tokens: Optional[int] = None) -> str:
+        options = {"max_tokens": max_tokens} if max_tokens else {}
+        response = self.openai_client.chat.completions.create(
+            model=self.deployment_name,
+            messages=messages,
+            temperature=0.3,
+            **options
+        )
+        return response.choices[0].message.content or ""
+
+    async def _acomplete(self, messages: List[Dict[str, str]], max_tokens: Optional[int] = None) -> str:
+        options = {"max_tokens": max_tokens} if max_tokens else {}
+        async with self._semaphore:
+            response = await self.async_openai_client.chat.completions.create(
+                model=self.deployment_name,
+                messages=messages,
+                temperature=0.3,
+                **options
+            )
+        return response.choices[0].message.content or ""
+
+    @staticmethod
+    def _check_deadline(deadline: Optional[float]) -> None:
+        """Raise once a perf_counter() deadline has passed, so no further model calls are made"""
+        if deadline is not None and time.perf_counter() >= deadline:
+            raise TimeoutError("Summary deadline passed")
+
+    def _cached(self, requests: List[Tuple[str, List[Dict[str, str]]]], stats: Dict[str, int]) -> List[Optional[str]]:
+        results = [self.cache.get_section(key) if self.cache else None for key, _ in requests]
+        stats["cached"] += sum(result is not None for result in results)
+        return results
+
+    def _store(self, requests, results: List[Optional[str]], missing: List[int], stats: Dict[str, int]) -> None:
+        stats["model_calls"] += len(missing)
+        for index in missing:
+            if self.cache is not None and results[index]:
+                self.cache.put_section(requests[index][0], results[index])
+
+    def _run(self, requests: List[Tuple[str, List[Dict[str, str]]]], stats: Dict[str, int],
+             deadline: Optional[float] = None) -> List[str]:
+        """Run uncached requests concurrently on the thread pool, skipping any not started by the deadline"""
+        results = self._cached(requests, stats)
+        missing = [index for index, result in enumerate(results) if result is None]
+
+        def complete(index: int) -> str:
+            self._check_deadline(deadline)
+            return self._complete(requests[index][1], self.section_summary_tokens)
+
+        completed = self._executor.map(complete, missing)
+        for index, summary in zip(missing, completed):
+            results[index] = summary
+        self._store(requests, results, missing, stats)
+        return results
+
+    async def _arun(self, requests: List[Tuple[str, List[Dict[str, str]]]], stats: Dict[str, int]) -> List[str]:
+        """Run uncached requests concurrently, at most SUMMARY_MAX_CONCURRENCY at a time"""
+        results = self._cached(requests, stats)
+        missing = [index for index, result in enumerate(results) if result is None]
+        completed = await asyncio.gather(*(self._acomplete(requests[index][1], self.section_summary_tokens)
+                                           for index in missing))
+        for index, summary in zip(missing, completed):
+            results[index] = summary
+        self._store(requests, results, missing, stats)
+        return results
+
+    @staticmethod
+    def _result(summary: str, sections: List[str], stats: Dict[str, int]) -> Dict[str, Any]:
+        """levels counts sequential rounds of model calls (1 for a single-section document)"""
+        return {
+            "summary": summary,
+            "sections": len(sections),
+            "partials_cached": stats["cached"],
+            "model_calls": stats["model_calls"],
+            "levels": stats["levels"]
+        }
+
+    # ------------------------------------------------------------------ public API
+
+    def summarize(self, document: Dict[str, Any], deadline: Optional[float] = None) -> Dict[str, Any]:
+        """Summarize a document (title/content dict), returning the summary and coverage counters
+
+        With a deadline (a time.perf_counter() value) no model call is started
+        after it passes; TimeoutError is raised instead. The caller's thread
+        cannot be cancelled, so this is what stops an abandoned summary from
+        spending more tokens.
+        """
+        title, sections = document.get("title"), self._sections(document.get("content"))
+        stats = {"cached": 0, "model_calls": 1, "levels": 1}
+        if len(sections) <= 1:
+            return self._result(self._complete(self._single_messages(title, document.get("content", ""))), sections, stats)
+
+        stats["levels"] = 2
+        summaries = self._run(self._section_requests(title, sections), stats, deadline)
+        groups = self._group(summaries)
+        while len(groups) > 1:
+            stats["levels"] += 1
+            summaries = self._run(self._merge_requests(title, groups), stats, deadline)
+            groups = self._group(summaries)
+        logger.info(f"Summarized '{title}' from {len(sections)} sections "
+                    f"({stats['cached']} cached, {stats['model_calls']} model calls)")
+        self._check_deadline(deadline)
+        return self._result(self._complete(self._final_messages(title, groups[0])), sections, stats)
+
+    async def asummarize(self, document: Dict[str, Any]) -> Dict[str, Any]:
+        """Async counterpart of summarize()"""
+        title, sections = document.get("title"), self._sections(document.get("content"))
+        stats = {"cached": 0, "model_calls": 1, "levels": 1}
+        if len(sections) <= 1:
+            summary = await self._acomplete(self._single_messages(title, document.get("content", "")))
+            return self._result(summary, sections, stats)
+
+        stats["levels"] = 2
+        summaries = await self._arun(self._section_requests(title, sections), stats)
+        groups = self._group(summaries)
+        while len(groups) > 1:
+            stats["levels"] += 1
+            summaries = await self._arun(self._merge_requests(title, groups), stats)
+            groups = self._group(summaries)
+        logger.info(f"Summarized '{title}' from {len(sections)} sections "
+                    f"({stats['cached']} cached, {stats['model_calls']} model calls)")
+        return self._result(await self._acomplete(self._final_messages(title, groups[0])), sections, stats)
+
+    def close(self) -> None:
+        """Stop the section worker threads"""
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,174 @@
+"""
+Persistent summary cache for the Knowledge Worker Agent
+Stores generated document summaries on disk so repeat summaries skip Azure OpenAI
+"""
+import os
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from typing import Any, Dict, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class SummaryCache:
+    """Size-capped SQLite cache of summaries keyed by document id, content hash and variant
+
+    The content hash is part of the key, so a re-indexed document with new text
+    misses the cache instead of getting a stale summary. The variant separates
+    summaries made by different deployments or prompts. Storing a summary
+    replaces older ones for the same document and variant.
+
+    Intermediate (section and merge) summaries are kept separately, addressed
+    by a hash of their input text, so they are reused across edits and documents.
+    """
+
+    def __init__(self, cache_dir: str, max_entries: int = 10000, max_sections: int = 100000):
+        """Open (or create) the cache in cache_dir"""
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_sections = max_sections
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.section_hits = 0
+        self.section_misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(cache_dir, "summaries.db"), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS summaries ("
+            "document_id TEXT NOT NULL, variant TEXT NOT NULL, content_hash TEXT NOT NULL, "
+            "summary TEXT NOT NULL, created REAL NOT NULL, last_access REAL NOT NULL, "
+            "PRIMARY KEY (document_id, variant))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS summaries_last_access ON summaries (last_access)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sections (key TEXT PRIMARY KEY, summary TEXT NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS sections_last_access ON sections (last_access)")
+        self._db.commit()
+        self._count = self._db.execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+        self._section_count = self._db.execute("SELECT COUNT(*) FROM sections").fetchone()[0]
+        logger.info(f"Summary cache opened at '{cache_dir}' with {self._count}/{max_entries} entries")
+
+    @staticmethod
+    def content_hash(title: str, content: str) -> str:
+        """Hash the text a summary is generated from"""
+        return hashlib.sha256(f"{title or ''}\n{content or ''}".encode("utf-8")).hexdigest()
+
+    def get(self, document_id: str, content_hash: str, variant: str) -> Optional[Dict[str, Any]]:
+        """Return {"summary", "created"} for the document's current content, or None"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT summary, created FROM summaries WHERE document_id = ? AND variant = ? AND content_hash = ?",
+                (document_id, variant, content_hash)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._db.execute(
+                "UPDATE summaries SET last_access = ? WHERE document_id = ? AND variant = ?",
+                (time.time(), document_id, variant)
+            )
+            self._db.commit()
+            return {"summary": row[0], "created": row[1]}
+
+    def put(self, document_id: str, content_hash: str, variant: str, summary: str) -> None:
+        """Store a summary, evicting least recently used entries when full"""
+        with self._lock:
+            now = time.time()
+            exists = self._db.execute(
+                "SELECT 1 FROM summaries WHERE document_id = ? AND variant = ?", (document_id, variant)
+            ).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO summaries (document_id, variant, content_hash, summary, created, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (document_id, variant, content_hash, summary, now, now)
+            )
+            if not exists:
+                self._count += 1
+            if self._count > self.max_entries:
+                excess = self._count - self.max_entries
+                self._db.execute(
+                    "DELETE FROM summaries WHERE rowid IN "
+                    "(SELECT rowid FROM summaries ORDER BY last_access LIMIT ?)", (excess,)
+                )
+                self._count -= excess
+                self.evictions += excess
+            self._db.commit()
+
+    @staticmethod
+    def section_key(variant: str, kind: str, text: str) -> str:
+        """Content address of an intermediate summary"""
+        return hashlib.sha256(f"{variant}\n{kind}\n{text}".encode("utf-8")).hexdigest()
+
+    def get_section(self, key: str) -> Optional[str]:
+        """Return a cached intermediate summary, or None"""
+        with self._lock:
+            row = self._db.execute("SELECT summary FROM sections WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.section_misses += 1
+                return None
+            self.section_hits += 1
+            self._db.execute("UPDATE sections SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            return row[0]
+
+    def put_section(self, key: str, summary: str) -> None:
+        """Store an intermediate summary, evicting least recently used ones when full"""
+        with self._lock:
+            exists = self._db.execute("SELECT 1 FROM sections WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO sections (key, summary, last_access) VALUES (?, ?, ?)",
+                (key, summary, time.time())
+            )
+            if not exists:
+                self._section_count += 1
+            if self._section_count > self.max_sections:
+                excess = self._section_count - self.max_sections
+                self._db.execute(
+                    "DELETE FROM sections WHERE key IN (SELECT key FROM sections ORDER BY last_access LIMIT ?)",
+                    (excess,)
+                )
+                self._section_count -= excess
+            self._db.commit()
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Return hit/miss counters and occupancy"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": self._count,
+            "max_entries": self.max_entries,
+            "section_hits": self.section_hits,
+            "section_misses": self.section_misses,
+            "section_entries": self._section_count
+        }
+
+    def close(self) -> None:
+        """Close the cache database"""
+        with self._lock:
+            self._db.close()
+
+
+_shared_caches: Dict[str, SummaryCache] = {}
+_shared_lock = threading.Lock()
+
+
+def get_summary_cache(cache_dir: str, max_entries: int = 10000, max_sections: int = 100000) -> SummaryCache:
+    """Return the process-wide summary cache for cache_dir"""
+    key = os.path.abspath(cache_dir)
+    with _shared_lock:
+        if key not in _shared_caches:
+            _shared_caches[key] = SummaryCache(cache_dir, max_entries, max_sections)
+        return _shared_caches[key]
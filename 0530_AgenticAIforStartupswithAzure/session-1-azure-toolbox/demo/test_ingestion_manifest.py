@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Test script for the ingestion manifest
+Tests that unchanged sources are skipped and that only a replaced version of the same source is deleted from the index
+"""
+
+import os
+import sys
+import logging
+import tempfile
+
+# Keep the manifest out of the working directory and extract in threads
+os.environ["INGESTION_MANIFEST_DIR"] = tempfile.mkdtemp(prefix="manifest-test-")
+os.environ["INGEST_EXTRACT_PROCESSES"] = "false"
+
+from ingestion_manifest import IngestionManifest
+from document_processor import DocumentProcessor
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class InMemoryIndex:
+    """Minimal stand-in for the search service: keeps chunk documents in a dict"""
+
+    embedding_batch_size = 16
+    upload_batch_size = 100
+
+    def __init__(self):
+        self.chunks = {}
+        self.index_calls = 0
+
+    def index_documents(self, chunks):
+        chunks = list(chunks)
+        self.index_calls += 1
+        for chunk in chunks:
+            self.chunks[chunk["id"]] = chunk
+        return [{"id": chunk["id"], "success": True, "error": None} for chunk in chunks]
+
+    def generate_embeddings_batch(self, texts):
+        return [[0.0] for _ in texts]
+
+    def delete_document(self, document_id):
+        self.chunks = {key: chunk for key, chunk in self.chunks.items() if chunk["parent_id"] != document_id}
+        return True
+
+    def document_exists(self, document_id):
+        return any(chunk["parent_id"] == document_id for chunk in self.chunks.values())
+
+    def documents(self):
+        return {chunk["parent_id"] for chunk in self.chunks.values()}
+
+
+def create_processor():
+    """Document processor wired to an in-memory index and no blob storage"""
+    processor = DocumentProcessor()
+    processor.__dict__["search_service"] = InMemoryIndex()
+    processor.__dict__["blob_service_client"] = None
+    return processor
+
+
+def test_manifest_lookups():
+    """Test source/text lookups, replacement and the exists check on the manifest itself"""
+    logger.info("Testing manifest lookups...")
+    manifest = IngestionManifest(tempfile.mkdtemp(prefix="manifest-test-"))
+    document = {"id": "doc_1", "content": "Quarterly report text."}
+    chunks = [{"content": "Quarterly report text."}]
+
+    changes = manifest.record("dir:/report.txt", "hash-1", document, chunks)
+    checks = {
+        "first record has no previous version": changes["previous_document_id"] is None,
+        "same bytes are unchanged": manifest.unchanged_source("dir:/report.txt", "hash-1") is not None,
+        "other bytes are not unchanged": manifest.unchanged_source("dir:/report.txt", "hash-2") is None,
+        "same text is unchanged": manifest.unchanged_text("dir:/report.txt", "Quarterly report text.", "hash-2") is not None,
+        "text hit stores the new source hash": manifest.unchanged_source("dir:/report.txt", "hash-2") is not None
+    }
+
+    changes = manifest.record("dir:/report.txt", "hash-3", {"id": "doc_2", "content": "New text."},
+                              [{"content": "New text."}])
+    checks["new text reports the replaced document"] = changes["previous_document_id"] == "doc_1"
+    checks["missing document is not unchanged"] = \
+        manifest.unchanged_source("dir:/report.txt", "hash-3", exists=lambda document_id: False) is None
+    checks["missing document entry is dropped"] = manifest.get("dir:/report.txt") is None
+
+    manifest.record("dir:/other.txt", "hash-4", {"id": "doc_3", "content": "Other."}, [{"content": "Other."}])
+    checks["remove_document forgets its sources"] = \
+        manifest.remove_document("doc_3") == 1 and manifest.get("dir:/other.txt") is None
+    manifest.close()
+    _report(checks)
+
+
+def test_skip_unchanged_upload():
+    """Test that re-uploading identical bytes is not indexed again"""
+    logger.info("Testing re-upload of an unchanged file...")
+    processor = create_processor()
+    index = processor.search_service
+
+    first = processor.process_file(b"Travel policy: book economy class.", "policy.txt")
+    second = processor.process_file(b"Travel policy: book economy class.", "policy.txt")
+    _report({
+        "first upload is indexed": first["success"] and not first.get("unchanged"),
+        "second upload is unchanged": second.get("unchanged") == "source",
+        "index was written once": index.index_calls == 1,
+        "same document id": first["document_id"] == second["document_id"]
+    })
+
+
+def test_same_name_uploads_are_kept():
+    """Test that two different uploads sharing a file name do not replace each other"""
+    logger.info("Testing different uploads with the same file name...")
+    processor = create_processor()
+    index = processor.search_service
+
+    first = processor.process_file(b"Report for the sales team.", "report.txt")
+    second = processor.process_file(b"Report for the finance team.", "report.txt")
+    _report({
+        "both uploads are indexed": first["success"] and second["success"],
+        "nothing is replaced": "replaced_document_id" not in second,
+        "both documents remain": {first["document_id"], second["document_id"]} <= index.documents()
+    })
+
+
+def test_keyed_source_is_replaced():
+    """Test that a new version of a keyed source replaces the previous document"""
+    logger.info("Testing replacement of a keyed source...")
+    processor = create_processor()
+    index = processor.search_service
+
+    first = processor.process_file(b"Version one of the handbook.", "handbook.txt", source_key="dir:/handbook.txt")
+    second = processor.process_file(b"Version two of the handbook.", "handbook.txt", source_key="dir:/handbook.txt")
+    _report({
+        "previous version is replaced": second.get("replaced_document_id") == first["document_id"],
+        "previous document is deleted": first["document_id"] not in index.documents(),
+        "new document is indexed": second["document_id"] in index.documents()
+    })
+
+
+def test_deleted_document_is_reindexed():
+    """Test that a source whose document was deleted is indexed again instead of skipped"""
+    logger.info("Testing re-ingestion after a delete...")
+    processor = create_processor()
+    index = processor.search_service
+    content = b"Onboarding checklist for new starters."
+
+    first = processor.process_file(content, "onboarding.txt", source_key="dir:/onboarding.txt")
+    processor.delete_document(first["document_id"])
+    after_processor_delete = processor.process_file(content, "onboarding.txt", source_key="dir:/onboarding.txt")
+    index.delete_document(first["document_id"])
+    after_index_delete = processor.process_file(content, "onboarding.txt", source_key="dir:/onboarding.txt")
+    _report({
+        "re-indexed after DocumentProcessor.delete_document": not after_processor_delete.get("unchanged"),
+        "re-indexed after a direct index delete": not after_index_delete.get("unchanged"),
+        "document is back in the index": first["document_id"] in index.documents()
+    })
+
+
+def test_batch_skips_unchanged():
+    """Test that a batch skips files whose bytes are unchanged and keeps results in input order"""
+    logger.info("Testing batch re-ingestion...")
+    processor = create_processor()
+    files = [
+        {"filename": "a.txt", "content": b"First file.", "source_key": "dir:/a.txt"},
+        {"filename": "b.txt", "content": b"Second file.", "source_key": "dir:/b.txt"},
+        {"filename": "c.txt", "content": b"Third file.", "source_key": "dir:/c.txt"}
+    ]
+    processor.batch_process_files(files)
+    files[1] = {"filename": "b.txt", "content": b"Second file, edited.", "source_key": "dir:/b.txt"}
+    results = processor.batch_process_files(files)
+    outcomes = [(result["filename"], result.get("unchanged")) for result in results["successful"]]
+    _report({
+        "all files succeed": len(results["successful"]) == 3 and not results["failed"],
+        "results follow input order": [filename for filename, _ in outcomes] == ["a.txt", "b.txt", "c.txt"],
+        "unchanged files are skipped": outcomes[0][1] == "source" and outcomes[2][1] == "source",
+        "edited file is indexed": outcomes[1][1] is None,
+        "two files reported unchanged": results["unchanged"] == 2
+    })
+
+
+def _report(checks):
+    """Log each check; raise AssertionError naming the failed ones (so pytest also fails)"""
+    for name, passed in checks.items():
+        logger.info(f"  {'✅' if passed else '❌'} {name}")
+    failed = [name for name, passed in checks.items() if not passed]
+    assert not failed, f"Failed checks: {', '.join(failed)}"
+
+
+def main():
+    """Run all tests"""
+    logger.info("🧪 Testing Ingestion Manifest")
+    logger.info("=" * 50)
+
+    tests = [
+        test_manifest_lookups,
+        test_skip_unchanged_upload,
+        test_same_name_uploads_are_kept,
+        test_keyed_source_is_replaced,
+        test_deleted_document_is_reindexed,
+        test_batch_skips_unchanged
+    ]
+
+    results = []
+    for test in tests:
+        try:
+            test()
+            results.append(True)
+        except Exception as e:
+            logger.error(f"❌ Test {test.__name__} failed with exception: {e}")
+            results.append(False)
+
+    logger.info("\n📊 Test Results:")
+    for test, passed in zip(tests, results):
+        logger.info(f"{test.__name__}: {'✅ PASS' if passed else '❌ FAIL'}")
+
+    if all(results):
+        logger.info("🎉 All manifest tests passed!")
+    else:
+        logger.error("❌ Some manifest tests failed. Check the logs above for details.")
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Test script for document chunking
+Tests chunk ids, token bounds, overlap and the page range recorded for each chunk
+"""
+
+import sys
+import logging
+
+from text_chunker import TextChunker, make_chunk_id
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def build_pages(page_count, sentences_per_page):
+    """Document text with one paragraph per page, plus the [page, offset] pairs the PDF extractor records"""
+    pages = []
+    page_offsets = []
+    offset = 0
+    for page in range(1, page_count + 1):
+        text = " ".join(f"Page {page} sentence {i} covers travel and expense rules." for i in range(sentences_per_page))
+        page_offsets.append([page, offset])
+        pages.append(text)
+        offset += len(text) + 2
+    return "\n\n".join(pages), page_offsets
+
+
+def test_chunk_ids():
+    """Test that chunk ids are stable, ordered and linked to the parent document"""
+    logger.info("Testing chunk ids...")
+    chunker = TextChunker(max_tokens=64, overlap_tokens=16)
+    content, _ = build_pages(4, 6)
+    document = {"id": "handbook_1a2b3c4d", "content": content, "metadata": {"original_filename": "handbook.pdf"}}
+
+    chunks = chunker.chunk_document(document)
+    again = chunker.chunk_document(document)
+    _report({
+        "document is split": len(chunks) > 1,
+        "ids follow make_chunk_id": [chunk["id"] for chunk in chunks] ==
+                                    [make_chunk_id(document["id"], i) for i in range(len(chunks))],
+        "ids are valid search keys": all(chunk["id"].replace("_", "").replace("-", "").isalnum() for chunk in chunks),
+        "ids are stable across runs": [chunk["id"] for chunk in chunks] == [chunk["id"] for chunk in again],
+        "chunks point at the parent": all(chunk["parent_id"] == document["id"] for chunk in chunks),
+        "chunk_count is recorded": all(chunk["metadata"]["chunk_count"] == len(chunks) for chunk in chunks),
+        "parent metadata is kept": all(chunk["metadata"]["original_filename"] == "handbook.pdf" for chunk in chunks)
+    })
+
+
+def test_token_bounds_and_overlap():
+    """Test that chunks respect max_tokens, cover the text in order and overlap"""
+    logger.info("Testing token bounds and overlap...")
+    chunker = TextChunker(max_tokens=64, overlap_tokens=16)
+    content, _ = build_pages(3, 8)
+
+    chunks = chunker.chunk_text(content)
+    starts = [chunk["start_char"] for chunk in chunks]
+    _report({
+        "chunks stay within max_tokens": all(chunk["token_count"] <= chunker.max_tokens for chunk in chunks),
+        "chunks start in text order": starts == sorted(starts) and len(set(starts)) == len(starts),
+        "start_char matches the text": all(content[chunk["start_char"]:].lstrip().startswith(chunk["content"][:20])
+                                          for chunk in chunks),
+        "consecutive chunks overlap": all(chunks[i + 1]["start_char"] < chunks[i]["start_char"] + len(chunks[i]["content"])
+                                          for i in range(len(chunks) - 1)),
+        "last chunk reaches the end": content.rstrip().endswith(chunks[-1]["content"][-20:]),
+        "empty text gives no chunks": chunker.chunk_text("  \n ") == []
+    })
+
+
+def test_page_mapping():
+    """Test that each chunk's page range matches where its text sits in the document"""
+    logger.info("Testing page mapping...")
+    chunker = TextChunker(max_tokens=64, overlap_tokens=16)
+    content, page_offsets = build_pages(5, 6)
+    document = {"id": "brochure_5e6f7a8b", "content": content, "metadata": {"page_offsets": page_offsets}}
+
+    chunks = chunker.chunk_document(document)
+
+    def page_at(position):
+        return max(page for page, offset in page_offsets if offset <= position)
+
+    expected = [(page_at(chunk["metadata"]["start_char"]),
+                 page_at(chunk["metadata"]["start_char"] + len(chunk["content"]) - 1)) for chunk in chunks]
+    actual = [(chunk["metadata"]["page_start"], chunk["metadata"]["page_end"]) for chunk in chunks]
+    _report({
+        "page ranges match chunk offsets": actual == expected,
+        "first chunk starts on page 1": actual[0][0] == 1,
+        "last chunk ends on the last page": actual[-1][1] == 5,
+        "some chunk spans two pages": any(start != end for start, end in actual),
+        "page_offsets are not copied to chunks": all("page_offsets" not in chunk["metadata"] for chunk in chunks),
+        "documents without pages get no range": all("page_start" not in chunk["metadata"] for chunk in
+                                                    chunker.chunk_document({"id": "notes_1", "content": content}))
+    })
+
+
+def _report(checks):
+    """Log each check; raise AssertionError naming the failed ones (so pytest also fails)"""
+    for name, passed in checks.items():
+        logger.info(f"  {'✅' if passed else '❌'} {name}")
+    failed = [name for name, passed in checks.items() if not passed]
+    assert not failed, f"Failed checks: {', '.join(failed)}"
+
+
+def main():
+    """Run all tests"""
+    logger.info("🧪 Testing Text Chunker")
+    logger.info("=" * 50)
+
+    tests = [
+        test_chunk_ids,
+        test_token_bounds_and_overlap,
+        test_page_mapping
+    ]
+
+    results = []
+    for test in tests:
+        try:
+            test()
+            results.append(True)
+        except Exception as e:
+            logger.error(f"❌ Test {test.__name__} failed with exception: {e}")
+            results.append(False)
+
+    logger.info("\n📊 Test Results:")
+    for test, passed in zip(tests, results):
+        logger.info(f"{test.__name__}: {'✅ PASS' if passed else '❌ FAIL'}")
+
+    if all(results):
+        logger.info("🎉 All chunker tests passed!")
+    else:
+        logger.error("❌ Some chunker tests failed. Check the logs above for details.")
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
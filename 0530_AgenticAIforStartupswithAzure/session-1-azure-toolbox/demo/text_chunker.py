@@ -0,0 +1,143 @@
+"""
+Text chunking for the Knowledge Worker Agent
+Splits extracted document text into token-bounded, overlapping chunks for indexing
+"""
+import os
+import re
+import bisect
+import logging
+from typing import List, Dict, Any
+
+from tokenization import DEFAULT_ENCODING, get_encoding
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Paragraph breaks and sentence ends are preferred chunk boundaries
+_SEGMENT_BOUNDARY = re.compile(r"\n\s*\n|(?<=[.!?])\s+")
+
+
+def make_chunk_id(parent_id: str, chunk_index: int) -> str:
+    """Build the search key for a chunk (keys allow letters, digits, _, - and =)"""
+    return f"{parent_id}-chunk-{chunk_index:04d}"
+
+
+class TextChunker:
+    """Sliding-window chunker that packs sentences/paragraphs into token-bounded chunks"""
+
+    def __init__(self, max_tokens: int = None, overlap_tokens: int = None, encoding_name: str = DEFAULT_ENCODING):
+        """Initialize the chunker from arguments or CHUNK_* environment settings"""
+        self.max_tokens = max_tokens or int(os.getenv("CHUNK_MAX_TOKENS", "512"))
+        self.overlap_tokens = overlap_tokens if overlap_tokens is not None else int(os.getenv("CHUNK_OVERLAP_TOKENS", "64"))
+        if self.overlap_tokens >= self.max_tokens:
+            raise ValueError("Chunk overlap must be smaller than the chunk size")
+        self.encoding = get_encoding(encoding_name)
+
+    def _segments(self, text: str) -> List[Dict[str, Any]]:
+        """Split text into sentence/paragraph segments with offsets and token counts"""
+        segments = []
+        position = 0
+        boundaries = [match.end() for match in _SEGMENT_BOUNDARY.finditer(text)] + [len(text)]
+        for end in boundaries:
+            if end <= position:
+                continue
+            segment_text = text[position:end]
+            tokens = self.encoding.encode(segment_text)
+            if len(tokens) <= self.max_tokens:
+                segments.append({"text": segment_text, "start": position, "tokens": len(tokens)})
+            else:
+                # Oversized segment (e.g. a table or a page without punctuation): hard-split by tokens
+                step = self.max_tokens - self.overlap_tokens
+                offset = position
+                for start in range(0, len(tokens), step):
+                    piece = self.encoding.decode(tokens[start:start + self.max_tokens])
+                    segments.append({"text": piece, "start": offset, "tokens": min(self.max_tokens, len(tokens) - start),
+                                     "hard_split": True})
+                    offset += len(self.encoding.decode(tokens[start:start + step]))
+                    if start + self.max_tokens >= len(tokens):
+                        break
+            position = end
+        return segments
+
+    def chunk_text(self, text: str) -> List[Dict[str, Any]]:
+        """Split text into overlapping chunks of at most max_tokens tokens"""
+        if not text or not text.strip():
+            return []
+
+        chunks = []
+        window: List[Dict[str, Any]] = []
+        window_tokens = 0
+
+        def emit():
+            content = "".join(segment["text"] for segment in window).strip()
+            if content:
+                chunks.append({
+                    "content": content,
+                    "chunk_index": len(chunks),
+                    "start_char": window[0]["start"],
+                    "token_count": window_tokens
+                })
+
+        for segment in self._segments(text):
+            if window and window_tokens + segment["tokens"] > self.max_tokens:
+                emit()
+                # Carry trailing segments into the next chunk as overlap
+                overlap = []
+                overlap_tokens = 0
+                if not segment.get("hard_split"):
+                    for previous in reversed(window):
+                        if overlap_tokens + previous["tokens"] > self.overlap_tokens:
+                            break
+                        overlap.insert(0, previous)
+                        overlap_tokens += previous["tokens"]
+                while overlap and overlap_tokens + segment["tokens"] > self.max_tokens:
+                    overlap_tokens -= overlap.pop(0)["tokens"]
+                window = overlap
+                window_tokens = overlap_tokens
+            window.append(segment)
+            window_tokens += segment["tokens"]
+
+        if window:
+            emit()
+        return chunks
+
+    @staticmethod
+    def _page_span(page_offsets: List[List[int]], start: int, end: int) -> Dict[str, int]:
+        """Find the first and last page a character range falls on, from [page, offset] pairs"""
+        offsets = [offset for _, offset in page_offsets]
+        first = max(bisect.bisect_right(offsets, start) - 1, 0)
+        last = max(bisect.bisect_right(offsets, max(end - 1, start)) - 1, 0)
+        return {"page_start": page_offsets[first][0], "page_end": page_offsets[last][0]}
+
+    def chunk_document(self, document: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Split a prepared search document into chunk documents linked to its id"""
+        parent_id = document["id"]
+        chunks = self.chunk_text(document.get("content", ""))
+
+        # Per-page offsets are turned into each chunk's page range instead of being copied
+        parent_metadata = dict(document.get("metadata", {}))
+        page_offsets = parent_metadata.pop("page_offsets", None)
+
+        chunk_documents = []
+        for chunk in chunks:
+            metadata = {
+                **parent_metadata,
+                "chunk_count": len(chunks),
+                "start_char": chunk["start_char"],
+                "token_count": chunk["token_count"]
+            }
+            if page_offsets:
+                metadata.update(self._page_span(page_offsets, chunk["start_char"],
+                                                chunk["start_char"] + len(chunk["content"])))
+            chunk_documents.append({
+                **document,
+                "id": make_chunk_id(parent_id, chunk["chunk_index"]),
+                "parent_id": parent_id,
+                "chunk_index": chunk["chunk_index"],
+                "content": chunk["content"],
+                "metadata": metadata
+            })
+
+        logger.info(f"Split document '{parent_id}' into {len(chunk_documents)} chunks")
+        return chunk_documents
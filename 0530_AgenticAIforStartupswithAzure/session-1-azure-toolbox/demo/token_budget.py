@@ -0,0 +1,289 @@
+"""
+Prompt token budgeting for the Knowledge Worker Agent
+Fits conversation history into a token budget and records the tokens each stage of a chat turn uses
+"""
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from tokenization import count_message_tokens, count_tokens, count_tools_tokens
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_SUMMARY_HEADER = "Summary of the earlier conversation:\n"
+
+_SUMMARY_SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": "You condense chat transcripts. Keep facts, decisions, names, numbers, document ids "
+               "and open questions the assistant may need later. Write plain prose, no preamble."
+}
+
+
+class TokenUsage:
+    """Token counts for the stages of one chat turn
+
+    A stage records the usage reported by the service when the response carries
+    it; otherwise (streamed completions) the prompt and completion are counted
+    locally and the stage is flagged as estimated.
+    """
+
+    def __init__(self, encoding_name: str):
+        self.encoding_name = encoding_name
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.history: Dict[str, Any] = {}
+
+    def count_prompt(self, messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]] = None) -> int:
+        """Count the prompt tokens of a request"""
+        return count_message_tokens(messages, self.encoding_name) + count_tools_tokens(tools, self.encoding_name)
+
+    def record(self, stage: str, prompt_tokens: int, completion_tokens: int, estimated: bool = False) -> None:
+        """Add one model call to a stage"""
+        entry = self.stages.setdefault(stage, {"prompt_tokens": 0, "completion_tokens": 0, "calls": 0, "estimated": False})
+        entry["prompt_tokens"] += prompt_tokens
+        entry["completion_tokens"] += completion_tokens
+        entry["calls"] += 1
+        entry["estimated"] = entry["estimated"] or estimated
+
+    def record_response(self, stage: str, response, messages: List[Dict[str, Any]],
+                        tools: Optional[List[Dict[str, Any]]] = None) -> None:
+        """Record a non-streamed completion, preferring the service's usage figures"""
+        usage = getattr(response, "usage", None)
+        if usage is not None and getattr(usage, "prompt_tokens", None) is not None:
+            self.record(stage, usage.prompt_tokens, usage.completion_tokens or 0)
+            return
+        message = response.choices[0].message
+        self.record_estimate(stage, messages, message.content or "", tools,
+                             [tool_call.function.arguments for tool_call in message.tool_calls or []])
+
+    def record_estimate(self, stage: str, messages: List[Dict[str, Any]], completion: str,
+                        tools: Optional[List[Dict[str, Any]]] = None, tool_arguments: List[str] = ()) -> None:
+        """Record a completion from locally counted prompt and output text"""
+        completion_tokens = count_tokens(completion, self.encoding_name) + sum(
+            count_tokens(arguments, self.encoding_name) for arguments in tool_arguments
+        )
+        self.record(stage, self.count_prompt(messages, tools), completion_tokens, estimated=True)
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Return per-stage counts, totals and the history compaction summary"""
+        prompt_tokens = sum(entry["prompt_tokens"] for entry in self.stages.values())
+        completion_tokens = sum(entry["completion_tokens"] for entry in self.stages.values())
+        return {
+            "encoding": self.encoding_name,
+            "stages": {stage: dict(entry) for stage, entry in self.stages.items()},
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "history": dict(self.history)
+        }
+
+
+class HistoryCompactor:
+    """Keeps the first request of a chat turn within AGENT_PROMPT_TOKEN_BUDGET
+
+    The system prompt, tool definitions and the new user message are always
+    sent. The newest whole turns of history that fit the rest of the budget are
+    kept verbatim; older ones are rolled into a running summary sent as a
+    second system message (or simply dropped when AGENT_HISTORY_SUMMARIZE is
+    false or the summary call fails).
+
+    Clients resend the full history every turn, so summaries are cached in
+    memory by a chained hash of the messages they cover. The next turn finds
+    the longest summarized prefix and only folds the messages newly pushed out
+    of the window into it, so each message is summarized about once.
+    """
+
+    def __init__(self, openai_client, async_openai_client, deployment_name: str, encoding_name: str):
+        """Initialize from clients and AGENT_* environment settings"""
+        self.openai_client = openai_client
+        self.async_openai_client = async_openai_client
+        self.deployment_name = deployment_name
+        self.encoding_name = encoding_name
+
+        self.prompt_budget = int(os.getenv("AGENT_PROMPT_TOKEN_BUDGET", "8000"))
+        self.summary_tokens = int(os.getenv("AGENT_HISTORY_SUMMARY_TOKENS", "400"))
+        self.summarize = os.getenv("AGENT_HISTORY_SUMMARIZE", "true").lower() == "true"
+        self.max_cached_summaries = int(os.getenv("AGENT_HISTORY_SUMMARY_CACHE_SIZE", "256"))
+
+        self._summaries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------ planning
+
+    @staticmethod
+    def _prefix_keys(history: List[Dict[str, Any]]) -> List[str]:
+        """keys[i] identifies history[:i + 1]"""
+        keys = []
+        digest = b""
+        for message in history:
+            digest = hashlib.sha256(digest + json.dumps(message, sort_keys=True).encode("utf-8")).digest()
+            keys.append(digest.hex())
+        return keys
+
+    def _window_start(self, fixed_tokens: int, history_tokens: List[int]) -> int:
+        """Index of the first history message kept verbatim"""
+        available = self.prompt_budget - fixed_tokens
+        if sum(history_tokens) <= available:
+            return 0
+        if self.summarize:
+            available -= count_tokens(_SUMMARY_HEADER, self.encoding_name) + self.summary_tokens + 3
+
+        start = len(history_tokens)
+        used = 0
+        while start > 0 and used + history_tokens[start - 1] <= available:
+            start -= 1
+            used += history_tokens[start]
+        return start
+
+    @staticmethod
+    def _turn_boundary(history: List[Dict[str, Any]], start: int) -> int:
+        """Move start forward so the kept history begins with a user message"""
+        while start < len(history) and history[start].get("role") != "user":
+            start += 1
+        return start
+
+    def _plan(self, system_prompt: str, history: List[Dict[str, Any]], user_message: str,
+              tools: Optional[List[Dict[str, Any]]]) -> Tuple[int, List[int]]:
+        """Return (window start, per-message history tokens)"""
+        fixed_tokens = count_message_tokens(
+            [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_message}], self.encoding_name
+        ) + count_tools_tokens(tools, self.encoding_name)
+        # Per-message cost, without the reply priming count_message_tokens adds once per request
+        history_tokens = [count_message_tokens([message], self.encoding_name) - 3 for message in history]
+        start = self._window_start(fixed_tokens, history_tokens)
+        if start:
+            start = self._turn_boundary(history, start)
+        return start, history_tokens
+
+    def _cached_prefix(self, keys: List[str], start: int) -> Tuple[int, Optional[str]]:
+        """Return (messages covered, summary) for the longest cached prefix of history[:start]"""
+        with self._lock:
+            for covered in range(start, 0, -1):
+                summary = self._summaries.get(keys[covered - 1])
+                if summary is not None:
+                    self._summaries.move_to_end(keys[covered - 1])
+                    return covered, summary
+        return 0, None
+
+    def _store(self, key: str, summary: str) -> None:
+        with self._lock:
+            self._summaries[key] = summary
+            self._summaries.move_to_end(key)
+            while len(self._summaries) > self.max_cached_summaries:
+                self._summaries.popitem(last=False)
+
+    def _summary_messages(self, previous_summary: Optional[str], messages: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        transcript = "\n\n".join(f"{message.get('role', 'user')}: {message.get('content') or ''}" for message in messages)
+        previous = f"Summary so far:\n{previous_summary}\n\n" if previous_summary else ""
+        return [_SUMMARY_SYSTEM_MESSAGE, {"role": "user", "content": f"""{previous}Update the summary with these later messages, in at most {self.summary_tokens} tokens.
+
+{transcript}"""}]
+
+    def _messages(self, system_prompt: str, summary: Optional[str], kept: List[Dict[str, Any]],
+                  user_message: str) -> List[Dict[str, Any]]:
+        messages = [{"role": "system", "content": system_prompt}]
+        if summary:
+            messages.append({"role": "system", "content": _SUMMARY_HEADER + summary})
+        messages.extend(kept)
+        messages.append({"role": "user", "content": user_message})
+        return messages
+
+    def _report(self, usage: TokenUsage, history: List[Dict[str, Any]], history_tokens: List[int], start: int,
+                summary: Optional[str], summary_cached: bool, messages: List[Dict[str, Any]],
+                tools: Optional[List[Dict[str, Any]]]) -> None:
+        usage.history = {
+            "prompt_budget": self.prompt_budget,
+            "messages": len(history),
+            "kept_messages": len(history) - start,
+            "compacted_messages": start,
+            "summarized": summary is not None,
+            "summary_cached": summary_cached,
+            "history_tokens_before": sum(history_tokens),
+            "history_tokens_after": sum(history_tokens[start:]) + (count_tokens(summary, self.encoding_name) if summary else 0),
+            "prompt_tokens": usage.count_prompt(messages, tools)
+        }
+        if start:
+            logger.info(f"Compacted {start} of {len(history)} history messages "
+                        f"({usage.history['history_tokens_before']} -> {usage.history['history_tokens_after']} tokens)")
+
+    def _pending_summary(self, history: List[Dict[str, Any]], start: int):
+        """Return (prefix keys, cached summary, summary request or None if the cache covers history[:start])"""
+        keys = self._prefix_keys(history[:start])
+        covered, summary = self._cached_prefix(keys, start)
+        if covered == start:
+            return keys, summary, None
+        return keys, summary, self._summary_messages(summary, history[covered:start])
+
+    def _summary_failed(self, start: int, error: Exception) -> None:
+        logger.warning(f"History summary failed, dropping {start} old messages: {str(error)}")
+
+    def _finish(self, system_prompt: str, history: List[Dict[str, Any]], user_message: str,
+                tools: Optional[List[Dict[str, Any]]], usage: TokenUsage, start: int, history_tokens: List[int],
+                summary: Optional[str], summary_cached: bool) -> List[Dict[str, Any]]:
+        messages = self._messages(system_prompt, summary, history[start:], user_message)
+        self._report(usage, history, history_tokens, start, summary, summary_cached, messages, tools)
+        return messages
+
+    # ------------------------------------------------------------------ public API
+
+    def compact(self, system_prompt: str, history: List[Dict[str, Any]], user_message: str,
+                tools: Optional[List[Dict[str, Any]]], usage: TokenUsage) -> List[Dict[str, Any]]:
+        """Build the first request's messages within the budget, summarizing old turns if needed"""
+        start, history_tokens = self._plan(system_prompt, history, user_message, tools)
+        summary, request = None, None
+        if start and self.summarize:
+            keys, summary, request = self._pending_summary(history, start)
+            if request is not None:
+                try:
+                    response = self.openai_client.chat.completions.create(
+                        model=self.deployment_name,
+                        messages=request,
+                        temperature=0.2,
+                        max_tokens=self.summary_tokens
+                    )
+                    usage.record_response("history_summary", response, request)
+                    summary = response.choices[0].message.content or ""
+                    self._store(keys[-1], summary)
+                except Exception as e:
+                    self._summary_failed(start, e)
+                    summary = None
+        return self._finish(system_prompt, history, user_message, tools, usage, start, history_tokens,
+                            summary, summary is not None and request is None)
+
+    async def acompact(self, system_prompt: str, history: List[Dict[str, Any]], user_message: str,
+                       tools: Optional[List[Dict[str, Any]]], usage: TokenUsage) -> List[Dict[str, Any]]:
+        """Async counterpart of compact()"""
+        start, history_tokens = self._plan(system_prompt, history, user_message, tools)
+        summary, request = None, None
+        if start and self.summarize:
+            keys, summary, request = self._pending_summary(history, start)
+            if request is not None:
+                try:
+                    response = await self.async_openai_client.chat.completions.create(
+                        model=self.deployment_name,
+                        messages=request,
+                        temperature=0.2,
+                        max_tokens=self.summary_tokens
+                    )
+                    usage.record_response("history_summary", response, request)
+                    summary = response.choices[0].message.content or ""
+                    self._store(keys[-1], summary)
+                except Exception as e:
+                    self._summary_failed(start, e)
+                    summary = None
+        return self._finish(system_prompt, history, user_message, tools, usage, start, history_tokens,
+                            summary, summary is not None and request is None)
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Return the budget settings and summary cache occupancy"""
+        return {
+            "prompt_budget": self.prompt_budget,
+            "summary_tokens": self.summary_tokens,
+            "summarize": self.summarize,
+            "cached_summaries": len(self._summaries)
+        }
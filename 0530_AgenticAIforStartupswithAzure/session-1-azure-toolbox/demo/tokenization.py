@@ -0,0 +1,116 @@
+"""
+Tokenizer helpers for the Knowledge Worker Agent
+Wraps tiktoken so chunking and token budgets use the same token counts as the models
+"""
+import re
+import json
+import logging
+import threading
+from typing import Any, Dict, List
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# text-embedding-3-* and ada-002 use cl100k_base
+DEFAULT_ENCODING = "cl100k_base"
+
+# Model name prefixes and their encodings, most specific first (Azure deployment
+# names often embed the model name, e.g. "gpt-4o-mini-prod")
+_MODEL_ENCODINGS = [
+    ("gpt-4o", "o200k_base"),
+    ("gpt-4.1", "o200k_base"),
+    ("gpt-5", "o200k_base"),
+    ("o1", "o200k_base"),
+    ("o3", "o200k_base"),
+    ("o4", "o200k_base"),
+    ("gpt-4", "cl100k_base"),
+    ("gpt-35", "cl100k_base"),
+    ("gpt-3.5", "cl100k_base"),
+    ("text-embedding", "cl100k_base"),
+]
+
+# Per-message overhead of the chat format (role markers and separators)
+_TOKENS_PER_MESSAGE = 3
+_TOKENS_PER_REPLY = 3
+
+class ApproximateEncoding:
+    """Fallback encoding used when tiktoken or its BPE files are unavailable (e.g. offline)
+
+    Splits text into pieces of at most four non-space characters, which tracks
+    the ~4 characters per token ratio of the OpenAI encodings closely enough
+    for budgeting. Decoding the pieces reproduces the original text exactly.
+    """
+
+    name = "approximate"
+    _pattern = re.compile(r"\s*\S{1,4}|\s+")
+
+    def encode(self, text: str) -> List[str]:
+        return self._pattern.findall(text)
+
+    def decode(self, tokens: List[str]) -> str:
+        return "".join(tokens)
+
+
+_encodings: Dict[str, Any] = {}
+_lock = threading.Lock()
+
+
+def get_encoding(encoding_name: str = DEFAULT_ENCODING):
+    """Return a cached tokenizer exposing encode()/decode()"""
+    with _lock:
+        if encoding_name not in _encodings:
+            try:
+                import tiktoken
+                _encodings[encoding_name] = tiktoken.get_encoding(encoding_name)
+            except Exception as e:
+                logger.warning(f"tiktoken encoding '{encoding_name}' unavailable ({str(e)}), "
+                               f"using approximate token counts")
+                _encodings[encoding_name] = ApproximateEncoding()
+        return _encodings[encoding_name]
+
+
+def encoding_name_for(deployment: str) -> str:
+    """Guess the encoding for a model or deployment name, defaulting to cl100k_base"""
+    name = (deployment or "").lower()
+    for prefix, encoding_name in _MODEL_ENCODINGS:
+        if name.startswith(prefix) or f"-{prefix}" in name or f"_{prefix}" in name:
+            return encoding_name
+    return DEFAULT_ENCODING
+
+
+def count_message_tokens(messages: List[Dict[str, Any]], encoding_name: str = DEFAULT_ENCODING) -> int:
+    """Count the prompt tokens of a chat messages array, including tool calls"""
+    encoding = get_encoding(encoding_name)
+    total = _TOKENS_PER_REPLY
+    for message in messages:
+        total += _TOKENS_PER_MESSAGE
+        for key, value in message.items():
+            if key == "tool_calls":
+                value = json.dumps(value)
+            if isinstance(value, str) and value:
+                total += len(encoding.encode(value))
+    return total
+
+
+def count_tools_tokens(tools: List[Dict[str, Any]], encoding_name: str = DEFAULT_ENCODING) -> int:
+    """Approximate the prompt tokens taken by tool definitions"""
+    if not tools:
+        return 0
+    return len(get_encoding(encoding_name).encode(json.dumps(tools)))
+
+
+def count_tokens(text: str, encoding_name: str = DEFAULT_ENCODING) -> int:
+    """Count tokens in text"""
+    if not text:
+        return 0
+    return len(get_encoding(encoding_name).encode(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, encoding_name: str = DEFAULT_ENCODING) -> str:
+    """Cut text down to at most max_tokens tokens"""
+    encoding = get_encoding(encoding_name)
+    tokens = encoding.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
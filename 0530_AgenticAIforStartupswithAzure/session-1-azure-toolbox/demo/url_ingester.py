@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+URL ingester for the Knowledge Worker Agent
+Fetches many URLs concurrently with per-host politeness limits and keeps tracked pages fresh with conditional re-fetches
+"""
+import os
+import time
+import random
+import logging
+import sqlite3
+import weakref
+import argparse
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Client errors that mean the page is gone rather than temporarily unavailable
+_GONE_STATUSES = frozenset({404, 410})
+
+
+class UrlStore:
+    """SQLite list of tracked URLs with their HTTP validators and refresh schedule"""
+
+    def __init__(self, cache_dir: str):
+        """Open (or create) the URL store in cache_dir"""
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(cache_dir, "urls.db"), check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS urls ("
+            "url TEXT PRIMARY KEY, category TEXT NOT NULL, status TEXT NOT NULL, etag TEXT, last_modified TEXT, "
+            "document_id TEXT, interval REAL NOT NULL, checks INTEGER NOT NULL DEFAULT 0, "
+            "changes INTEGER NOT NULL DEFAULT 0, failures INTEGER NOT NULL DEFAULT 0, last_error TEXT, "
+            "added REAL NOT NULL, last_checked REAL, last_changed REAL, next_check REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS urls_due ON urls (status, next_check);"
+        )
+        self._db.commit()
+
+    def track(self, urls: List[str], category: str, interval: float) -> int:
+        """Start tracking URLs (already tracked ones keep their schedule); return how many are new"""
+        now = time.time()
+        with self._lock:
+            before = self._db.total_changes
+            self._db.executemany(
+                "INSERT OR IGNORE INTO urls (url, category, status, interval, added, next_check) "
+                "VALUES (?, ?, 'active', ?, ?, ?)",
+                [(url, category, interval, now, now) for url in urls]
+            )
+            self._db.commit()
+            return self._db.total_changes - before
+
+    def untrack(self, url: str) -> bool:
+        with self._lock:
+            cursor = self._db.execute("DELETE FROM urls WHERE url = ?", (url,))
+            self._db.commit()
+            return cursor.rowcount > 0
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM urls WHERE url = ?", (url,)).fetchone()
+        return dict(row) if row else None
+
+    def due(self, now: float, limit: int) -> List[Dict[str, Any]]:
+        """Active URLs whose next check is due, most overdue first"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT * FROM urls WHERE status = 'active' AND next_check <= ? ORDER BY next_check LIMIT ?",
+                (now, limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def next_due(self) -> Optional[float]:
+        with self._lock:
+            row = self._db.execute("SELECT MIN(next_check) FROM urls WHERE status = 'active'").fetchone()
+        return row[0]
+
+    def update(self, url: str, **fields) -> None:
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._db.execute(f"UPDATE urls SET {assignments} WHERE url = ?", (*fields.values(), url))
+            self._db.commit()
+
+    def counts(self) -> Dict[str, Any]:
+        """Tracked URLs by status, and how many are due now"""
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM urls GROUP BY status").fetchall()
+            due = self._db.execute("SELECT COUNT(*) FROM urls WHERE status = 'active' AND next_check <= ?",
+                                   (time.time(),)).fetchone()[0]
+        return {"by_status": {status: count for status, count in rows}, "due": due}
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class HostGate:
+    """Per-host politeness: at most max_concurrency requests in flight and min_delay seconds between starts"""
+
+    def __init__(self, max_concurrency: int, min_delay: float):
+        self.max_concurrency = max_concurrency
+        self.min_delay = min_delay
+        self._hosts: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self, url: str):
+        """Hold a slot on the URL's host, waiting for the politeness delay first"""
+        host = urlsplit(url).netloc.lower()
+        with self._lock:
+            state = self._hosts.setdefault(host, {
+                "semaphore": threading.BoundedSemaphore(self.max_concurrency),
+                "next_start": 0.0
+            })
+        with state["semaphore"]:
+            with self._lock:
+                now = time.monotonic()
+                start = max(now, state["next_start"])
+                state["next_start"] = start + self.min_delay
+            if start > now:
+                time.sleep(start - now)
+            yield
+
+
+class UrlIngester:
+    """Batch and scheduled ingestion of web pages through DocumentProcessor.process_url
+
+    URLs are fetched on a pool of workers, interleaved by host so one slow
+    site does not hold every worker, and each host gets at most
+    per_host_concurrency requests at a time, spaced by host_delay seconds.
+
+    Every URL ingested is tracked with the ETag and Last-Modified of its last
+    response. A refresh sends conditional GETs for the URLs that are due; a
+    304 costs one round trip, and a 200 whose text is unchanged is caught by
+    the ingestion manifest before anything is embedded. Each URL's interval
+    grows while it stays unchanged and shrinks when it changes (between
+    min_interval and max_interval), so thousands of mostly static pages cost
+    a few requests an hour. Pages that return 404/410, or fail max_failures
+    times in a row, stop being refreshed.
+    """
+
+    def __init__(self, processor, store: UrlStore, workers: int = 8, per_host_concurrency: int = 2,
+                 host_delay: float = 0.5, interval: float = 86400, min_interval: float = 3600,
+                 max_interval: float = 604800, max_failures: int = 5, refresh_batch: int = 500,
+                 poll_interval: float = 60):
+        self.processor = processor
+        self.store = store
+        self.workers = workers
+        self.gate = HostGate(per_host_concurrency, host_delay)
+        self.interval = interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_failures = max_failures
+        self.refresh_batch = refresh_batch
+        self.poll_interval = poll_interval
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="url-ingest")
+        self._stop = threading.Event()
+        self._scheduler: Optional[threading.Thread] = None
+        self.outcomes = {"indexed": 0, "unchanged": 0, "not_modified": 0, "failed": 0}
+        self._stats_lock = threading.Lock()
+
+    # ------------------------------------------------------------------ scheduling
+
+    def _jittered(self, interval: float) -> float:
+        # Spread checks so URLs added together do not stay due together
+        return interval * random.uniform(0.9, 1.1)
+
+    def _record(self, row: Dict[str, Any], result: Dict[str, Any]) -> str:
+        """Store a check's outcome and schedule the URL's next check; return the outcome"""
+        now = time.time()
+        fields: Dict[str, Any] = {"last_checked": now, "checks": row["checks"] + 1}
+        if result["success"]:
+            outcome = result.get("unchanged") or "indexed"
+            outcome = "unchanged" if outcome in ("text", "source") else outcome
+            validators = result.get("validators") or {}
+            interval = row["interval"]
+            if outcome == "indexed":
+                fields.update(changes=row["changes"] + 1, last_changed=now)
+            if row["checks"]:
+                # The first check only sets the baseline
+                interval = max(self.min_interval, interval / 2) if outcome == "indexed" \
+                    else min(self.max_interval, interval * 1.5)
+            fields.update(
+                failures=0, last_error=None, interval=interval, next_check=now + self._jittered(interval),
+                etag=validators.get("etag"), last_modified=validators.get("last_modified"),
+                document_id=result.get("document_id") or row["document_id"]
+            )
+        else:
+            outcome = "failed"
+            failures = row["failures"] + 1
+            gone = result.get("status_code") in _GONE_STATUSES
+            fields.update(
+                failures=failures, last_error=result.get("error"),
+                status="gone" if gone else "failed" if failures >= self.max_failures else "active",
+                next_check=now + self._jittered(min(self.max_interval, self.min_interval * 2 ** (failures - 1)))
+            )
+        self.store.update(row["url"], **fields)
+        with self._stats_lock:
+            self.outcomes[outcome] += 1
+        return outcome
+
+    def _check(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        validators = {"etag": row["etag"], "last_modified": row["last_modified"]}
+        with self.gate.slot(row["url"]):
+            result = self.processor.process_url(row["url"], row["category"],
+                                                validators if any(validators.values()) else None)
+        outcome = self._record(row, result)
+        return {"url": row["url"], "outcome": outcome, "document_id": result.get("document_id"),
+                **({"error": result["error"]} if not result["success"] else {})}
+
+    @staticmethod
+    def _interleave_by_host(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Order rows round-robin across hosts"""
+        hosts: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+        for row in rows:
+            hosts.setdefault(urlsplit(row["url"]).netloc.lower(), []).append(row)
+        ordered = []
+        queues = [list(reversed(queue)) for queue in hosts.values()]
+        while queues:
+            ordered.extend(queue.pop() for queue in queues)
+            queues = [queue for queue in queues if queue]
+        return ordered
+
+    def _check_all(self, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        results = list(self._executor.map(self._check, self._interleave_by_host(rows)))
+        summary = {outcome: 0 for outcome in self.outcomes}
+        for result in results:
+            summary[result["outcome"]] += 1
+        elapsed = time.perf_counter() - started
+        return {
+            "total": len(results),
+            **summary,
+            "elapsed_seconds": round(elapsed, 2),
+            "urls_per_second": round(len(results) / elapsed, 2) if elapsed else 0.0,
+            "results": results
+        }
+
+    # ------------------------------------------------------------------ public API
+
+    def ingest(self, urls: List[str], category: str = "web") -> Dict[str, Any]:
+        """Track the URLs and fetch them all now (conditionally, for ones tracked before)"""
+        urls = list(dict.fromkeys(url.strip() for url in urls if url.strip()))
+        added = self.store.track(urls, category, self.interval)
+        rows = [row for row in (self.store.get(url) for url in urls) if row]
+        summary = self._check_all(rows)
+        summary["added"] = added
+        logger.info(f"Ingested {summary['total']} URLs ({added} new): {summary['indexed']} indexed, "
+                    f"{summary['not_modified']} not modified, {summary['unchanged']} unchanged, "
+                    f"{summary['failed']} failed in {summary['elapsed_seconds']}s")
+        return summary
+
+    def refresh(self, limit: Optional[int] = None) -> Dict[str, Any]:
+        """Re-check the tracked URLs that are due (at most limit, default refresh_batch)"""
+        rows = self.store.due(time.time(), limit or self.refresh_batch)
+        summary = self._check_all(rows)
+        if rows:
+            logger.info(f"Refreshed {summary['total']} URLs: {summary['indexed']} changed, "
+                        f"{summary['not_modified']} not modified, {summary['unchanged']} unchanged, "
+                        f"{summary['failed']} failed in {summary['elapsed_seconds']}s")
+        return summary
+
+    def untrack(self, url: str) -> bool:
+        """Stop refreshing a URL (its indexed document is kept)"""
+        return self.store.untrack(url)
+
+    def _schedule(self) -> None:
+        while not self._stop.is_set():
+            try:
+                summary = self.refresh()
+            except Exception as e:
+                logger.error(f"URL refresh failed: {str(e)}")
+                summary = {"total": 0}
+            if summary["total"] >= self.refresh_batch:
+                # More URLs are due; keep going
+                continue
+            next_due = self.store.next_due()
+            wait = self.poll_interval if next_due is None else min(self.poll_interval, next_due - time.time())
+            self._stop.wait(max(1.0, wait))
+
+    def start(self) -> None:
+        """Start the scheduled re-crawl thread"""
+        if self._scheduler is None:
+            self._stop.clear()
+            self._scheduler = threading.Thread(target=self._schedule, name="url-refresh", daemon=True)
+            self._scheduler.start()
+            logger.info("URL refresh scheduler started")
+
+    def stop(self, timeout: float = 30) -> None:
+        """Stop the scheduler and the fetch workers; get_url_ingester() then builds a new ingester"""
+        self._stop.set()
+        if self._scheduler is not None:
+            self._scheduler.join(timeout)
+            self._scheduler = None
+        with _shared_lock:
+            if _shared_ingesters.get(self.processor) is self:
+                del _shared_ingesters[self.processor]
+        self._executor.shutdown(wait=True)
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Return tracked URL counts and check outcomes since start"""
+        with self._stats_lock:
+            outcomes = dict(self.outcomes)
+        return {
+            "tracked": self.store.counts(),
+            "outcomes": outcomes,
+            "workers": self.workers,
+            "per_host_concurrency": self.gate.max_concurrency,
+            "host_delay_seconds": self.gate.min_delay,
+            "scheduler_running": self._scheduler is not None
+        }
+
+
+# Keyed by the processor itself: an id() could be reused by a new processor after garbage collection
+_shared_ingesters: "weakref.WeakKeyDictionary[Any, UrlIngester]" = weakref.WeakKeyDictionary()
+_shared_lock = threading.Lock()
+
+
+def get_url_ingester(processor) -> UrlIngester:
+    """Return the process-wide URL ingester for a processor, configured from URL_* environment settings"""
+    with _shared_lock:
+        if processor not in _shared_ingesters:
+            _shared_ingesters[processor] = UrlIngester(
+                processor,
+                UrlStore(os.getenv("URL_STORE_DIR", ".cache/urls")),
+                workers=int(os.getenv("URL_FETCH_WORKERS", "8")),
+                per_host_concurrency=int(os.getenv("URL_PER_HOST_CONCURRENCY", "2")),
+                host_delay=float(os.getenv("URL_HOST_DELAY_SECONDS", "0.5")),
+                interval=float(os.getenv("URL_REFRESH_INTERVAL_SECONDS", "86400")),
+                min_interval=float(os.getenv("URL_REFRESH_MIN_SECONDS", "3600")),
+                max_interval=float(os.getenv("URL_REFRESH_MAX_SECONDS", "604800")),
+                max_failures=int(os.getenv("URL_MAX_FAILURES", "5")),
+                refresh_batch=int(os.getenv("URL_REFRESH_BATCH", "500")),
+                poll_interval=float(os.getenv("URL_REFRESH_POLL_SECONDS", "60"))
+            )
+        return _shared_ingesters[processor]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest and refresh web pages in the search index")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="track URLs and ingest them now")
+    add.add_argument("urls", nargs="*", help="URLs to ingest")
+    add.add_argument("--file", help="file with one URL per line")
+    add.add_argument("--category", default="web", help="category for the indexed documents")
+    commands.add_parser("refresh", help="re-check the tracked URLs that are due, once")
+    commands.add_parser("watch", help="keep re-checking tracked URLs as they fall due")
+    commands.add_parser("status", help="show tracked URL counts")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from document_processor import DocumentProcessor
+
+    load_dotenv()
+    ingester = get_url_ingester(DocumentProcessor())
+    try:
+        if args.command == "add":
+            urls = list(args.urls)
+            if args.file:
+                with open(args.file, encoding="utf-8") as url_file:
+                    urls.extend(line for line in url_file if line.strip() and not line.startswith("#"))
+            summary = ingester.ingest(urls, args.category)
+        elif args.command == "refresh":
+            summary = ingester.refresh()
+        elif args.command == "watch":
+            ingester.start()
+            print("🔄 Watching tracked URLs - press Ctrl+C to stop")
+            while True:
+                time.sleep(3600)
+        else:
+            summary = ingester.get_statistics()["tracked"]
+            print(f"🌐 Tracked URLs: {summary['by_status']} ({summary['due']} due)")
+            return
+    except KeyboardInterrupt:
+        print("\n⏹️  Stopped")
+        return
+    finally:
+        ingester.stop()
+
+    for result in summary["results"]:
+        if result["outcome"] == "failed":
+            print(f"  ❌ {result['url']}: {result['error']}")
+    print(f"\n🌐 {summary['total']} URLs in {summary['elapsed_seconds']}s: {summary['indexed']} indexed, "
+          f"{summary['not_modified']} not modified, {summary['unchanged']} unchanged, {summary['failed']} failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,17 +5,21 @@ FastAPI-based interface for demonstrating the Azure AI capabilities
 import os
 import json
 import logging
-from typing import List, Dict, Any, Optional
-from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+from datetime import datetime, timezone
 import asyncio
+import tempfile
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 # FastAPI and related imports
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import FastAPI, Form, HTTPException, Request
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
+from multipart.multipart import MultipartParser, parse_options_header
 import uvicorn
 
 # Load environment variables
@@ -25,27 +29,164 @@ load_dotenv()
 # Import our custom modules
 from knowledge_worker_agent import KnowledgeWorkerAgent
 from document_processor import DocumentProcessor
-from azure_search_service import AzureSearchService
+from service_container import get_service_container
+from execution_limits import Overloaded, get_execution_limits
+from job_queue import get_job_queue
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start the ingestion workers; on shutdown stop them and close the shared Azure clients and HTTP pools"""
+    jobs.start()
+    yield
+    jobs.stop()
+    limits.shutdown()
+    await agent.aclose()
+    await services.aclose()
+
 # FastAPI app
 app = FastAPI(
     title="Knowledge Worker Agent Demo",
     description="Azure AI-powered document analysis and question answering",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
-# Initialize services
-agent = KnowledgeWorkerAgent()
-doc_processor = DocumentProcessor()
-search_service = AzureSearchService()
+# Initialize services (clients are created lazily and shared between them)
+services = get_service_container()
+agent = KnowledgeWorkerAgent(services)
+doc_processor = DocumentProcessor(services)
+
+# Per-route concurrency limits; blocking work runs on each route's own worker pool
+limits = get_execution_limits()
+
+# Uploads and URLs are ingested by background workers; job state survives restarts
+jobs = get_job_queue(doc_processor)
 
 # Templates and static files
 templates = Jinja2Templates(directory="templates")
 
+# Uploads are streamed to disk as they arrive and rejected above the size limit
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(200 * 1024 * 1024)))
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR") or None
+
+def overloaded_response(exc: Overloaded) -> JSONResponse:
+    """503 with a Retry-After hint for a request shed by the execution limits"""
+    return JSONResponse(
+        status_code=503,
+        headers={"Retry-After": str(exc.retry_after)},
+        content={
+            "success": False,
+            "detail": str(exc),
+            "error": str(exc),
+            "route": exc.route,
+            "queue_depth": exc.queued,
+            "retry_after": exc.retry_after
+        }
+    )
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    """Reject oversized uploads, and uploads the server has no room for, before the body is parsed"""
+    if request.url.path == "/api/upload":
+        try:
+            limits["upload"].check()
+        except Overloaded as exc:
+            return overloaded_response(exc)
+        content_length = request.headers.get("content-length")
+        # Allow some room for the multipart envelope around the file
+        if content_length and content_length.isdigit() and int(content_length) > UPLOAD_MAX_BYTES + 64 * 1024:
+            return JSONResponse(
+                status_code=413,
+                content={"detail": f"File exceeds the {UPLOAD_MAX_BYTES} byte upload limit"}
+            )
+    return await call_next(request)
+
+def upload_too_large() -> HTTPException:
+    return HTTPException(status_code=413, detail=f"File exceeds the {UPLOAD_MAX_BYTES} byte upload limit")
+
+async def spool_upload(request: Request) -> Tuple[str, str, Dict[str, str]]:
+    """Stream a multipart upload to a temporary file and return (path, filename, form fields)
+    
+    The body is parsed as it arrives, so the file part is written to disk once
+    and the request fails as soon as it passes UPLOAD_MAX_BYTES, whether or not
+    the client sent a Content-Length.
+    """
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or not options.get(b"boundary"):
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data upload")
+    
+    fields: Dict[str, str] = {}
+    part: Dict[str, Any] = {}
+    upload: Dict[str, Any] = {"spool": None, "filename": None, "size": 0, "pending": []}
+    
+    def on_part_begin():
+        part.clear()
+        part.update(headers={}, header_field=b"", header_value=b"", value=[], is_file=False)
+    
+    def on_header_field(data, start, end):
+        part["header_field"] += data[start:end]
+    
+    def on_header_value(data, start, end):
+        part["header_value"] += data[start:end]
+    
+    def on_header_end():
+        part["headers"][part["header_field"].lower()] = part["header_value"]
+        part["header_field"] = part["header_value"] = b""
+    
+    def on_headers_finished():
+        _, disposition = parse_options_header(part["headers"].get(b"content-disposition", b""))
+        part["name"] = disposition.get(b"name", b"").decode("utf-8", "replace")
+        if part["name"] == "file" and b"filename" in disposition and upload["spool"] is None:
+            upload["filename"] = disposition[b"filename"].decode("utf-8", "replace")
+            suffix = os.path.splitext(upload["filename"])[1]
+            upload["spool"] = tempfile.NamedTemporaryFile(suffix=suffix, dir=UPLOAD_SPOOL_DIR, delete=False)
+            part["is_file"] = True
+    
+    def on_part_data(data, start, end):
+        # Every part counts towards the limit, so extra fields cannot bypass it
+        upload["size"] += end - start
+        if upload["size"] > UPLOAD_MAX_BYTES:
+            raise upload_too_large()
+        if part["is_file"]:
+            upload["pending"].append(data[start:end])
+        elif part.get("name"):
+            part["value"].append(data[start:end])
+    
+    def on_part_end():
+        if not part["is_file"] and part.get("name"):
+            fields[part["name"]] = b"".join(part["value"]).decode("utf-8", "replace")
+    
+    parser = MultipartParser(options[b"boundary"], {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end
+    })
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            if upload["pending"]:
+                data = b"".join(upload["pending"])
+                upload["pending"].clear()
+                await asyncio.to_thread(upload["spool"].write, data)
+        parser.finalize()
+        if upload["spool"] is None:
+            raise HTTPException(status_code=400, detail="No file in the upload")
+        upload["spool"].close()
+        return upload["spool"].name, upload["filename"], fields
+    except BaseException:
+        if upload["spool"] is not None:
+            upload["spool"].close()
+            os.unlink(upload["spool"].name)
+        raise
+
 # Pydantic models for API
 class ChatRequest(BaseModel):
     message: str
@@ -60,6 +201,8 @@ class ChatResponse(BaseModel):
 
 class DocumentUploadResponse(BaseModel):
     success: bool
+    job_id: Optional[str] = None
+    status: Optional[str] = None
     document_id: Optional[str] = None
     filename: str
     error: Optional[str] = None
@@ -67,6 +210,7 @@ class DocumentUploadResponse(BaseModel):
 class SearchRequest(BaseModel):
     query: str
     top_results: int = 5
+    use_cache: bool = True
 
 # API Routes
 @app.get("/", response_class=HTMLResponse)
@@ -78,8 +222,12 @@ async def home(request: Request):
 async def get_status():
     """Get the status of all Azure services"""
     try:
-        status = agent.get_agent_status()
+        status = await limits["status"].run(agent.get_agent_status)
+        status["execution_limits"] = limits.get_statistics()
+        status["job_queue"] = await limits["status"].call(jobs.get_statistics)
         return JSONResponse(content=status)
+    except Overloaded:
+        raise
     except Exception as e:
         logger.error(f"Error getting status: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -88,13 +236,16 @@ async def get_status():
 async def chat(request: ChatRequest):
     """Chat with the knowledge worker agent"""
     try:
-        result = agent.chat(
-            user_message=request.message,
-            conversation_history=request.conversation_history
-        )
+        async with limits["chat"].slot():
+            result = await agent.achat(
+                user_message=request.message,
+                conversation_history=request.conversation_history
+            )
         
         # Return the result directly as JSON since it already matches the expected format
         return JSONResponse(content=result)
+    except Overloaded:
+        raise
     except Exception as e:
         logger.error(f"Error in chat: {str(e)}")
         return JSONResponse(content={
@@ -105,63 +256,125 @@ async def chat(request: ChatRequest):
             "timestamp": datetime.now().isoformat()
         })
 
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """Chat with the knowledge worker agent, streaming tool-call events and answer tokens as Server-Sent Events"""
+    # Take the slot before responding so a saturated server answers 503 rather than an empty stream
+    release = await limits["chat"].acquire()
+    
+    async def event_stream():
+        try:
+            async for event in agent.achat_stream(
+                user_message=request.message,
+                conversation_history=request.conversation_history
+            ):
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            release()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        # Stop proxies from buffering the stream, which would defeat it
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Also releases the slot if the client disconnects before the stream starts
+        background=BackgroundTask(release)
+    )
+
 @app.post("/api/upload", response_model=DocumentUploadResponse)
-async def upload_document(
-    file: UploadFile = File(...),
-    category: str = Form("general")
-):
-    """Upload and process a document"""
+async def upload_document(request: Request):
+    """Upload a document (multipart "file" and optional "category") and queue it for processing
+    
+    Follow the job at /api/jobs/{job_id}.
+    """
+    file_path = None
+    filename = None
     try:
-        # Read file content
-        file_content = await file.read()
+        # Hold an upload slot while the file is spooled
+        async with limits["upload"].slot():
+            # Stream the body to disk so the raw file is never held in memory
+            file_path, filename, fields = await spool_upload(request)
+            
+            # The job store takes ownership of the spooled file
+            job = await asyncio.to_thread(jobs.submit_file, file_path, filename, fields.get("category", "general"))
+            file_path = None
         
-        # Process the document
-        result = doc_processor.process_file(
-            file_content=file_content,
-            filename=file.filename,
-            category=category
+        return DocumentUploadResponse(
+            success=True,
+            job_id=job["job_id"],
+            status=job["status"],
+            filename=filename
         )
-        
-        if result["success"]:
-            return DocumentUploadResponse(
-                success=True,
-                document_id=result["document_id"],
-                filename=file.filename
-            )
-        else:
-            return DocumentUploadResponse(
-                success=False,
-                filename=file.filename,
-                error=result["error"]
-            )
             
+    except (HTTPException, Overloaded):
+        raise
     except Exception as e:
         logger.error(f"Error uploading document: {str(e)}")
         return DocumentUploadResponse(
             success=False,
-            filename=file.filename if file else "unknown",
+            filename=filename or "unknown",
             error=str(e)
         )
+    finally:
+        if file_path:
+            os.unlink(file_path)
 
 @app.post("/api/url")
 async def process_url(url: str = Form(...), category: str = Form("web")):
-    """Process content from a URL"""
+    """Queue content from a URL for processing; follow it at /api/jobs/{job_id}"""
     try:
-        result = doc_processor.process_url(url=url, category=category)
-        return JSONResponse(content=result)
+        async with limits["url"].slot():
+            job = await asyncio.to_thread(jobs.submit_url, url, category)
+        return JSONResponse(content={"success": True, **job})
+    except Overloaded:
+        raise
     except Exception as e:
         logger.error(f"Error processing URL: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/jobs")
+async def list_jobs(limit: int = 20):
+    """List the most recent ingestion jobs"""
+    return JSONResponse(content=await asyncio.to_thread(jobs.list_jobs, min(max(limit, 1), 100)))
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Get an ingestion job's status, progress and result"""
+    job = await asyncio.to_thread(jobs.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    return JSONResponse(content=job)
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """Stream an ingestion job's progress as Server-Sent Events until it succeeds or fails"""
+    if await asyncio.to_thread(jobs.get, job_id) is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    
+    async def event_stream():
+        async for job in jobs.watch(job_id):
+            event = job["status"] if job["status"] in ("succeeded", "failed") else "progress"
+            yield f"event: {event}\ndata: {json.dumps(job)}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/api/search")
 async def search_documents(request: SearchRequest):
     """Search through indexed documents"""
     try:
-        result = agent.search_documents(
-            query=request.query,
-            top_results=request.top_results
-        )
+        async with limits["search"].slot():
+            result = await agent.asearch_documents(
+                query=request.query,
+                top_results=request.top_results,
+                use_cache=request.use_cache
+            )
         return JSONResponse(content=result)
+    except Overloaded:
+        raise
     except Exception as e:
         logger.error(f"Error searching documents: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -170,17 +383,24 @@ async def search_documents(request: SearchRequest):
 async def get_document_stats():
     """Get statistics about processed documents"""
     try:
-        stats = doc_processor.get_processing_statistics()
+        stats = await limits["status"].run(doc_processor.get_processing_statistics)
         return JSONResponse(content=stats)
+    except Overloaded:
+        raise
     except Exception as e:
         logger.error(f"Error getting document stats: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/limits")
+async def get_execution_limit_stats():
+    """Get per-route concurrency, queue depth and load-shedding counters"""
+    return JSONResponse(content=limits.get_statistics())
+
 @app.post("/api/setup")
 async def setup_search_index():
     """Initialize the search index (for demo setup)"""
     try:
-        success = search_service.create_search_index()
+        success = await services.async_search_service().create_search_index()
         return JSONResponse(content={
             "success": success,
             "message": "Search index created successfully" if success else "Failed to create search index"
@@ -195,14 +415,14 @@ async def health_check():
     """Health check endpoint for monitoring and container orchestration."""
     health_status = {
         "status": "healthy",
-        "timestamp": datetime.utcnow().isoformat(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
         "services": {}
     }
     
     # Check Azure OpenAI connectivity
     try:
         # Simple test call
-        test_response = await agent.chat("health check", max_tokens=5)
+        test_response = await agent.achat("health check")
         health_status["services"]["azure_openai"] = "healthy"
     except Exception as e:
         health_status["services"]["azure_openai"] = f"unhealthy: {str(e)}"
@@ -211,7 +431,7 @@ async def health_check():
     # Check Azure Search connectivity  
     try:
         # Test search service
-        await search_service.search("health", top=1)
+        await services.async_search_service().search_documents("health", top=1)
         health_status["services"]["azure_search"] = "healthy"
     except Exception as e:
         health_status["services"]["azure_search"] = f"unhealthy: {str(e)}"
@@ -222,6 +442,10 @@ async def health_check():
     return JSONResponse(content=health_status, status_code=status_code)
 
 # Error handlers
+@app.exception_handler(Overloaded)
+async def overloaded_exception_handler(request: Request, exc: Overloaded):
+    return overloaded_response(exc)
+
 @app.exception_handler(Exception)
 async def general_exception_handler(request: Request, exc: Exception):
     logger.error(f"Unhandled exception: {exc}")